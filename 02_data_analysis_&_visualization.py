@@ -10,290 +10,115 @@ import pandas as pd
 import warnings
 import matplotlib.pyplot as plt
 import seaborn as sns
+from IPython.display import display
+
+from canelection import charts, crosswalk, cube, instrument, projection, storage, systems, transitions
+from canelection.elections import ELECTIONS
 
 warnings.filterwarnings('ignore')
 
-# %% load data using csv files generated by part 1
+# %% instrumentation settings
+# wall & CPU time, peak memory (tracemalloc) & rows in / out of every stage are recorded when on (canelection/instrument.py)
+# off by default at near-zero cost; instrument.configure(enabled=True) or the ELECTIONS_TRACE=1 environment variable turns it on
+
+instrument.configure() # e.g. instrument.configure(enabled=True, memory=False)
+
+# %% load data using the datasheets generated by part 1
 # files are generated after running 01_data_collection.py under the same path
+# the typed columnar files are read memory-mapped, csv files are read if they are missing
+
+data_04 = storage.read_year('2004')
+data_06 = storage.read_year('2006')
+data_08 = storage.read_year('2008')
+data_11 = storage.read_year('2011')
+rd_dict = storage.read_ridings()
+
+# %% align all years on the EDs of the latest election
+# cross-year comparisons line EDs up by ED code, which holds within one representation order only
+# results of years held under an earlier representation order are transposed to "notional" results on the latest boundaries,
+# with the overlap weights under ./crosswalks (canelection/crosswalk.py); years under the latest order are left unchanged
+
+order = ELECTIONS[max(ELECTIONS)]['order']
 
-data_04 = pd.read_csv("./2004.csv")
-data_06 = pd.read_csv("./2006.csv")
-data_08 = pd.read_csv("./2008.csv")
-data_11 = pd.read_csv("./2011.csv")
-rd_dict = pd.read_csv("./ridings.csv").set_index('Code').to_dict()['2011 Ridings']
+data_04 = crosswalk.align(data_04, ELECTIONS['2004']['order'], order)
+data_06 = crosswalk.align(data_06, ELECTIONS['2006']['order'], order)
+data_08 = crosswalk.align(data_08, ELECTIONS['2008']['order'], order)
+data_11 = crosswalk.align(data_11, ELECTIONS['2011']['order'], order)
+
+# %% results cube
+# year x province x party votes & seats, aggregated once by part 1 (cube.npz, canelection/cube.py)
+# roll-ups are cached in the cube; it is rebuilt from the aligned datasheets when some years were transposed
+
+if all(election['order'] == order for election in ELECTIONS.values()):
+    results = cube.read_cube(sorted(ELECTIONS))
+else:
+    results = cube.ResultsCube.from_frames({'2004': data_04, '2006': data_06, '2008': data_08, '2011': data_11})
 
 # %% major party vote count by prov/terr dfs
 # created for each election year
 
-ptdt_04 = data_04.iloc[:, 1:].groupby(by='Province').sum()
-ptdt_06 = data_06.iloc[:, 1:].groupby(by='Province').sum()
-ptdt_08 = data_08.iloc[:, 1:].groupby(by='Province').sum()
-ptdt_11 = data_11.iloc[:, 1:].groupby(by='Province').sum()
+ptdt_04 = results.by_province('2004')
+ptdt_06 = results.by_province('2006')
+ptdt_08 = results.by_province('2008')
+ptdt_11 = results.by_province('2011')
 
 # %% 4 years party-prov/terr vote count sum up dataframe
 
 # summarizing counts
-can_total = pd.DataFrame(ptdt_04.sum().rename('2004'))
-can_total['2006'] = ptdt_06.sum()
-can_total['2008'] = ptdt_08.sum()
-can_total['2011'] = ptdt_11.sum()
-can_total = can_total.T
-can_total.index = can_total.index.rename('Year')
-can_total = can_total.reset_index()
+can_total = results.national().reset_index()
 
 # adding percentages
-can_total['LIB %'] = can_total['Liberal'] / can_total['Total Votes']
-can_total['CON %'] = can_total['Conservative'] / can_total['Total Votes']
-can_total['NDP %'] = can_total['NDP'] / can_total['Total Votes']
-can_total['BLQ %'] = can_total['BQ'] / can_total['Total Votes']
-can_total['OTH %'] = can_total['Others'] / can_total['Total Votes']
+can_total[['LIB %', 'CON %', 'NDP %', 'BLQ %', 'OTH %']] = results.shares()[storage.PARTIES].to_numpy()
 
 # %% visualizing the vote percentages grabbed by major parties
+# the charts of this part are drawn by the chart functions of the batch rendering (canelection/charts.py)
+# they return matplotlib figures, shown inline as the result of the cell, or with display() when a cell draws several
 
 parties = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
-pct_list = ['LIB %', 'CON %', 'NDP %', 'BLQ %', 'OTH %']
-colors = ['red', 'blue', 'orange', 'turquoise', 'grey']  # representative colors for parties (and "others")
-
-fig, ax1 = plt.subplots(figsize=(8, 9))
 
-annotate_list = []
-
-# line graph & shades
-for i in range(5):
-
-    ax1.plot(
-        can_total['Year'],
-        can_total[pct_list[i]],
-        label=parties[i],
-        color=colors[i]
-    )
-
-    ax1.fill_between(
-        can_total['Year'],
-        can_total[pct_list[i]],
-        label=None,
-        color=colors[i],
-        alpha=0.1,
-    )
-
-    for index, percent in zip(can_total.index, can_total[pct_list[i]]):
-        annotate_list.append((index, percent))
-
-# percentage notes
-for x, y in annotate_list:
-
-    ax1.annotate(
-        '{:.1%}'.format(y),
-        xy=(x, y),
-        xytext=(float(x), y+0.01),
-        ha="center",
-    )
-
-ax1.set_ylim(0, 0.5)
-plt.legend(loc=2)
-
-plt.vlines(
-    [0, 1, 2, 3],
-    0,
-    .5,
-    linestyles='dashed',
-    alpha=0.05,
-) # vertical lines
-
-plt.yticks(
-    ticks=np.arange(0, .6, .1),
-    labels=['{:.1%}'.format(p) for p in np.arange(0, .6, .1)],
-)
-plt.show()
+charts.share_lines(results.national(), 'Vote Percentages of Major Parties')
 
 # %% count of seats won by parties dataframe
 
-elected_df = pd.DataFrame(
-    [
-        data_04['Elected'].value_counts().rename('2004'),
-        data_06['Elected'].value_counts().rename('2006'),
-        data_08['Elected'].value_counts().rename('2008'),
-        data_11['Elected'].value_counts().rename('2011')
-    ],
-)[parties]
+elected_df = results.seat_counts()[parties]
 
 # %% count of seats won by parties each year visualization
 
-fig, ax2 = plt.subplots(figsize=(7, 8))
-
-# plot stacked bars
-plt.bar(elected_df.index, elected_df[parties[0]], color=colors[0], width=0.5)
-
-for i in range(5):
-
-    plt.bar(
-        elected_df.index, elected_df[parties[i]],
-        bottom=elected_df.iloc[:,:i].sum(axis=1),
-        color=colors[i],
-        width=0.5,
-    )
-
-# annotate the counts
-for i in range(4):
-    for j in range(4):
-        if i==3 and j==3: # special case for BQ in 2011
-            ax2.annotate(
-                4,
-                xy = (3, 305),
-                xytext = (3, 300),
-                ha="center",
-                color="white",
-                fontsize="medium",
-            )
-        else:
-            ax2.annotate(
-                elected_df.iloc[i, j],
-                xy = (i, (elected_df.iloc[:,:j].sum(axis=1) + elected_df.iloc[:,:j+1].sum(axis=1)).tolist()[i] / 2),
-                ha="center",
-                color="white",
-                fontsize="medium",
-            )
-
-ax2.set_ylim(0, 308) # ylim
-
-plt.xlabel('Year')
-plt.ylabel('Seat Count')
-plt.yticks(range(0, 310, 77)) # set yticks
-plt.show()
+charts.seat_bars(elected_df, 'Seat Count by Year')
 
 # %% vote count plotting by year and prov/terr, bar chart
 # this chart is good for general comparison yet unclear for prov/terr with small populations
 
 ptdt_list = [ptdt_04, ptdt_06, ptdt_08, ptdt_11]
-prov_list = [
-    'BC',
-    'AB',
-    'SK',
-    'MB',
-    'ON',
-    'QC',
-    'NB',
-    'PE',
-    'NS',
-    'NL',
-    'Territories',
-] # rearrange prov/terr by geographical locations
-year_list = ['2004', '2006', '2008', '2010']
-
-fig, axes = plt.subplots(nrows=4, ncols=1, figsize=(14, 20))
-
-plt.setp(axes, ylim=[0, 2700000])
+year_list = ['2004', '2006', '2008', '2011']
 
-for i in range(4):
+province_figures = [
+    charts.province_bars(ptdt, f'{year} Canadian General Election Vote Distribution by Provinces / Territories')
+    for year, ptdt in zip(year_list, ptdt_list)
+]
 
-    ptdt_list[i][parties].loc[prov_list].plot.bar(color=colors, ax=axes[i])
-    axes[i].set_xticklabels(prov_list, rotation=0)
-
-    axes[i].set_title(f"{year_list[i]} Canadian General Election Vote Distribution by Provinces / Territories")
+for fig in province_figures:
+    display(fig)
 
 # %% 2004 party vote counts & percentages by prov/terr, pie chart
 # shows situation with each prov/terr much clearer
 # prototype of such type of graph. Only repeated for 2 election years in the original report for not overloading it
 # can be repeated for the other 2 election years as a matter of fact
 
-fig, axes = plt.subplots(nrows=3, ncols=4, figsize=(20, 15))
-
-parties_nonBQ = ['Liberal', 'Conservative', 'NDP', 'Others']
-colors_nonBQ = ['red', 'blue', 'orange', 'grey']
-
-# a pie for each prov / all terr
-for i in range(11):
-
-    if i == 5: # Bloc runs in Quebec
-        partylist = parties
-        clist = colors
-    else: # Bloc not running in other prov/terr
-        partylist = parties_nonBQ
-        clist = colors_nonBQ
-
-    vote_counts = ptdt_04.loc[prov_list[i]][partylist].tolist()
-    total = ptdt_04['Total Votes'].loc[prov_list[i]]
-
-    # pie & labeling
-    axes[i//4, i%4].pie(
-        vote_counts,
-        colors=clist,
-        labels=[f'{partylist[j]}\n{int(vote_counts[j])} - '+'{:.1%}'.format(vote_counts[j]/total)\
-                for j in range(len(vote_counts))],
-        labeldistance=0.8,
-        startangle=-5,
-        radius=np.log10(np.cbrt(total/2000)),
-    )
-
-    # subplot title
-    axes[i//4, i%4].set_title(f'{prov_list[i]} - {total} votes total')
-
-fig.suptitle('2004 Canadian General Election Vote Counts and Distributions by Provinces / Territories')
-plt.axis('off') # hide the axis of unused 12th subplot
-plt.show()
+charts.province_pies(ptdt_04, '2004 Canadian General Election Vote Counts and Distributions by Provinces / Territories')
 
 # %% 2011 party vote counts & percentages by prov/terr, pie chart
 # same prototype with 2004 charting
-# only repeated for 2 election years in the original report for not overloading it
-# can be repeated for the other 2 election years as a matter of fact
-
-fig, axes = plt.subplots(nrows=3, ncols=4, figsize=(20, 15))
-
-for i in range(11):
 
-    if i == 5:
-        partylist = parties
-        clist = colors
-    else:
-        partylist = parties_nonBQ
-        clist = colors_nonBQ
-
-    vote_counts = ptdt_11.loc[prov_list[i]][partylist].tolist()
-    total = ptdt_11['Total Votes'].loc[prov_list[i]]
-
-    axes[i//4, i%4].pie(
-        vote_counts,
-        colors=clist,
-        labels=[f'{partylist[j]}\n{int(vote_counts[j])} - '+'{:.1%}'.format(vote_counts[j]/total)\
-                for j in range(len(vote_counts))],
-        labeldistance=0.79,
-        startangle=10,
-        radius=np.log10(np.cbrt(total/2000)),
-    )
-    axes[i//4, i%4].set_title(f'{prov_list[i]} - {total} votes total')
-
-fig.suptitle('2011 Canadian General Election Vote Counts and Distributions by Provinces / Territories')
-plt.axis('off')
-plt.show()
+charts.province_pies(ptdt_11, '2011 Canadian General Election Vote Counts and Distributions by Provinces / Territories')
 
 # %% parties gaining / losing EDs count visualization
 
-elected_sum = pd.DataFrame(
-    [elected_df.iloc[i] - elected_df.iloc[i-1] for i in range(1, 4)],
-    index=['04 to 06', '06 to 08', '08 to 11'],
-)
-
-fig, ax = plt.subplots(figsize=(4, 7))
-
-ax.set_ylim((-70, 70))
-ax.set_yticklabels(["-80", "-60", "-40", "-20", "0", "+20", "+40", "+60"])
-
-elected_sum.plot.bar(color=colors, ax=ax)
-
-ax.hlines(0, -1, 4)
-ax.hlines(
-    [20, 40, 60, -20, -40, -60],
-    -1,
-    5,
-    linestyles='dashed',
-    alpha=0.1
-)
-
-plt.show()
+charts.gain_loss_bars(elected_df, 'Seat Gains & Losses')
 
 # %% EDs by winning parties and election years summarizing dataframe
-
-rd_data = data_04[['District', 'Province']]
+# winners are held in a ridings x elections int8 matrix (canelection/transitions.py), lined up by ED code
+# hold / flip flags & per-ED counts are computed over the matrix, text labels only for the tables shown
 
 party_dict = {
     'Liberal': 'LIB',
@@ -303,41 +128,22 @@ party_dict = {
     'Others': 'OTH'
 } # 3 letter abbreviations for all parties (and "others")
 
-rd_data['04 Elected'] = data_04['Elected'].map(party_dict)
-rd_data['06 Elected'] = data_06['Elected'].map(party_dict)
-rd_data['08 Elected'] = data_08['Elected'].map(party_dict)
-rd_data['11 Elected'] = data_11['Elected'].map(party_dict)
-
-# %% adding ED gaining or flipping data
-
-chg_0406 = []
-chg_0608 = []
-chg_0811 = []
-
-for i in range(len(rd_data)):
-
-    if rd_data['06 Elected'].iloc[i] == rd_data['04 Elected'].iloc[i]:
-        chg_0406.append(rd_data['06 Elected'].iloc[i] + " holds")
-    else:
-        chg_0406.append(rd_data['04 Elected'].iloc[i] + " flip to " + rd_data['06 Elected'].iloc[i])
+# parties are listed in alphabetical order, as the pivot tables of the original report
+years = ['04', '06', '08', '11']
+party_codes = sorted(party_dict.values())
 
-for j in range(len(rd_data)):
-
-    if rd_data['08 Elected'].iloc[j] == rd_data['06 Elected'].iloc[j]:
-        chg_0608.append(rd_data['08 Elected'].iloc[j] + " holds")
-    else:
-        chg_0608.append(rd_data['06 Elected'].iloc[j] + " flip to " + rd_data['08 Elected'].iloc[j])
+winner_matrix = transitions.WinnerMatrix.from_frames(
+    {'04': data_04, '06': data_06, '08': data_08, '11': data_11},
+    party_codes,
+    mapping=party_dict,
+)
 
-for k in range(len(rd_data)):
+rd_data = data_04[['District', 'Province']].join(winner_matrix.decode(), on='District')
 
-    if rd_data['11 Elected'].iloc[k] == rd_data['08 Elected'].iloc[k]:
-        chg_0811.append(rd_data['11 Elected'].iloc[k] + " holds")
-    else:
-        chg_0811.append(rd_data['08 Elected'].iloc[k] + " flip to " + rd_data['11 Elected'].iloc[k])
+# %% adding ED gaining or flipping data
 
-rd_data['04 to 06'] = chg_0406
-rd_data['06 to 08'] = chg_0608
-rd_data['08 to 11'] = chg_0811
+for year_a, year_b in zip(years[:-1], years[1:]):
+    rd_data[f'{year_a} to {year_b}'] = rd_data['District'].map(winner_matrix.change_labels(year_a, year_b))
 
 rd_data # examine the result
 
@@ -425,78 +231,45 @@ hd_0811[hd_0811['Province'].isin(['PE', 'SK', 'AB'])]
 # %% inter-election gains and flips - heatmap - prepare pivot table
 # use heatmap to sum up all loss and gains of seats for major parties
 
-# pivoting functions
-def making_pivot(yA,yB):
-
-    count = []
-
-    for pa in list(party_dict.values()):
-        for pb in list(party_dict.values()):
-            count.append([
-                pa,
-                pb,
-                len(rd_data[rd_data[f'{yA} Elected']==pa].loc[rd_data[f'{yB} Elected'] == pb])
-            ])
-
-    df = pd.DataFrame(count)
-    df.columns = [f'{yA} Elected', f'{yB} Elected', 'Count']
-    df = df.pivot_table(
-        values='Count',
-        index=f'{yA} Elected',
-        columns=f'{yB} Elected',
-        aggfunc=np.mean
-    )
+# one bincount over the winner matrix gives the tables of all election pairs
+transition_tables = winner_matrix.transitions()
 
-    return df
+# tables for all three inter-election instances
+count_0406 = transition_tables['04', '06']
+count_0608 = transition_tables['06', '08']
+count_0811 = transition_tables['08', '11']
 
-# make pivot tables for all three inter-election instances
-count_0406 = making_pivot('04', '06')
-count_0608 = making_pivot('06', '08')
-count_0811 = making_pivot('08', '11')
+# %% inter-election gains and flips by prov/terr
+# the same tables with provinces as an extra axis, e.g. the 2008 to 2011 transitions of Ontario
 
-# %% inter-election gains and flips - heatmap illustration
+pt_tables = winner_matrix.transitions(groups=data_04.set_index('District')['Province'].reindex(winner_matrix.districts))
 
-fig, ax = plt.subplots(nrows=1, ncols=3, figsize=(18, 6))
+pt_tables['08', '11'].loc['ON']
 
-pivot_list = [count_0406, count_0608, count_0811]
+# %% inter-election gains and flips - heatmap illustration
 
-for i in range(3):
-    sns.heatmap(
-        pivot_list[i],
-        ax = ax[i],
-        cmap='PuOr',
-        annot=True,
-        fmt='g',
-        square=True,
-    )
+heatmaps = [
+    charts.transition_heatmap(table, f'Gains & Losses {year_a} to {year_b}')
+    for (year_a, year_b), table in [(('04', '06'), count_0406), (('06', '08'), count_0608), (('08', '11'), count_0811)]
+]
 
-fig.suptitle("Gains & Losses Count of Major Parties, 2006, 2008 & 2011 Elections")
-plt.show()
+for fig in heatmaps:
+    display(fig)
 
 # %% Count the hold/flip figures for each ED
 # for each ED, counts:
 # - accumulated number of different parties (including "others") elected in that ED
 # - accumulated times of getting flipped
+# - longest streak of elections held by the same party
 
-pt_count=[]
-fp_count = []
+ed_metrics = winner_matrix.metrics()
 
-for i in range(len(rd_data)):
+rd_data['Party Count'] = rd_data['District'].map(ed_metrics['Party Count'])
+rd_data['Flip Count'] = rd_data['District'].map(ed_metrics['Flip Count'])
 
-    pt_count.append(len(
-        rd_data[['04 Elected', '06 Elected', '08 Elected', '11 Elected']].iloc[i].unique()
-    ))
+# %% EDs held by the same party in all elections
 
-    count = 0
-
-    for j in range(3):
-        if 'flip' in rd_data.iloc[i, -j-1]:
-            count += 1
-
-    fp_count.append(count)
-
-rd_data['Party Count'] = pt_count
-rd_data['Flip Count'] = fp_count
+ed_metrics[ed_metrics['Longest Hold'] == len(years)].index.map(rd_dict)
 
 # %% most flipped EDs between 2004 and 2011
 
@@ -517,4 +290,60 @@ rd_data.loc[rd_data['Party Count'] == 3].replace('BLQ', np.nan).replace('OTH', n
 # %% names of EDs that has supported all of the 3 major parties
 
 rd_data.loc[rd_data['Party Count'] == 3].replace('BLQ', np.nan).replace('OTH', np.nan).dropna()['District'].map(rd_dict)
+
+# %% electoral system counterfactuals
+# seats of every prov/terr re-allocated from its vote totals (canelection/systems.py):
+# list PR (D'Hondt / Sainte-Laguë) with vote thresholds, MMP with a share of top-up list seats (Topup 0: actual results)
+# a whole grid of configurations is evaluated in one call, with the Gallagher & Loosemore-Hanby disproportionality indices
+
+system_grid = systems.grid(
+    method=['dhondt', 'sainte-lague'],
+    threshold=np.arange(0, 0.105, 0.01),
+    topup=np.arange(0, 1.01, 0.1),
+    threshold_level=['province', 'national'],
+)
+alternatives = systems.counterfactuals(results, system_grid)
+
+alternatives.national().xs(('2011', 0.0, 'province'), level=['Year', 'Threshold', 'Threshold Level'])
+
+# %% disproportionality by top-up share, 2011, no threshold
+
+alternatives.indices().xs(('2011', 0.0, 'province'), level=['Year', 'Threshold', 'Threshold Level']).unstack('Method')
+
+# %% seat projection from the 2011 riding results
+# Monte Carlo scenarios of national & provincial swings (in vote share points) on the 2011 baseline (canelection/projection.py)
+# seat count distributions & per-ED win probabilities; e.g. mean={'Liberal': 0.03, 'Conservative': -0.03} for a swing scenario
+
+seat_projection = projection.project(data_11, n=1_000_000, national_sd=0.02, provincial_sd=0.01, seed=2011)
+
+seat_projection.summary()
+
+# %% EDs closest to flipping under the projection
+
+win_probability = seat_projection.win_probability()
+win_probability[win_probability.max(axis=1) < 0.75].rename(index=rd_dict)
+
+# %% batch rendering of all charts
+# every chart for every year & prov/terr, rendered headless (Agg) across a process pool into ./charts (canelection/charts.py)
+# charts whose data did not change since the last run are skipped
+# off when the script runs as a whole (about 80 charts); set render_charts = True, or run canelection render instead
+
+render_charts = False
+
+if render_charts:
+    chart_jobs = charts.build_jobs(
+        results,
+        winner_matrix,
+        provinces=data_04.set_index('District')['Province'].reindex(winner_matrix.districts),
+    )
+    render_report = charts.render_all(chart_jobs, directory='./charts', formats=('png', 'svg'))
+
+    print(f"{render_report['rendered']} charts rendered, {render_report['skipped']} unchanged, {render_report['seconds']:.1f} s")
+
+# %% stage timings
+# Chrome trace of the stages (open in chrome://tracing or ui.perfetto.dev) & a summary table by stage, when instrumentation is on
+
+if instrument.settings['enabled']:
+    print(instrument.report('trace_part2.json').to_string())
+
 # %%
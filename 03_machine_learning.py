@@ -11,61 +11,84 @@ import warnings
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from canelection import clustering, crosswalk, features, instrument, storage
+from canelection.elections import ELECTIONS
+
 warnings.filterwarnings('ignore')
 
-# %% load data using csv files generated by part 1
+# %% instrumentation settings
+# wall & CPU time, peak memory (tracemalloc) & rows in / out of every stage are recorded when on (canelection/instrument.py)
+# off by default at near-zero cost; instrument.configure(enabled=True) or the ELECTIONS_TRACE=1 environment variable turns it on
+
+instrument.configure() # e.g. instrument.configure(enabled=True, memory=False)
+
+# %% load data using the datasheets generated by part 1
 # files are generated after running 01_data_collection.py under the same path
+# the typed columnar files are read memory-mapped, loading only the columns used for the model
+# all party columns are kept, as notional winners of transposed years are decided among all parties
+
+cols = ['District', 'Province', 'Total Voters', 'Liberal', 'Conservative', 'NDP', 'BQ', 'Others', 'Total Votes', 'Elected']
 
-data_04 = pd.read_csv("./2004.csv")
-data_06 = pd.read_csv("./2006.csv")
-data_08 = pd.read_csv("./2008.csv")
-data_11 = pd.read_csv("./2011.csv")
-rd_dict = pd.read_csv("./ridings.csv").set_index('Code').to_dict()['2011 Ridings']
+data_04 = storage.read_year('2004', columns=cols)
+data_06 = storage.read_year('2006', columns=cols)
+data_08 = storage.read_year('2008', columns=cols)
+data_11 = storage.read_year('2011', columns=cols)
+rd_dict = storage.read_ridings()
+
+# %% align all years on the EDs of the latest election
+# cross-year comparisons line EDs up by ED code, which holds within one representation order only
+# results of years held under an earlier representation order are transposed to "notional" results on the latest boundaries,
+# with the overlap weights under ./crosswalks (canelection/crosswalk.py); years under the latest order are left unchanged
+
+order = ELECTIONS[max(ELECTIONS)]['order']
+
+data_04 = crosswalk.align(data_04, ELECTIONS['2004']['order'], order)
+data_06 = crosswalk.align(data_06, ELECTIONS['2006']['order'], order)
+data_08 = crosswalk.align(data_08, ELECTIONS['2008']['order'], order)
+data_11 = crosswalk.align(data_11, ELECTIONS['2011']['order'], order)
 
 # %% prepare Ontario data as machine learning dataset
 # Ontario has 106 EDs between 2004-2011, the most of all prov/terr
 # only province that has a ED count that might be meaningful for machine learning model
 # usage of ML here is for pure demostration. From my point of view, ML & prediction does not fit the theme of election analysis best, as a matter of fact
 
-dt_on = data_08[data_08['Province']=='ON']
+# features of every base year / target year pair are materialised once under ./features (canelection/features.py)
+# base year support rates, turnout & winner as features, target year conservative support rate as target, joined on ED code
+# a pair is only rebuilt when the datasheets of either year change, & loaded memory-mapped afterwards
 
-dt_on['Turnout'] = dt_on['Total Votes'] / dt_on['Total Voters'] * 100
-dt_on['08_support'] = dt_on['Conservative'] / dt_on['Total Votes'] * 100
-dt_on['08_LIB'] = dt_on['Liberal'] / dt_on['Total Votes'] * 100
-dt_on['08_NDP'] = dt_on['NDP'] / dt_on['Total Votes'] * 100
-dt_on['08_Elected'] = dt_on['Elected'].map({'Conservative': 0, 'Liberal': 1, 'NDP': 2})
+features.build({'2004': data_04, '2006': data_06, '2008': data_08, '2011': data_11})
 
 # set 2011 conservative party support rate in all EDs as target
 # being the only right wing leaning major party, conservative support rate is least affected by minor factors
-dt_on['Target'] = data_11[data_11['Province']=='ON']['Conservative'] /\
-                  data_11[data_11['Province']=='ON']['Total Votes'] * 100
-
-dt_on = dt_on[['District', 'Turnout', '08_Elected', '08_support', '08_LIB', '08_NDP', 'Target']].reset_index(drop=True)
+fs_11 = features.load('2008', '2011')
+dt_on = fs_11.frame('ON')
 
 dt_on
 
 # %% Clustering the "types" of EDs with clustering ML model
 # EDs normally has typical patterns of supporting major parties, based on the sociodemograpical conditions
+# seeded Mini-Batch KMeans on the party vote shares of the EDs, for every prov/terr & election year (canelection/clustering.py)
+# cluster tags are matched across years by their centroids, so a tag means the same type of ED in every year
+# fitted models & tags are kept in the stage cache, re-runs load them instead of fitting again
 
-from sklearn.cluster import KMeans
+riding_types, cluster_models = clustering.cluster_all(
+    {'2004': data_04, '2006': data_06, '2008': data_08, '2011': data_11},
+    k=3,
+    seed=308,
+)
 
-x = dt_on.iloc[:, 2:-1] # use major party support rates as x set
+# %% silhouette scores of k for Ontario 2008
+# subsequent runs with ks=range(2, 9) pick the best k of every prov/terr this way
 
-km = KMeans(n_clusters=3) # KMeans clusters model
-cls = km.fit_predict(x)
-cls
+clustering.silhouette_sweep(clustering.shares(data_08[data_08['Province']=='ON']), ks=range(2, 9), seed=308)
 
-# %% to ensure the results could be repeated, use tags generated on the first run of the model
-# subsequent run of models shows that the clusters remains roughly the same, with only variations in tags (order of 0, 1, 2), however
+# %% add cluster tag of the base year to the data
 
-cls = [0, 1, 2, 2, 1, 0, 0, 0, 2, 2, 2, 2, 2, 2, 1, 0, 0, 2, 0, 2, 2, 0,
-       0, 0, 2, 2, 0, 2, 2, 2, 1, 1, 1, 2, 2, 0, 0, 2, 0, 2, 2, 1, 0, 0,
-       0, 2, 0, 0, 0, 0, 0, 2, 2, 2, 2, 1, 0, 2, 0, 2, 1, 1, 2, 0, 0, 2,
-       2, 1, 2, 2, 2, 0, 2, 2, 0, 2, 0, 2, 1, 0, 0, 0, 0, 0, 2, 2, 2, 1,
-       2, 1, 1, 1, 0, 1, 1, 0, 1, 2, 2, 0, 1, 1, 0, 2, 0, 0]
+def riding_type(year):
 
-# add cluster tag to the data
-dt_on['Riding_type'] = cls
+    return riding_types[riding_types['Year']==year].set_index('District')['Riding_type']
+
+dt_on['Riding_type'] = dt_on['District'].map(riding_type('2008'))
 dt_on = dt_on[['District', 'Riding_type', 'Turnout', '08_Elected', '08_support', '08_LIB', '08_NDP', 'Target']]
 dt_on
 
@@ -97,43 +120,29 @@ y_train = dt_on[dt_on['District'].isin(train_rd)].iloc[:, -1]
 x_test = dt_on[dt_on['District'].isin(test_rd)].iloc[:, :-1]
 y_test = dt_on[dt_on['District'].isin(test_rd)].iloc[:, -1]
 
-# %% train a polynomial regression model
-# test for best i is added here as a new feature compared to the original report
+# %% cross-validated search of the polynomial regression model
+# stratified 5-fold on the riding types of the training set, over degree 1-6 & ordinary / ridge / lasso regression (canelection/modelsearch.py)
+# polynomial features & scaling are fitted on the training folds only, the (fold, degree) tasks run in parallel
+# the ED code is an identifier, not a feature
 
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error
 
-mses = dict()
-
-for i in range(1, 7): # test for best i
-    poly_features = PolynomialFeatures(degree=i, include_bias=False)
-    x_train_poly = poly_features.fit_transform(x_train)
-    x_test_poly = poly_features.fit_transform(x_test)
-
-    model = LinearRegression()
-    model.fit(x_train_poly, y_train)
-
-    y_pred = model.predict(x_test_poly)
+from canelection import modelsearch
 
-    mses[i]=mean_squared_error(y_test, y_pred)
+search_results, model = modelsearch.search(
+    x_train.drop(columns='District'), y_train, x_train['Riding_type'], seed=308, n_jobs=-1,
+)
 
-print(mses) # mean squared error for tested is
-plt.plot(list(mses.keys()), list(mses.values())) # plotting mean squared errors paired with is
+print(search_results.head(10)) # best configurations by mean cross-validated mse
 
-# %% train model with the best i selected
-# test shows that the best i is actually 1
-
-poly_features = PolynomialFeatures(degree=1, include_bias=False)
-x_train_poly = poly_features.fit_transform(x_train)
-x_test_poly = poly_features.fit_transform(x_test)
-
-model = LinearRegression()
-model.fit(x_train_poly, y_train)
+# mean squared errors by degree, best alpha of each model
+sns.lineplot(data=search_results.groupby(['Model', 'Degree'], as_index=False)['MSE'].min(), x='Degree', y='MSE', hue='Model')
+plt.yscale('log')
+plt.show()
 
-y_pred = model.predict(x_test_poly)
+# %% test the best configuration, refitted on the whole training set
 
-mse_list.append(mean_squared_error(y_test, y_pred))
+y_pred = model.predict(x_test.drop(columns='District').to_numpy(dtype=float))
 
 print(f'Mean squared error: {mean_squared_error(y_test, y_pred)}') # 输出均方差
 
@@ -145,20 +154,10 @@ plt.show()
 
 # %% prepare 2008 data set to test on the model trained with 2011 data
 
-dt_on_08 = data_06[data_06['Province']=='ON']
+fs_08 = features.load('2006', '2008')
+dt_on_08 = fs_08.frame('ON')
 
-dt_on_08['Turnout'] = dt_on_08['Total Votes'] / dt_on_08['Total Voters'] * 100
-dt_on_08['06_support'] = dt_on_08['Conservative'] / dt_on_08['Total Votes'] * 100
-dt_on_08['06_LIB'] = dt_on_08['Liberal'] / dt_on_08['Total Votes'] * 100
-dt_on_08['06_NDP'] = dt_on_08['NDP'] / dt_on_08['Total Votes'] * 100
-dt_on_08['06_Elected'] = dt_on_08['Elected'].map({'Conservative': 0, 'Liberal': 1, 'NDP': 2})
-
-dt_on_08['Target'] = data_08[data_08['Province']=='ON']['Conservative'] /\
-                  data_08[data_08['Province']=='ON']['Total Votes'] * 100
-
-dt_on_08 = dt_on_08.reset_index(drop=True)
-
-dt_on_08['Riding_type'] = cls
+dt_on_08['Riding_type'] = dt_on_08['District'].map(riding_type('2006'))
 
 dt_on_08 = dt_on_08[['District', 'Riding_type', 'Turnout', '06_Elected', '06_support', '06_LIB', '06_NDP', 'Target']]
 
@@ -169,16 +168,50 @@ dt_on_08
 x_08 = dt_on_08.iloc[:, :-1]
 y_08 = dt_on_08.iloc[:, -1]
 
-x_08_poly = poly_features.fit_transform(x_08)
+y_08_pred = model.predict(x_08.drop(columns='District').to_numpy(dtype=float))
 
-print(f'Mean squared error: {mean_squared_error(y_08, model.predict(x_08_poly))}')
+print(f'Mean squared error: {mean_squared_error(y_08, y_08_pred)}')
 
 plt.plot(y_08.reset_index(drop=True))
-plt.plot(model.predict(x_08_poly))
+plt.plot(y_08_pred)
 plt.show()
 
 # the results shows that 2011-data-trained model is actually more accurate for predicting 2008 result (!?)
 # however, considering the nature of election, it may be deducted that the factors determining conservative supports are roughly the same in 2008 and 2011
 # which is not a result applicable to all election years. 2015 is a notable exception, for instance
 
+# %% search every prov/terr at once
+# same search on the 2008 -> 2011 data of each prov/terr, all (prov/terr, fold, degree) tasks share one pool
+# prov/terr with too few EDs for 2 folds (territories) are left out
+# the rows of a prov/terr are slices of the memory-mapped feature store, no frame is built
+# riding types are one-hot encoded (features.design), as in the batch evaluation below
+
+n_types = int(riding_types['Riding_type'].max()) + 1
+datasets = dict()
+
+for pt in fs_11.provinces:
+    district, x, y = fs_11.arrays(pt)
+    rd_type = riding_type('2008').reindex(district).to_numpy()
+    datasets[pt] = (features.design(x, rd_type, n_types), y, rd_type)
+
+pt_results, pt_models = modelsearch.search_all(datasets, seed=308, n_jobs=-1)
+
+pt_results[pt_results['Rank']==1]
+
+# %% nationwide batch training & cross-year evaluation
+# one pooled model over all EDs (with province & riding type encodings) & one model per prov/terr, for every base / target year pair
+# every model is evaluated on every pair (canelection/batch.py), same as python -m canelection.batch
+
+from canelection import batch
+
+batch_mse, batch_predictions = batch.run(riding_types, ['2004', '2006', '2008', '2011'], n_jobs=-1)
+
+batch_mse
+
+# %% stage timings
+# Chrome trace of the stages (open in chrome://tracing or ui.perfetto.dev) & a summary table by stage, when instrumentation is on
+
+if instrument.settings['enabled']:
+    print(instrument.report('trace_part3.json').to_string())
+
 # %%
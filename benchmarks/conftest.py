@@ -0,0 +1,56 @@
+# benchmark suite of the hot paths of parts 1-3, on synthetic elections (benchmarks/synthetic.py)
+# every benchmark runs at each scale of BENCH_SCALES (riding & candidate counts x the real ones), default 1, 10 & 100;
+# 1000 is opt-in, it writes about 1 GB of pages
+# synthetic data of a scale is generated once & kept in the pytest cache
+#
+#   python -m pytest benchmarks --benchmark-group-by=group,param:scale
+#   BENCH_SCALES=1,10,100,1000 python -m pytest benchmarks --benchmark-autosave
+#   python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:25%   (regression check against the last saved run)
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic # noqa: E402
+
+SCALES = [int(scale) for scale in os.environ.get('BENCH_SCALES', '1,10,100').split(',')]
+
+
+@pytest.fixture(scope='session', params=SCALES, ids=lambda scale: f'{scale}x')
+def scale(request):
+
+    return request.param
+
+
+# directory, urls & ED names of the synthetic elections of a scale
+
+@pytest.fixture(scope='session')
+def synthetic_data(request, scale):
+
+    directory = str(request.config.cache.mkdir(f'synthetic_{scale}x'))
+
+    if not os.path.exists(os.path.join(directory, f'{synthetic.YEARS[-1]}.csv')):
+        synthetic.write(directory, scale)
+
+    rd = synthetic.ridings(scale)
+
+    return {
+        'directory': directory,
+        'archive': os.path.join(directory, 'page_archive'),
+        'urls': {year: synthetic.urls(year, scale) for year in synthetic.YEARS},
+        'ridings': rd,
+    }
+
+
+@pytest.fixture(scope='session')
+def frames(synthetic_data):
+
+    from canelection import storage
+
+    return {
+        year: storage.read_feather(year, directory=synthetic_data['directory'])
+        for year in synthetic.YEARS
+    }
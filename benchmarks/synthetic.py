@@ -0,0 +1,218 @@
+# synthetic elections for the benchmarks, at a multiple of the real riding & candidate counts
+# scale 1 is the 308 EDs of 2004-2011 with their real split over the prov/terr, scale 10 is 3 080 EDs, etc.
+# every ED has the major party candidates (BQ in Quebec only) & 0-4 minor candidates; support drifts between years,
+# so winners flip as they do in the real elections
+# for every year the generator emits:
+# - Table 12 (candidates) & Table 11 (voters & ballots) pages in the layout of Elections Canada, recorded in a page archive
+# - the yearly datasheet as part 1 writes it (<year>.csv) & the ED code / ED name reference sheet (ridings.csv)
+# ED codes keep the province prefix in front (prefix x 10^6 + number), as real 5-digit codes cannot hold 1 000x EDs
+#
+# python benchmarks/synthetic.py --scale 10 --directory ./synthetic_10
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from canelection import archive, storage # noqa: E402
+
+RIDINGS = {'NL': 7, 'PE': 4, 'NS': 11, 'NB': 10, 'QC': 75, 'ON': 106, 'MB': 14, 'SK': 14, 'AB': 28, 'BC': 36, 'Territories': 3}
+PREFIXES = {'NL': 10, 'PE': 11, 'NS': 12, 'NB': 13, 'QC': 24, 'ON': 35, 'MB': 46, 'SK': 47, 'AB': 48, 'BC': 59, 'Territories': 60}
+YEARS = ['2004', '2006', '2008', '2011']
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ']
+AFFILIATIONS = ['Liberal', 'Conservative', 'N.D.P.', 'Bloc Québécois']
+MINORS = ['Green Party', 'Independent', 'Christian Heritage Party', 'Marxist-Leninist']
+SUPPORT = np.array([4.0, 4.0, 2.0, 3.0]) # Dirichlet weights of the major parties
+
+
+def urls(year, scale):
+
+    root = f'https://synthetic.invalid/{scale}x/{year}'
+
+    return {'table12': f'{root}/table12.html', 'table11': f'{root}/table11.html'}
+
+
+# District, Province & ED name of every ED; the first ED is named Avalon, the text the table parsers look for
+
+def ridings(scale=1):
+
+    counts = [n * scale for n in RIDINGS.values()]
+    province = np.repeat(list(RIDINGS), counts)
+    number = np.concatenate([np.arange(1, n + 1) for n in counts])
+    district = np.repeat(list(PREFIXES.values()), counts) * 10 ** 6 + number
+
+    names = [f'{pt} District {n:07d}' for pt, n in zip(province, number)]
+    names[0] = 'Avalon'
+
+    return pd.DataFrame({'District': district, 'Province': province, 'Name': names})
+
+
+# 5-digit ED codes (prefix x 1 000 + number mod 1 000) for the stages reading the prov/terr off the code (add_pt)
+# they repeat beyond 999 EDs in a prov/terr, which the province lookup does not mind
+
+def five_digit(district):
+
+    district = np.asarray(district)
+
+    return district // 10 ** 6 * 1000 + district % 1000
+
+
+# one row per candidate: District, Province, ED name, Candidate and affiliation, Vote Count & Party; and Total Voters by District
+# baseline support of the EDs only depends on seed, the drift of every year on (seed, year)
+
+def candidates(rd, year, seed=0):
+
+    n = len(rd)
+    quebec = (rd['Province'] == 'QC').to_numpy()
+
+    base = np.random.default_rng(seed).dirichlet(SUPPORT, n)
+    rng = np.random.default_rng([seed, int(year)])
+
+    support = base * rng.lognormal(0.0, 0.35, (n, len(PARTIES)))
+    support[~quebec, PARTIES.index('BQ')] = 0.0
+
+    n_minor = rng.integers(0, 5, n)
+    minor = rng.dirichlet(np.ones(len(MINORS)), n) * rng.uniform(0.0, 0.15, (n, 1))
+    minor[np.arange(len(MINORS)) >= n_minor[:, None]] = 0.0
+
+    shares = np.hstack([support / support.sum(axis=1, keepdims=True) * (1 - minor.sum(axis=1, keepdims=True)), minor])
+
+    electors = rng.integers(40_000, 110_000, n)
+    ballots = np.rint(electors * rng.uniform(0.5, 0.75, n))
+    votes = np.rint(shares * ballots[:, None]).astype(np.int64)
+
+    ed, slot = np.nonzero(votes > 0)
+    labels = np.array(AFFILIATIONS + MINORS, dtype=object)
+    names = rd['Name'].to_numpy()
+
+    table = pd.DataFrame({
+        'District': rd['District'].to_numpy()[ed],
+        'Province': rd['Province'].to_numpy()[ed],
+        'Electoral district': names[ed],
+        'Candidate and affiliation': [f'Candidate {i}-{s} {label}' for i, s, label in zip(ed, slot, labels[slot])],
+        'Vote Count': votes[ed, slot],
+        'Party': np.array(PARTIES + ['Others'] * len(MINORS), dtype=object)[slot],
+    })
+
+    return table, pd.Series(electors, index=rd['District'].to_numpy(), name='Total Voters')
+
+
+# yearly datasheet of part 1 from the candidate rows
+
+def datasheet(table, electors):
+
+    party = table['Party'].to_numpy()
+
+    counts = table.pivot_table(index='District', columns='Party', values='Vote Count', aggfunc='sum', fill_value=0)
+    counts = counts.reindex(columns=PARTIES + ['Others'], fill_value=0)
+
+    winners = table.loc[table.groupby('District')['Vote Count'].idxmax()]
+
+    df = counts.reset_index()
+    df['Province'] = table.groupby('District')['Province'].first().to_numpy()
+    df['Total Voters'] = electors.reindex(df['District']).to_numpy()
+    df['Total Votes'] = counts.sum(axis=1).to_numpy()
+    df['Elected'] = pd.Series(party[winners.index], index=winners['District'].to_numpy()).reindex(df['District']).to_numpy()
+    df[PARTIES] = df[PARTIES].astype(float)
+
+    return df[list(storage.SCHEMA)]
+
+
+def _number(values):
+
+    return [f'{v:,}'.replace(',', ' ') for v in values]
+
+
+# Table 12 page: province & ED cells span the candidate rows of the ED, names are given as English/French
+
+def table12_html(table, total_votes):
+
+    first = ~table['District'].duplicated().to_numpy()
+    span = table.groupby('District', sort=False)['District'].transform('size').to_numpy()
+    pct = table['Vote Count'].to_numpy() / total_votes.reindex(table['District']).to_numpy() * 100
+
+    rows = [
+        '<html><head><meta charset="utf-8"></head><body><table>',
+        '<tr><th rowspan=2>Province</th><th rowspan=2>Electoral district-Circ</th><th rowspan=2>Candidate and affiliation-C</th>'
+        '<th rowspan=2>Residence-R</th><th colspan=2>Votes obtained-V</th><th colspan=2>Majority-M</th></tr>',
+        '<tr><th>No./Nbre</th><th>%</th><th>No./Nbre</th><th>%</th></tr>',
+    ]
+    rows += [
+        (f'<tr><td rowspan={n}>{pt}</td><td rowspan={n}>{name}/{name} fr</td>' if head else '<tr>')
+        + f'<td>{candidate}</td><td>Town</td><td>{count}</td><td>{p:.1f}</td><td></td><td></td></tr>'
+        for head, n, pt, name, candidate, count, p in zip(
+            first, span, table['Province'], table['Electoral district'], table['Candidate and affiliation'],
+            _number(table['Vote Count']), pct,
+        )
+    ]
+    rows.append('</table></body></html>')
+
+    return '\n'.join(rows).encode()
+
+
+# Table 11 page: one row per ED, then the totals & Canada rows
+
+def table11_html(df, names):
+
+    rows = [
+        '<html><head><meta charset="utf-8"></head><body><table>',
+        '<tr><th>Province</th><th>Electoral district-Circ</th><th>Population</th><th>Electors on the lists-E</th>'
+        '<th colspan=2>Valid ballots-V</th><th>Rejected</th></tr>',
+        '<tr><td></td><td></td><td></td><td></td><td>No./Nbre</td><td>%</td><td></td></tr>',
+    ]
+    rows += [
+        f'<tr><td>{pt}</td><td>{name}</td><td>1</td><td>{voters}</td><td>{votes}</td><td>99.0</td><td>1</td></tr>'
+        for pt, name, voters, votes in zip(
+            df['Province'], names.reindex(df['District']), _number(df['Total Voters']), _number(df['Total Votes']),
+        )
+    ]
+    rows.append('<tr><td></td><td>Totals/Totaux</td><td>1</td><td>1 000</td><td>2 000</td><td>99</td><td>1</td></tr>')
+    rows.append('<tr><td></td><td>Canada</td><td>1</td><td>1 000</td><td>2 000</td><td>99</td><td>1</td></tr>')
+    rows.append('</table></body></html>')
+
+    return '\n'.join(rows).encode()
+
+
+# all years of one scale under directory: <year>.csv, ridings.csv & the pages under <directory>/page_archive
+# returns {year: {'table12': url, 'table11': url}}
+
+def write(directory, scale=1, years=YEARS, seed=0):
+
+    os.makedirs(directory, exist_ok=True)
+    archive_dir = os.path.join(directory, 'page_archive')
+
+    rd = ridings(scale)
+    names = rd.set_index('District')['Name']
+    pages = {}
+
+    for year in years:
+        table, electors = candidates(rd, year, seed)
+        df = datasheet(table, electors)
+
+        pages[year] = urls(year, scale)
+        archive.record(pages[year]['table12'], table12_html(table, df.set_index('District')['Total Votes']), archive_dir)
+        archive.record(pages[year]['table11'], table11_html(df, names), archive_dir)
+
+        df.to_csv(os.path.join(directory, f'{year}.csv'), index=False)
+
+    names.rename('2011 Ridings').rename_axis('Code').to_csv(os.path.join(directory, 'ridings.csv'), encoding='utf-8-sig')
+
+    return pages
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='synthetic elections at a multiple of the real riding & candidate counts')
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--directory', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = args.directory or f'./synthetic_{args.scale}'
+    write(directory, args.scale, seed=args.seed)
+
+    print(f'{len(ridings(args.scale))} EDs x {len(YEARS)} years written to {directory}')
@@ -0,0 +1,93 @@
+# part 1: parsing of the Table 12 / Table 11 pages & the per-year summary stages
+
+import pytest
+
+import synthetic
+from canelection import archive, pipeline
+
+YEAR = synthetic.YEARS[-1]
+
+
+# pages are read from the page archive of the synthetic elections, never from the network
+
+@pytest.fixture(scope='module')
+def pages(synthetic_data):
+
+    previous = dict(archive.settings)
+    archive.configure(synthetic_data['archive'], 'offline')
+
+    yield synthetic_data['urls'][YEAR]
+
+    archive.configure(**previous)
+
+
+@pytest.fixture(scope='module')
+def table12(pages):
+
+    return pipeline.load_table12(pages['table12'])
+
+
+@pytest.fixture(scope='module')
+def table11(pages):
+
+    return pipeline.load_table11(pages['table11'])
+
+
+# ED-level frame before add_others / add_elected, keyed by ED name
+
+@pytest.fixture(scope='module')
+def counts(table12, table11):
+
+    return pipeline.get_vote_count(table12).merge(table11, on='District')
+
+
+def test_load_table12(benchmark, pages, synthetic_data):
+
+    benchmark.group = 'load_table12'
+    df = benchmark(pipeline.load_table12, pages['table12'])
+
+    assert df['Electoral district'].nunique() == len(synthetic_data['ridings'])
+
+
+def test_load_table11(benchmark, pages, synthetic_data):
+
+    benchmark.group = 'load_table11'
+    df = benchmark(pipeline.load_table11, pages['table11'])
+
+    assert len(df) == len(synthetic_data['ridings'])
+
+
+def test_get_vote_count(benchmark, table12):
+
+    benchmark.group = 'get_vote_count'
+    df = benchmark(pipeline.get_vote_count, table12)
+
+    assert len(df) == table12['Electoral district'].nunique()
+
+
+def test_add_others(benchmark, counts):
+
+    benchmark.group = 'add_others'
+    df = benchmark(pipeline.add_others, counts.copy())
+
+    assert (df['Others'] >= 0).all()
+
+
+def test_add_elected(benchmark, counts, table12):
+
+    benchmark.group = 'add_elected'
+    df = benchmark(pipeline.add_elected, counts.copy(), table12)
+
+    assert df['Elected'].notna().all()
+
+
+def test_add_pt(benchmark, counts, synthetic_data):
+
+    rd = synthetic_data['ridings']
+    codes = dict(zip(rd['Name'], synthetic.five_digit(rd['District'])))
+    df = counts.assign(District=counts['District'].map(codes))
+
+    benchmark.group = 'add_pt'
+    df = benchmark(pipeline.add_pt, df)
+
+    assert df['Province'].notna().all()
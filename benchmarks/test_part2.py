@@ -0,0 +1,65 @@
+# part 2: winners & hold / flip labels of every ED (the former rd_data loops), seat transition tables
+# (the former making_pivot) & the results cube roll-ups
+
+import pytest
+
+from canelection import cube, transitions
+
+PARTIES = {'Liberal': 'LIB', 'Conservative': 'CON', 'NDP': 'NDP', 'BQ': 'BLQ', 'Others': 'OTH'}
+LABELS = sorted(PARTIES.values())
+
+
+@pytest.fixture(scope='module')
+def winner_matrix(frames):
+
+    return transitions.WinnerMatrix.from_frames(frames, LABELS, mapping=PARTIES)
+
+
+def _flips(frames):
+
+    matrix = transitions.WinnerMatrix.from_frames(frames, LABELS, mapping=PARTIES)
+    labels = {pair: matrix.change_labels(*pair.split(' to ')) for pair in matrix.pair_names()}
+
+    return matrix.decode(), labels, matrix.metrics()
+
+
+def test_winner_flips(benchmark, frames):
+
+    benchmark.group = 'rd_data flips'
+    winners, labels, metrics = benchmark(_flips, frames)
+
+    assert len(winners) == len(metrics) == len(frames[list(frames)[0]])
+    assert len(labels) == len(frames) - 1
+
+
+def test_transition_tables(benchmark, winner_matrix):
+
+    benchmark.group = 'making_pivot'
+    tables = benchmark(winner_matrix.transitions)
+
+    assert len(tables) == len(winner_matrix.years) * (len(winner_matrix.years) - 1) // 2
+
+
+def test_province_transition_tables(benchmark, winner_matrix, frames):
+
+    groups = frames[winner_matrix.years[0]].set_index('District')['Province'].reindex(winner_matrix.districts)
+
+    benchmark.group = 'making_pivot by province'
+    tables = benchmark(winner_matrix.transitions, groups=groups)
+
+    assert len(tables) == len(winner_matrix.years) * (len(winner_matrix.years) - 1) // 2
+
+
+def _cube(frames):
+
+    results = cube.ResultsCube.from_frames(frames)
+
+    return [results.by_province(year) for year in results.years], results.national(), results.seat_counts()
+
+
+def test_results_cube(benchmark, frames):
+
+    benchmark.group = 'results cube'
+    provinces, national, seats = benchmark(_cube, frames)
+
+    assert int(seats.to_numpy().sum()) == sum(len(df) for df in frames.values())
@@ -0,0 +1,53 @@
+# part 3: feature building & the polynomial regression degree sweep
+
+import numpy as np
+import pytest
+
+from canelection import features, modelsearch
+
+
+@pytest.fixture(scope='module')
+def ontario(frames):
+
+    arrays, ranges = features.compute(frames['2008'], frames['2011'])
+    rows = slice(*ranges['ON'])
+
+    # winner codes stand in for the riding types as strata
+    return arrays['X'][rows], arrays['y'][rows], arrays['X'][rows, 1].astype(int)
+
+
+def test_features(benchmark, frames):
+
+    benchmark.group = 'features'
+    arrays, ranges = benchmark(features.compute, frames['2008'], frames['2011'])
+
+    assert len(arrays['y']) == len(frames['2011'])
+
+
+# degree 1-6 with ordinary least squares, the sweep of part 3
+
+def test_degree_sweep(benchmark, ontario):
+
+    x, y, strata = ontario
+
+    benchmark.group = 'degree sweep'
+    results, model = benchmark.pedantic(
+        modelsearch.search, args=(x, y, strata), kwargs={'models': ('linear',), 'n_jobs': 1}, rounds=3,
+    )
+
+    assert len(results) == len(modelsearch.DEGREES)
+
+
+# full grid with ridge & lasso alphas; lasso on the degree 6 expansion grows fast with the ED count
+
+def test_grid_search(benchmark, ontario, scale):
+
+    if scale > 10:
+        pytest.skip('full grid is only run up to 10x')
+
+    x, y, strata = ontario
+
+    benchmark.group = 'grid search'
+    results, model = benchmark.pedantic(modelsearch.search, args=(x, y, strata), kwargs={'n_jobs': 1}, rounds=3)
+
+    assert np.isfinite(results['MSE']).all()
@@ -0,0 +1,3 @@
+# shared helpers for the code-clean version of the project:
+# https://www.kaggle.com/czz1403/dm13-1204880-python
+# the numbered scripts under the project root import from this package
@@ -0,0 +1,7 @@
+# python -m canelection <command>, see canelection/cli.py
+
+import sys
+
+from canelection.cli import main
+
+sys.exit(main())
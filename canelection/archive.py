@@ -0,0 +1,213 @@
+# record / replay archive of the Elections Canada pages
+# raw page bytes are stored content-addressed (sha256) under <archive>/objects,
+# <archive>/manifest.json records url -> hash, size & fetch time; its updates hold a file lock (<archive>/manifest.lock),
+# as pages may be recorded by several processes at once (e.g. the per-year workers of canelection/pipeline.py)
+# an archive directory copied from a connected machine is enough to run part 1 with no network
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import threading
+import urllib.request
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from canelection import instrument
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+# modes:
+# - 'replay': parse from the archive, pages missing from the archive are fetched & recorded (default)
+# - 'refresh': fetch every page again & record it
+# - 'offline': parse from the archive only, a missing page raises an error
+MODES = ('replay', 'refresh', 'offline')
+
+settings = {
+    'archive_dir': os.environ.get('ELECTIONS_ARCHIVE', './page_archive'),
+    'mode': os.environ.get('ELECTIONS_ARCHIVE_MODE', 'replay'),
+}
+
+_lock = threading.Lock()
+
+
+def configure(archive_dir=None, mode=None):
+
+    if archive_dir is not None:
+        settings['archive_dir'] = archive_dir
+
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f'unknown archive mode {mode!r}, expected one of {MODES}')
+        settings['mode'] = mode
+
+    return dict(settings)
+
+
+def _manifest_path(archive_dir):
+
+    return os.path.join(archive_dir, 'manifest.json')
+
+
+# exclusive lock of the manifest, between the threads of this process & between processes
+
+@contextlib.contextmanager
+def _manifest_lock(archive_dir):
+
+    os.makedirs(archive_dir, exist_ok=True)
+
+    with _lock, open(os.path.join(archive_dir, 'manifest.lock'), 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _object_path(archive_dir, digest):
+
+    return os.path.join(archive_dir, 'objects', digest[:2], digest)
+
+
+def load_manifest(archive_dir=None):
+
+    archive_dir = archive_dir or settings['archive_dir']
+
+    try:
+        with open(_manifest_path(archive_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# store page bytes & update the manifest entry of the url
+# the manifest is read, updated & rewritten under the manifest lock, so concurrent processes never lose each other's entries,
+# & through a temporary file, so an interrupted run never leaves it half written
+
+def record(url, content, archive_dir=None, fetched_at=None):
+
+    archive_dir = archive_dir or settings['archive_dir']
+    digest = hashlib.sha256(content).hexdigest()
+    path = _object_path(archive_dir, digest)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    entry = {
+        'sha256': digest,
+        'size': len(content),
+        'fetched_at': fetched_at or datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+    with _manifest_lock(archive_dir):
+        manifest = load_manifest(archive_dir)
+        manifest[url] = entry
+        tmp = f'{_manifest_path(archive_dir)}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, _manifest_path(archive_dir))
+
+    return entry
+
+
+def lookup(url, archive_dir=None):
+
+    archive_dir = archive_dir or settings['archive_dir']
+    entry = load_manifest(archive_dir).get(url)
+
+    if entry is None:
+        return None
+
+    path = _object_path(archive_dir, entry['sha256'])
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    # a corrupted object is treated as missing
+    if hashlib.sha256(content).hexdigest() != entry['sha256']:
+        return None
+
+    return content
+
+
+# archive hash of the page behind a url, None if the page is not archived
+
+def page_hash(url, archive_dir=None):
+
+    entry = load_manifest(archive_dir).get(url)
+
+    return entry['sha256'] if entry else None
+
+
+def download(url, timeout=60):
+
+    request = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+# main entry: page bytes for a url, honouring the archive mode
+
+@instrument.staged()
+def get_page(url, archive_dir=None, mode=None):
+
+    archive_dir = archive_dir or settings['archive_dir']
+    mode = mode or settings['mode']
+
+    if mode != 'refresh':
+        content = lookup(url, archive_dir)
+        if content is not None:
+            return content
+        if mode == 'offline':
+            raise LookupError(f'{url} is not in the page archive at {archive_dir} (offline mode)')
+
+    content = download(url)
+    record(url, content, archive_dir)
+
+    return content
+
+
+# drop-in replacement of pd.read_html(url, ...), parsing the archived bytes
+
+def read_html(url, **kwargs):
+
+    return pd.read_html(io.BytesIO(get_page(url)), **kwargs)
+
+
+# seed an archive from a local directory of fixture pages
+# pages is a {url: file name} dict, file names are relative to fixture_dir
+# without pages, the dict is read from pages.json in fixture_dir
+
+def import_fixtures(fixture_dir, pages=None, archive_dir=None):
+
+    if pages is None:
+        with open(os.path.join(fixture_dir, 'pages.json'), encoding='utf-8') as f:
+            pages = json.load(f)
+
+    entries = {}
+
+    for url, name in pages.items():
+        with open(os.path.join(fixture_dir, name), 'rb') as f:
+            entries[url] = record(url, f.read(), archive_dir)
+
+    return entries
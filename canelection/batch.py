@@ -0,0 +1,182 @@
+# nationwide batch training & cross-year evaluation of the part 3 regression
+# for every base / target year pair of the feature store (canelection/features.py):
+# - a pooled model over all EDs, with one-hot province & riding type encodings next to the base year features (features.design)
+# - per-province variants, one model per prov/terr with the riding type encoding
+# every model trained on one pair is evaluated on every pair (the rows of its own prov/terr for the per-province variants)
+# riding types of a pair are the cluster tags of its base year (canelection/clustering.py)
+# independent fits run in parallel with joblib, workers read the memory-mapped feature arrays
+# returns a matrix of MSEs (variant & training pair x evaluation pair) & the per-ED predictions
+#
+# python -m canelection.batch runs the full cross-year evaluation on the outputs of part 1 in the current directory
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from canelection import clustering, crosswalk, features, instrument, modelsearch, storage
+
+PROVINCES = storage.PROVINCES
+MODEL = ('ridge', 1.0, 1) # fixed default model, alpha & degree; workflow.train(search=True) uses the searched one instead
+COLUMNS = ['District', 'Province', 'Total Voters', 'Liberal', 'Conservative', 'NDP', 'BQ', 'Others', 'Total Votes', 'Elected']
+
+
+def _label(pair):
+
+    return '-'.join(pair)
+
+
+# one fit on the rows of a training pair, predictions for the rows of all pairs
+# data: {pair: (district, province, X, y, riding type)}; province=None is the pooled model
+
+def _fit(data, train, province, n_types, model):
+
+    def rows(pair):
+        _, pt, x, y, rd_type = data[pair]
+        if province is None:
+            return slice(None), features.design(x, rd_type, n_types, pt), y
+        selected = pt == PROVINCES.index(province)
+        return selected, features.design(x[selected], rd_type[selected], n_types), y[selected]
+
+    _, x, y = rows(train)
+
+    if len(y) < 2:
+        return {}
+
+    fitted = modelsearch.refit(x, y, *model)
+
+    predictions = {}
+    for pair in data:
+        selected, x, _ = rows(pair)
+        predictions[pair] = (selected, fitted.predict(x))
+
+    return predictions
+
+
+# riding types of the EDs of districts in year; raises ValueError for EDs without one (e.g. of a prov/terr left out)
+
+def riding_types_of(riding_types, year, districts):
+
+    rd_type = riding_types[riding_types['Year'] == year].set_index('District')['Riding_type'].reindex(districts)
+    missing = rd_type.index[rd_type.isna()]
+
+    if len(missing):
+        raise ValueError(f'no riding type for {len(missing)} EDs of {year}: {missing[:5].tolist()}')
+
+    return rd_type.to_numpy(dtype=np.int64)
+
+
+def _inputs(pairs, riding_types, directory):
+
+    data = {}
+
+    for pair in pairs:
+        fs = features.load(*pair, directory=directory)
+        rd_type = riding_types_of(riding_types, pair[0], fs.district)
+        data[pair] = (fs.district, fs.province, fs.X, fs.y, rd_type)
+
+    return data
+
+
+# riding_types: District, Year, Riding_type table of canelection/clustering.py
+# returns (MSE frame indexed by Variant & Train with one column per evaluation pair, per-ED predictions)
+
+@instrument.staged('batch.run')
+def run(riding_types, years, directory='./features', model=MODEL, provinces=PROVINCES, n_jobs=None):
+
+    pairs = features.pairs(years)
+    data = _inputs(pairs, riding_types, directory)
+    n_types = int(riding_types['Riding_type'].max()) + 1
+
+    tasks = [(train, None) for train in pairs] + [(train, pt) for train in pairs for pt in provinces]
+    results = Parallel(n_jobs=n_jobs)(delayed(_fit)(data, train, pt, n_types, model) for train, pt in tasks)
+
+    # predictions of the per-province variants are put together into one prediction per ED
+    prediction = {
+        (variant, train, pair): np.full(len(data[pair][3]), np.nan)
+        for variant in ('pooled', 'province') for train in pairs for pair in pairs
+    }
+
+    for (train, province), result in zip(tasks, results):
+        variant = 'pooled' if province is None else 'province'
+        for pair, (rows, values) in result.items():
+            prediction[variant, train, pair][rows] = values
+
+    frames = []
+    for (variant, train, pair), values in prediction.items():
+        district, pt, _, y, _ = data[pair]
+        frames.append(pd.DataFrame({
+            'Variant': variant,
+            'Train': _label(train),
+            'Evaluate': _label(pair),
+            'District': district,
+            'Province': np.asarray(PROVINCES)[pt],
+            'Target': y,
+            'Prediction': values,
+        }))
+
+    predictions = pd.concat(frames, ignore_index=True)
+    predictions['Squared Error'] = (predictions['Prediction'] - predictions['Target']) ** 2
+
+    mse = predictions.pivot_table(index=['Variant', 'Train'], columns='Evaluate', values='Squared Error', aggfunc='mean', sort=False)
+
+    return mse, predictions.drop(columns='Squared Error')
+
+
+# yearly datasheets of part 1 aligned on the latest representation order, as in part 3
+
+def load_frames(years=None, directory='.'):
+
+    from canelection.elections import ELECTIONS
+
+    years = years or sorted(ELECTIONS)
+    order = ELECTIONS[max(years)]['order']
+
+    return {
+        year: crosswalk.align(df, ELECTIONS[year]['order'], order)
+        for year, df in storage.read_years(years, columns=COLUMNS, directory=directory).items()
+    }
+
+
+# feature store, riding types & the full cross-year evaluation from the outputs of part 1
+
+def evaluate(directory='.', features_directory='./features', k=3, seed=308, model=MODEL, n_jobs=None):
+
+    frames = load_frames(directory=directory)
+    features.build(frames, features_directory)
+    riding_types, _ = clustering.cluster_all(frames, k=k, seed=seed, n_jobs=n_jobs)
+
+    return run(riding_types, list(frames), features_directory, model, n_jobs=n_jobs)
+
+
+if __name__ == '__main__':
+
+    warnings.filterwarnings('ignore')
+
+    parser = argparse.ArgumentParser(description='batch training & cross-year evaluation over all provinces')
+    parser.add_argument('--directory', default='.')
+    parser.add_argument('--features', default='./features')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=308)
+    parser.add_argument('--model', default=MODEL[0], choices=['linear', 'ridge', 'lasso'])
+    parser.add_argument('--alpha', type=float, default=MODEL[1])
+    parser.add_argument('--degree', type=int, default=MODEL[2])
+    parser.add_argument('--jobs', type=int, default=-1)
+    parser.add_argument('--predictions', help='csv file for the per-ED predictions')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    mse, predictions = evaluate(
+        args.directory, args.features, args.k, args.seed, (args.model, args.alpha, args.degree), args.jobs,
+    )
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', '{:.2f}'.format):
+        print(mse)
+
+    if args.predictions:
+        predictions.to_csv(args.predictions, index=False)
+
+    print(f'{len(mse)} variant / training pair rows x {len(mse.columns)} evaluation pairs in {time.perf_counter() - start:.1f} s')
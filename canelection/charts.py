@@ -0,0 +1,284 @@
+# headless batch rendering of the part 2 charts
+# every chart is a job: a chart function & the small roll-up frames it draws, taken from the results cube & winner matrix
+# figures are drawn on matplotlib Figure objects (Agg canvas) without pyplot, so forked workers hold no GUI state
+# jobs are hashed by the source of this module & their data; charts whose hash is unchanged since the last render are skipped
+# the hashes of the rendered charts are kept in charts.json of the output directory
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from canelection import instrument, parallel, stagecache
+
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
+COLORS = ['red', 'blue', 'orange', 'turquoise', 'grey'] # representative colors for parties (and "others")
+PROVINCES = ['BC', 'AB', 'SK', 'MB', 'ON', 'QC', 'NB', 'PE', 'NS', 'NL', 'Territories'] # by geographical locations
+
+
+def _figure(figsize):
+
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=figsize)
+
+
+# vote percentages grabbed by major parties, by year
+# counts: Year x parties & Total Votes (nationwide or one province)
+
+def share_lines(counts, title):
+
+    fig = _figure((8, 9))
+    ax = fig.subplots()
+
+    shares = counts[PARTIES].div(counts['Total Votes'], axis=0).fillna(0)
+    years = list(counts.index)
+    top = max(0.5, np.ceil(shares.to_numpy().max() * 10) / 10)
+
+    # parties without any vote in the series (BQ outside Quebec) are left out
+    for party, color in zip(PARTIES, COLORS):
+        if not counts[party].any():
+            continue
+        ax.plot(years, shares[party], label=party, color=color)
+        ax.fill_between(years, shares[party], color=color, alpha=0.1)
+        for x, y in enumerate(shares[party]):
+            ax.annotate('{:.1%}'.format(y), xy=(x, y), xytext=(float(x), y + 0.01), ha='center')
+
+    ax.set_ylim(0, top)
+    ax.legend(loc=2)
+    ax.vlines(range(len(years)), 0, top, linestyles='dashed', alpha=0.05)
+
+    ticks = np.arange(0, top + 0.1, .1)
+    ax.set_yticks(ticks, labels=['{:.1%}'.format(p) for p in ticks])
+    ax.set_title(title)
+
+    return fig
+
+
+# stacked seat counts by year
+# seats: years x parties
+
+def seat_bars(seats, title):
+
+    fig = _figure((7, 8))
+    ax = fig.subplots()
+
+    x = np.arange(len(seats))
+    bottom = np.zeros(len(seats))
+
+    for party, color in zip(PARTIES, COLORS):
+        counts = seats[party].to_numpy()
+        ax.bar(x, counts, bottom=bottom, color=color, width=0.5)
+        for xi in np.flatnonzero(counts):
+            ax.annotate(int(counts[xi]), xy=(xi, bottom[xi] + counts[xi] / 2), ha='center', color='white', fontsize='medium')
+        bottom = bottom + counts
+
+    ax.set_xticks(x, labels=list(seats.index))
+    ax.set_ylim(0, max(bottom.max(), 1))
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Seat Count')
+    ax.set_title(title)
+
+    return fig
+
+
+# parties gaining / losing seats between consecutive elections
+# seats: years x parties
+
+def gain_loss_bars(seats, title):
+
+    fig = _figure((4, 7))
+    ax = fig.subplots()
+
+    changes = seats.diff().iloc[1:]
+    changes.index = [f'{a[-2:]} to {b[-2:]}' for a, b in zip(seats.index[:-1], seats.index[1:])]
+    limit = max(10, np.abs(changes.to_numpy()).max() + 10)
+
+    changes.plot.bar(color=COLORS, ax=ax)
+
+    ax.set_ylim((-limit, limit))
+    ax.hlines(0, -1, len(changes))
+    ax.hlines([s * step for s in (1, -1) for step in (limit / 3, 2 * limit / 3)], -1, len(changes), linestyles='dashed', alpha=0.1)
+    ax.set_title(title)
+
+    return fig
+
+
+# vote counts by prov/terr of one year, bar chart
+# counts: provinces x parties
+
+def province_bars(counts, title):
+
+    fig = _figure((14, 5))
+    ax = fig.subplots()
+
+    counts[PARTIES].loc[PROVINCES].plot.bar(color=COLORS, ax=ax)
+    ax.set_xticklabels(PROVINCES, rotation=0)
+    ax.set_title(title)
+
+    return fig
+
+
+# party vote counts & percentages by prov/terr of one year, pie chart
+# Bloc only runs in Quebec; pie radius grows with the vote total
+
+def province_pies(counts, title):
+
+    fig = _figure((20, 15))
+    axes = fig.subplots(nrows=3, ncols=4)
+
+    for i, province in enumerate(PROVINCES):
+        parties = PARTIES if province == 'QC' else [p for p in PARTIES if p != 'BQ']
+        colors = [COLORS[PARTIES.index(p)] for p in parties]
+
+        vote_counts = counts.loc[province][parties].tolist()
+        total = counts['Total Votes'].loc[province]
+
+        axes[i // 4, i % 4].pie(
+            vote_counts,
+            colors=colors,
+            labels=[f'{party}\n{int(count)} - ' + '{:.1%}'.format(count / total) for party, count in zip(parties, vote_counts)],
+            labeldistance=0.8,
+            startangle=-5,
+            radius=np.log10(np.cbrt(total / 2000)),
+        )
+        axes[i // 4, i % 4].set_title(f'{province} - {total} votes total')
+
+    axes[2, 3].axis('off') # unused 12th subplot
+    fig.suptitle(title)
+
+    return fig
+
+
+# seat transitions between 2 elections, heatmap
+# table: parties of the earlier election x parties of the later election
+
+def transition_heatmap(table, title):
+
+    import seaborn as sns
+
+    fig = _figure((6, 6))
+    ax = fig.subplots()
+
+    sns.heatmap(table, ax=ax, cmap='PuOr', annot=True, fmt='g', square=True)
+    ax.set_title(title)
+
+    return fig
+
+
+CHARTS = {
+    'share_lines': share_lines,
+    'seat_bars': seat_bars,
+    'gain_loss_bars': gain_loss_bars,
+    'province_bars': province_bars,
+    'province_pies': province_pies,
+    'transition_heatmap': transition_heatmap,
+}
+
+
+def job(name, chart, **args):
+
+    return {'name': name, 'chart': chart, 'args': args}
+
+
+# all charts for all years & provinces
+# results: ResultsCube; winner_matrix: WinnerMatrix (optional) & the Province of its ridings for the per-province heatmaps
+
+def build_jobs(results, winner_matrix=None, provinces=None):
+
+    jobs = [
+        job('national_shares', 'share_lines', counts=results.national(), title='Vote Percentages of Major Parties'),
+        job('national_seats', 'seat_bars', seats=results.seat_counts(), title='Seat Count by Year'),
+        job('national_gains', 'gain_loss_bars', seats=results.seat_counts(), title='Seat Gains & Losses'),
+    ]
+
+    for year in results.years:
+        counts = results.by_province(year)
+        jobs.append(job(f'{year}_province_bars', 'province_bars', counts=counts,
+                        title=f'{year} Canadian General Election Vote Distribution by Provinces / Territories'))
+        jobs.append(job(f'{year}_province_pies', 'province_pies', counts=counts,
+                        title=f'{year} Canadian General Election Vote Counts and Distributions by Provinces / Territories'))
+
+    for province in PROVINCES:
+        jobs.append(job(f'{province}_shares', 'share_lines', counts=results.history(province),
+                        title=f'{province} - Vote Percentages of Major Parties'))
+        jobs.append(job(f'{province}_seats', 'seat_bars', seats=results.seat_history(province),
+                        title=f'{province} - Seat Count by Year'))
+        jobs.append(job(f'{province}_gains', 'gain_loss_bars', seats=results.seat_history(province),
+                        title=f'{province} - Seat Gains & Losses'))
+
+    if winner_matrix is not None:
+        for (year_a, year_b), table in winner_matrix.transitions(consecutive=True).items():
+            jobs.append(job(f'{year_a}_{year_b}_transitions', 'transition_heatmap', table=table,
+                            title=f'Gains & Losses {year_a} to {year_b}'))
+
+    if winner_matrix is not None and provinces is not None:
+        for (year_a, year_b), table in winner_matrix.transitions(groups=provinces, consecutive=True).items():
+            for province in PROVINCES:
+                if province in table.index.get_level_values(0):
+                    jobs.append(job(f'{province}_{year_a}_{year_b}_transitions', 'transition_heatmap',
+                                    table=table.loc[province], title=f'{province} - Gains & Losses {year_a} to {year_b}'))
+
+    return jobs
+
+
+# the whole module is hashed: chart functions share the colors, the layout constants & _figure
+
+def job_hash(job, formats):
+
+    return stagecache.fingerprint(job['chart'], stagecache.source_hash(sys.modules[__name__]), job['args'], list(formats))
+
+
+def _paths(name, directory, formats):
+
+    return [os.path.join(directory, f'{name}.{fmt}') for fmt in formats]
+
+
+def render(job, directory, formats=('png',), dpi=100):
+
+    fig = CHARTS[job['chart']](**job['args'])
+
+    for path in _paths(job['name'], directory, formats):
+        fig.savefig(path, dpi=dpi)
+
+    return job['name']
+
+
+def _load_manifest(directory):
+
+    try:
+        with open(os.path.join(directory, 'charts.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# render all jobs into directory across a process pool, skipping charts whose data & code did not change
+# returns the counts of rendered & skipped charts and the wall time in seconds
+
+@instrument.staged()
+def render_all(jobs, directory='./charts', formats=('png',), dpi=100, max_workers=None, force=False):
+
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = _load_manifest(directory)
+    hashes = {job['name']: job_hash(job, formats) for job in jobs}
+    todo = [
+        job for job in jobs
+        if force
+        or manifest.get(job['name']) != hashes[job['name']]
+        or not all(os.path.exists(path) for path in _paths(job['name'], directory, formats))
+    ]
+
+    if todo:
+        with parallel.process_pool(max_workers) as pool:
+            for name in pool.map(render, todo, [directory] * len(todo), [formats] * len(todo), [dpi] * len(todo)):
+                manifest[name] = hashes[name]
+
+    with open(os.path.join(directory, 'charts.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return {'rendered': len(todo), 'skipped': len(jobs) - len(todo), 'seconds': time.perf_counter() - start}
@@ -0,0 +1,233 @@
+# command line of the project: canelection <command> once installed (pip install .), or python -m canelection <command>
+#   collect   part 1: fetch & parse the pages of all elections, write the datasheets, reference sheet, columnar copies & cube
+#   analyze   part 2 tables: vote shares, seats, transitions, most flipped EDs, counterfactuals & seat projection
+#   render    part 2 charts of every year & prov/terr, rendered headless
+#   train     part 3: feature store, riding types, model search & cross-year evaluation of the regression
+#   lookup    results of one riding by ED code or ED name
+#   summary   vote shares & seats by year, or by prov/terr of one year
+#   serve     HTTP/JSON query service (canelection/service.py)
+# only the standard library is imported at start, every command imports what it needs when it runs:
+# lookup & summary read the csv exports with the csv module (canelection/sheets.py), without numpy or pandas;
+# matplotlib & seaborn are only loaded by render, sklearn by train
+#
+#   canelection lookup Avalon
+#   canelection summary --year 2011
+#   canelection --trace trace.json collect
+
+import argparse
+import sys
+
+
+def _print_frame(df, float_format='{:.3f}'):
+
+    import pandas as pd
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', float_format.format):
+        print(df)
+
+
+def collect(args):
+
+    from canelection import archive, stagecache, workflow
+
+    archive.configure(args.archive, args.mode)
+    stagecache.configure(max_bytes=args.cache_size * 2 ** 20, enabled=not args.no_cache)
+
+    data, resolved = workflow.collect(args.directory, max_workers=args.workers)
+
+    for year, df in data.items():
+        unresolved = resolved[year]['District'].isna().sum()
+        print(f'{year}: {len(df)} EDs, {unresolved} unresolved ED names')
+
+    print(f'datasheets, ridings.csv & cube.npz written to {args.directory}')
+
+
+def analyze(args):
+
+    from canelection import workflow
+
+    tables = workflow.analyze(args.directory, args.year, args.projection, args.seed, args.workers)
+
+    for title, df in tables.items():
+        print(f'\n{title}')
+        _print_frame(df)
+
+
+def render(args):
+
+    import os
+
+    from canelection import workflow
+
+    chart_directory = args.charts or os.path.join(args.directory, 'charts')
+    report = workflow.render(args.directory, chart_directory, args.formats, args.workers, args.force)
+
+    print(f"{report['rendered']} charts rendered, {report['skipped']} unchanged, {report['seconds']:.1f} s")
+
+
+def train(args):
+
+    import os
+
+    from canelection import workflow
+
+    feature_directory = args.features or os.path.join(args.directory, 'features')
+    mse, predictions, best = workflow.train(
+        args.directory, feature_directory, args.k, args.seed, (args.model, args.alpha, args.degree), args.search, args.jobs,
+    )
+
+    if best is not None:
+        print('best configuration by prov/terr')
+        _print_frame(best)
+        print()
+
+    _print_frame(mse, '{:.2f}')
+
+    if args.predictions:
+        predictions.to_csv(args.predictions, index=False)
+
+
+def lookup(args):
+
+    from canelection import sheets
+
+    try:
+        result = sheets.riding(' '.join(args.riding), args.year, args.directory)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+
+    rows = [
+        [year, row['Province'], row['Elected']]
+        + [f"{row[party]} ({row[f'{party} %']:.1%})" for party in sheets.PARTIES]
+        + [row['Total Votes'], f"{row['Turnout']:.1%}", row['Margin']]
+        for year, row in result['Results'].items()
+    ]
+
+    print(f"{result['District']} {result['Name']}")
+    print(sheets.table(['Year', 'Province', 'Elected'] + sheets.PARTIES + ['Total Votes', 'Turnout', 'Margin'], rows))
+
+
+def summary(args):
+
+    from canelection import sheets
+
+    try:
+        totals = sheets.totals(args.year, args.province, args.directory)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+
+    if args.year is not None and args.province is not None:
+        totals = {args.province: totals[args.province]} if args.province in totals else {}
+
+    key = 'Year' if args.year is None else 'Province'
+    shares = [
+        [name] + [f"{total[party] / total['Total Votes']:.1%}" for party in sheets.PARTIES] + [total['Total Votes']]
+        for name, total in totals.items()
+    ]
+    seats = [
+        [name] + [total[f'{party} Seats'] for party in sheets.PARTIES] + [sum(total[f'{party} Seats'] for party in sheets.PARTIES)]
+        for name, total in totals.items()
+    ]
+
+    print('Vote shares')
+    print(sheets.table([key] + sheets.PARTIES + ['Total Votes'], shares))
+    print('\nSeats')
+    print(sheets.table([key] + sheets.PARTIES + ['Total'], seats))
+
+
+def serve(args):
+
+    from canelection import service
+
+    service.serve(args.host, args.port, args.directory)
+
+
+def parser():
+
+    main_parser = argparse.ArgumentParser(prog='canelection', description='Canadian federal election results 2004-2011')
+    main_parser.add_argument('--directory', default='.', help='directory of the outputs of part 1 (default: .)')
+    main_parser.add_argument(
+        '--trace', metavar='PATH', help='record every stage & write a Chrome trace to PATH (canelection/instrument.py)',
+    )
+    commands = main_parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    p = commands.add_parser('collect', help='part 1: collect the datasheets of all elections')
+    p.add_argument('--archive', help='page archive directory (default: ./page_archive or ELECTIONS_ARCHIVE)')
+    p.add_argument('--mode', choices=['replay', 'refresh', 'offline'], help='page archive mode (archive.MODES)')
+    p.add_argument('--cache-size', type=int, default=512, help='stage cache size in MiB')
+    p.add_argument('--no-cache', action='store_true', help='run every stage, without the stage cache')
+    p.add_argument('--workers', type=int, help='processes of the per-year pipeline')
+    p.set_defaults(func=collect)
+
+    p = commands.add_parser('analyze', help='part 2: summary tables of the collected elections')
+    p.add_argument('--year', help='election of the per-election tables (default: latest)')
+    p.add_argument('--projection', type=int, default=100_000, help='seat projection scenarios, 0 to skip')
+    p.add_argument('--seed', type=int, default=2011)
+    p.add_argument('--workers', type=int, help='processes of the seat projection')
+    p.set_defaults(func=analyze)
+
+    p = commands.add_parser('render', help='part 2: render all charts')
+    p.add_argument('--charts', help='output directory (default: <directory>/charts)')
+    p.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'])
+    p.add_argument('--force', action='store_true', help='render unchanged charts again')
+    p.add_argument('--workers', type=int, help='rendering processes')
+    p.set_defaults(func=render)
+
+    p = commands.add_parser('train', help='part 3: train & evaluate the regression across years')
+    p.add_argument('--features', help='feature store directory (default: <directory>/features)')
+    p.add_argument('--k', type=int, default=3, help='riding types per prov/terr')
+    p.add_argument('--seed', type=int, default=308)
+    p.add_argument('--model', default='ridge', choices=['linear', 'ridge', 'lasso'])
+    p.add_argument('--alpha', type=float, default=1.0)
+    p.add_argument('--degree', type=int, default=1)
+    p.add_argument(
+        '--search', action='store_true',
+        help='run the model search of every prov/terr first & evaluate its best configuration instead of --model',
+    )
+    p.add_argument('--jobs', type=int, default=-1)
+    p.add_argument('--predictions', help='csv file for the per-ED predictions')
+    p.set_defaults(func=train)
+
+    p = commands.add_parser('lookup', help='results of a riding by ED code or ED name')
+    p.add_argument('riding', nargs='+', help='ED code or (part of an) ED name, the matching EDs are listed when several match')
+    p.add_argument('--year', action='append', help='election year, repeatable (default: all)')
+    p.set_defaults(func=lookup)
+
+    p = commands.add_parser('summary', help='vote shares & seats by year, or by prov/terr with --year')
+    p.add_argument('--year', help='one election, by prov/terr')
+    p.add_argument('--province', help='one prov/terr (NL..BC, Territories)')
+    p.set_defaults(func=summary)
+
+    p = commands.add_parser('serve', help='HTTP/JSON query service')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.set_defaults(func=serve)
+
+    return main_parser
+
+
+def main(argv=None):
+
+    args = parser().parse_args(argv)
+
+    if args.command not in ('lookup', 'summary'):
+        import warnings
+        warnings.filterwarnings('ignore')
+
+    if args.trace:
+        from canelection import instrument
+        instrument.configure(enabled=True)
+
+    status = args.func(args)
+
+    if args.trace:
+        print(instrument.report(args.trace).to_string())
+
+    return status or 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# riding types: clusters of EDs by their vote share pattern, for every prov/terr & election year
+# - seeded Mini-Batch KMeans on the party vote shares (%) of the EDs of a province in one year
+# - optional k sweep scored by silhouette, run in parallel; the best k of the first year is kept for all years of the province
+# - labels are comparable across years: the clusters of the first year are ordered by their Conservative share,
+#   the clusters of every later year are matched to the centroids of the year before (minimum total centroid distance)
+# - fitted models & labels are kept in the stage cache, keyed by the shares, k, seed, this module & the sklearn version
+
+import sys
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+
+from canelection import instrument, stagecache
+
+FEATURES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
+
+
+# party vote shares (%) by District
+
+def shares(df, features=FEATURES):
+
+    values = df[features].to_numpy(dtype=float) / df['Total Votes'].to_numpy(dtype=float)[:, None] * 100
+
+    return pd.DataFrame(values, index=pd.Index(df['District'].to_numpy(), name='District'), columns=features)
+
+
+def fit(x, k, seed=0):
+
+    from sklearn.cluster import MiniBatchKMeans
+
+    k = min(k, len(x))
+
+    return MiniBatchKMeans(n_clusters=k, random_state=seed, n_init=10, batch_size=1024).fit(np.asarray(x))
+
+
+def _silhouette(x, k, seed):
+
+    from sklearn.metrics import silhouette_score
+
+    return silhouette_score(x, fit(x, k, seed).labels_)
+
+
+# silhouette score of every k, ks outside 2 .. n - 1 are left out
+
+def silhouette_sweep(x, ks=range(2, 9), seed=0, n_jobs=None):
+
+    x = np.asarray(x)
+    ks = [k for k in ks if 2 <= k < len(x)]
+    scores = Parallel(n_jobs=n_jobs)(delayed(_silhouette)(x, k, seed) for k in ks)
+
+    return pd.Series(scores, index=pd.Index(ks, name='k'), name='Silhouette', dtype=float)
+
+
+# permutation mapping the clusters of centroids onto the labels of reference (same k), or onto Conservative share order
+
+def align(centroids, reference=None, order_by=FEATURES.index('Conservative')):
+
+    if reference is None or len(reference) != len(centroids):
+        return np.argsort(np.argsort(centroids[:, order_by], kind='stable'))
+
+    rows, cols = linear_sum_assignment(cdist(centroids, reference))
+    mapping = np.empty(len(centroids), dtype=int)
+    mapping[rows] = cols
+
+    return mapping
+
+
+# clusters of one province over the years
+# x_years: {year: shares frame}; ks: k values to sweep on the first year, or None to use k
+# returns ({year: labels Series by District}, {year: model}, k)
+
+def cluster_province(x_years, k=3, seed=0, ks=None):
+
+    years = list(x_years)
+
+    if ks is not None:
+        scores = silhouette_sweep(x_years[years[0]], ks, seed, n_jobs=1)
+        k = int(scores.idxmax()) if len(scores) else k
+
+    labels, models = {}, {}
+    reference = None
+
+    for year in years:
+        x = x_years[year]
+        model = fit(x, k, seed)
+        mapping = align(model.cluster_centers_, reference)
+
+        labels[year] = pd.Series(mapping[model.labels_], index=x.index, name='Riding_type')
+        models[year] = model
+
+        reference = np.empty_like(model.cluster_centers_)
+        reference[mapping] = model.cluster_centers_
+
+    return labels, models, k
+
+
+# riding types of every province & year
+# frames: {year: datasheet}; returns a District, Year, Province, Riding_type frame & the models by (province, year)
+# provinces run in parallel, each one through the stage cache; the stages recorded by the workers are merged back
+
+@instrument.staged()
+def cluster_all(frames, k=3, seed=0, ks=None, provinces=None, n_jobs=None):
+
+    import sklearn
+
+    years = list(frames)
+    x = {year: shares(df) for year, df in frames.items()}
+    province_of = pd.concat([df.set_index('District')['Province'].astype(str) for df in frames.values()])
+    province_of = province_of[~province_of.index.duplicated()]
+    provinces = provinces or sorted(province_of.unique())
+
+    def inputs(province):
+        codes = province_of.index[province_of == province]
+        return {year: x[year].loc[x[year].index.intersection(codes)] for year in years}
+
+    # pickled models are only valid for the sklearn version that fitted them
+    key = [stagecache.source_hash(sys.modules[__name__]), sklearn.__version__]
+    trace_settings = dict(instrument.settings)
+
+    collected = Parallel(n_jobs=n_jobs)(
+        delayed(instrument.collect)(
+            trace_settings, stagecache.run, 'cluster_province', cluster_province, inputs(province), k, seed, ks, key=key,
+        )
+        for province in provinces
+    )
+
+    for _, records in collected:
+        instrument.merge(records)
+
+    results = [result for result, _ in collected]
+
+    rows, models = [], {}
+
+    for province, (labels, fitted, _) in zip(provinces, results):
+        for year in years:
+            rows.append(labels[year].reset_index().assign(Year=year, Province=province))
+            models[province, year] = fitted[year]
+
+    table = pd.concat(rows, ignore_index=True)[['District', 'Year', 'Province', 'Riding_type']]
+
+    return table, models
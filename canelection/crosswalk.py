@@ -0,0 +1,128 @@
+# redistribution crosswalks between representation orders
+# cross-year analyses line EDs up by ED code, which only holds within one representation order (2004-2011: 2003 order, 308 EDs)
+# a crosswalk holds the overlap weights between the EDs of 2 orders (population- or poll-based) as a sparse matrix:
+# - rows are the EDs of the new order, columns the EDs of the old order
+# - column j gives the shares of old ED j going to each new ED, summing to 1
+# a whole ED x party vote matrix is transposed with one sparse matrix product, giving "notional" results on the new boundaries
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from canelection import instrument, pipeline
+
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
+COUNTS = ['Total Voters', 'Liberal', 'Conservative', 'NDP', 'BQ', 'Others', 'Total Votes']
+
+
+class Crosswalk:
+
+    def __init__(self, old_codes, new_codes, matrix):
+
+        self.old_codes = np.asarray(old_codes)
+        self.new_codes = np.asarray(new_codes)
+        self.matrix = sparse.csr_matrix(matrix)
+
+    # overlaps: one row per (old ED, new ED) pair with the overlap size (population, electors or votes) or share
+    # weights are normalised so the shares of every old ED sum to 1
+
+    @classmethod
+    def from_overlaps(cls, overlaps, old='From', new='To', weight='Weight'):
+
+        old_codes, old_pos = np.unique(overlaps[old].to_numpy(), return_inverse=True)
+        new_codes, new_pos = np.unique(overlaps[new].to_numpy(), return_inverse=True)
+        weights = overlaps[weight].to_numpy(dtype=float)
+
+        totals = np.bincount(old_pos, weights=weights, minlength=len(old_codes))
+        shares = weights / totals[old_pos]
+
+        matrix = sparse.coo_matrix((shares, (new_pos, old_pos)), shape=(len(new_codes), len(old_codes)))
+
+        return cls(old_codes, new_codes, matrix)
+
+    @classmethod
+    def read_csv(cls, path, **kwargs):
+
+        return cls.from_overlaps(pd.read_csv(path), **kwargs)
+
+    @classmethod
+    def identity(cls, codes):
+
+        codes = np.sort(np.asarray(codes))
+
+        return cls(codes, codes, sparse.identity(len(codes), format='csr'))
+
+    # chaining: old -> self -> other in one matrix, e.g. 2003 order -> 2013 order -> 2023 order
+    # raises ValueError for new EDs of self missing from other
+
+    def then(self, other):
+
+        # the old EDs of other are matched to the new EDs of self by ED code
+        pos = pd.Index(other.old_codes).get_indexer(self.new_codes)
+        if (pos < 0).any():
+            missing = self.new_codes[pos < 0]
+            raise ValueError(f'{len(missing)} EDs missing from the chained crosswalk: {missing[:10].tolist()}')
+        found = np.flatnonzero(pos >= 0)
+        select = sparse.csr_matrix(
+            (np.ones(len(found)), (pos[found], found)),
+            shape=(len(other.old_codes), len(self.new_codes)),
+        )
+
+        return Crosswalk(self.old_codes, other.new_codes, other.matrix @ select @ self.matrix)
+
+    # transpose the count columns of an ED-level frame (District column + counts) onto the new EDs
+    # raises ValueError for EDs of df missing from the crosswalk, whose votes would otherwise be dropped from the totals
+
+    def transpose(self, df, columns=None):
+
+        missing = np.setdiff1d(df['District'].to_numpy(), self.old_codes)
+        if len(missing):
+            raise ValueError(f'{len(missing)} EDs missing from the crosswalk: {missing[:10].tolist()}')
+
+        columns = columns or [col for col in COUNTS if col in df]
+        values = (
+            df.set_index('District')[columns]
+            .reindex(self.old_codes)
+            .fillna(0)
+            .to_numpy(dtype=float)
+        )
+
+        result = pd.DataFrame(self.matrix @ values, columns=columns)
+        result.insert(0, 'District', self.new_codes)
+
+        return result
+
+
+# notional yearly datasheet on the new boundaries
+# counts are transposed, the winner is the party with the most notional votes, province follows the new ED codes
+
+def notional(df, crosswalk):
+
+    result = crosswalk.transpose(df)
+    parties = [party for party in PARTIES if party in result]
+
+    result['Elected'] = result[parties].idxmax(axis=1)
+    result['Province'] = (result['District'] // 1000).map(pipeline.pt_dict)
+
+    return result[[col for col in df.columns if col in result]]
+
+
+# crosswalk files are named <old order>_<new order>.csv in the crosswalk directory
+
+def load(old_order, new_order, directory='./crosswalks'):
+
+    return Crosswalk.read_csv(os.path.join(directory, f'{old_order}_{new_order}.csv'))
+
+
+# align a yearly datasheet of an election held under old_order onto the EDs of new_order
+# datasheets already on the new order are returned unchanged
+
+@instrument.staged('crosswalk.align')
+def align(df, old_order, new_order, directory='./crosswalks'):
+
+    if old_order == new_order:
+        return df
+
+    return notional(df, load(old_order, new_order, directory))
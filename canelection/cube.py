@@ -0,0 +1,215 @@
+# pre-aggregated results cube of the collected elections
+# year x province x party arrays of votes & seats, with electors (Total Voters) & valid ballots (Total Votes) by year x province
+# the cube is built once from the yearly datasheets by part 1 & stored next to them as cube.npz, with its years & a fingerprint
+# of the datasheets; a stored cube of other years or older datasheets is rebuilt from the datasheets when read
+# vote counts of aligned datasheets (notional votes, canelection/crosswalk.py) are fractional: summed as floats, then rounded
+# roll-ups (national, per province, per party, shares, seat counts) are sums over the small arrays, cached once computed
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument, storage
+from canelection.elections import ELECTIONS
+
+PROVINCES = storage.PROVINCES
+PARTIES = storage.PARTIES
+
+
+class ResultsCube:
+
+    def __init__(self, years, votes, seats, electors, ballots, provinces=PROVINCES, parties=PARTIES, source=None):
+
+        self.years = [str(year) for year in years]
+        self.provinces = list(provinces)
+        self.parties = list(parties)
+        self.votes = np.asarray(votes) # year x province x party
+        self.seats = np.asarray(seats) # year x province x party
+        self.electors = np.asarray(electors) # year x province
+        self.ballots = np.asarray(ballots) # year x province
+        self.source = source # fingerprint of the datasheets, when stored
+        self._rollups = {}
+
+    # frames: {year: datasheet}, ED-level rows are summed into their province with one scatter-add per year
+
+    @classmethod
+    @instrument.staged('ResultsCube.from_frames')
+    def from_frames(cls, frames, provinces=PROVINCES, parties=PARTIES):
+
+        shape = (len(frames), len(provinces), len(parties))
+        votes = np.zeros(shape)
+        seats = np.zeros(shape, dtype=np.int64)
+        electors = np.zeros(shape[:2])
+        ballots = np.zeros(shape[:2])
+
+        for i, df in enumerate(frames.values()):
+            pt = pd.Categorical(df['Province'], categories=provinces).codes
+            elected = pd.Categorical(df['Elected'], categories=parties).codes
+            found = pt >= 0
+
+            np.add.at(votes[i], pt[found], df[parties].to_numpy(dtype=float)[found])
+            np.add.at(seats[i], (pt[found & (elected >= 0)], elected[found & (elected >= 0)]), 1)
+            np.add.at(electors[i], pt[found], df['Total Voters'].to_numpy(dtype=float)[found])
+            np.add.at(ballots[i], pt[found], df['Total Votes'].to_numpy(dtype=float)[found])
+
+        votes, electors, ballots = (np.rint(counts).astype(np.int64) for counts in (votes, electors, ballots))
+
+        return cls(frames.keys(), votes, seats, electors, ballots, provinces, parties)
+
+    def _cached(self, key, func):
+
+        if key not in self._rollups:
+            self._rollups[key] = func()
+
+        return self._rollups[key]
+
+    def _year(self, year):
+
+        return self.years.index(str(year))
+
+    # vote counts by province of one year, laid out as the province groupby of the yearly datasheet:
+    # Total Voters, the parties & Total Votes by Province
+
+    def by_province(self, year):
+
+        def rollup():
+            i = self._year(year)
+            df = pd.DataFrame(self.votes[i], index=pd.Index(self.provinces, name='Province'), columns=self.parties)
+            df.insert(0, 'Total Voters', self.electors[i])
+            df['Total Votes'] = self.ballots[i]
+            return df
+
+        return self._cached(('by_province', str(year)), rollup)
+
+    # nationwide vote counts by year, same columns
+
+    def national(self):
+
+        def rollup():
+            df = pd.DataFrame(self.votes.sum(axis=1), index=pd.Index(self.years, name='Year'), columns=self.parties)
+            df.insert(0, 'Total Voters', self.electors.sum(axis=1))
+            df['Total Votes'] = self.ballots.sum(axis=1)
+            return df
+
+        return self._cached(('national',), rollup)
+
+    # vote counts by year of one province, same columns
+
+    def history(self, province):
+
+        def rollup():
+            j = self.provinces.index(province)
+            df = pd.DataFrame(self.votes[:, j], index=pd.Index(self.years, name='Year'), columns=self.parties)
+            df.insert(0, 'Total Voters', self.electors[:, j])
+            df['Total Votes'] = self.ballots[:, j]
+            return df
+
+        return self._cached(('history', province), rollup)
+
+    # vote shares of the parties by year (nationwide), or by province of one year
+
+    def shares(self, year=None):
+
+        def rollup():
+            counts = self.national() if year is None else self.by_province(year)
+            return counts[self.parties].div(counts['Total Votes'], axis=0)
+
+        return self._cached(('shares', year and str(year)), rollup)
+
+    # seats won by the parties by year (nationwide), or by province of one year
+
+    def seat_counts(self, year=None):
+
+        def rollup():
+            if year is None:
+                return pd.DataFrame(self.seats.sum(axis=1), index=self.years, columns=self.parties)
+            return pd.DataFrame(
+                self.seats[self._year(year)], index=pd.Index(self.provinces, name='Province'), columns=self.parties,
+            )
+
+        return self._cached(('seat_counts', year and str(year)), rollup)
+
+    # seats won by the parties by year in one province
+
+    def seat_history(self, province):
+
+        def rollup():
+            j = self.provinces.index(province)
+            return pd.DataFrame(self.seats[:, j], index=self.years, columns=self.parties)
+
+        return self._cached(('seat_history', province), rollup)
+
+    # one party across years & provinces, votes or seats
+
+    def party(self, party, measure='votes'):
+
+        def rollup():
+            values = getattr(self, measure)[:, :, self.parties.index(party)]
+            return pd.DataFrame(values, index=pd.Index(self.years, name='Year'), columns=self.provinces)
+
+        return self._cached(('party', party, measure), rollup)
+
+    def save(self, path, source=None):
+
+        np.savez(
+            path,
+            source=np.array(source or ''),
+            years=np.array(self.years),
+            provinces=np.array(self.provinces),
+            parties=np.array(self.parties),
+            votes=self.votes,
+            seats=self.seats,
+            electors=self.electors,
+            ballots=self.ballots,
+        )
+
+    @classmethod
+    def load(cls, path):
+
+        with np.load(path) as f:
+            return cls(
+                f['years'].tolist(), f['votes'], f['seats'], f['electors'], f['ballots'],
+                f['provinces'].tolist(), f['parties'].tolist(), str(f['source']) if 'source' in f else None,
+            )
+
+
+# fingerprint of the yearly datasheets of years in directory: name, size & modification time of the file of each year
+
+def source_fingerprint(years, directory='.'):
+
+    h = hashlib.sha256()
+
+    for year in years:
+        path = storage.source_path(str(year), directory)
+        stat = os.stat(path) if os.path.exists(path) else None
+        h.update(repr((str(year), os.path.basename(path), stat and (stat.st_size, stat.st_mtime_ns))).encode())
+
+    return h.hexdigest()
+
+
+# the cube is stored next to the yearly datasheets it was built from
+
+@instrument.staged()
+def write_cube(cube, directory='.'):
+
+    cube.save(os.path.join(directory, 'cube.npz'), source_fingerprint(cube.years, directory))
+
+    return cube
+
+
+# read the stored cube, or build it from the yearly datasheets when it is missing, of other years or older than the datasheets
+
+@instrument.staged()
+def read_cube(years=None, directory='.'):
+
+    years = [str(year) for year in years or sorted(ELECTIONS)]
+    path = os.path.join(directory, 'cube.npz')
+
+    if os.path.exists(path):
+        results = ResultsCube.load(path)
+        if results.years == years and results.source == source_fingerprint(years, directory):
+            return results
+
+    return ResultsCube.from_frames(storage.read_years(years, directory=directory))
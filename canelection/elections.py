@@ -0,0 +1,48 @@
+# registry of the federal general elections collected by part 1
+# adding an election only takes a new entry here:
+# - table12 / table11: urls of the Table 12 (candidate results) & Table 11 (voters & ballots) pages
+# - ridings: url of the ED code / ED name list page
+# - order: representation order the EDs of the election follow; EDs of the same order share codes
+
+def _riding_list_url(number):
+
+    return f'https://www.elections.ca/content.aspx?section=res&dir=rep/off/{number}gedata&document=byed&lang=e'
+
+
+ELECTIONS = {
+    '2004': {
+        'table12': 'https://www.elections.ca/scripts/ovr2004/23/table12.html',
+        'table11': 'https://www.elections.ca/scripts/OVR2004/23/table11.html',
+        'ridings': _riding_list_url(38),
+        'order': '2003',
+    },
+    '2006': {
+        'table12': 'https://www.elections.ca/scripts/OVR2006/25/table12.html',
+        'table11': 'https://www.elections.ca/scripts/OVR2006/25/table11.html',
+        'ridings': _riding_list_url(39),
+        'order': '2003',
+    },
+    '2008': {
+        'table12': 'https://www.elections.ca/scripts/OVR2008/31/table12.html',
+        'table11': 'https://www.elections.ca/scripts/OVR2008/31/table11.html',
+        'ridings': _riding_list_url(40),
+        'order': '2003',
+    },
+    '2011': {
+        'table12': 'https://www.elections.ca/scripts/ovr2011/34/table12.html',
+        'table11': 'https://www.elections.ca/scripts/OVR2011/34/table11.html',
+        'ridings': _riding_list_url(41),
+        'order': '2003',
+    },
+}
+
+
+# all page urls of the given elections, for the fetch stage
+
+def page_urls(elections=ELECTIONS):
+
+    return [
+        election[page]
+        for election in elections.values()
+        for page in ('table12', 'table11', 'ridings')
+    ]
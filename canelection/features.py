@@ -0,0 +1,201 @@
+# feature store of the machine learning stage (part 3)
+# features of every (base year, target year) pair of the collected elections are materialised once:
+# - features of the base year: turnout, winner code, Conservative, Liberal & NDP support rates (%)
+# - target: Conservative support rate (%) of the target year
+# base & target rows are joined on District explicitly (EDs of both years only), never by position
+# every pair is stored under <directory>/<base>_<target>/ as uncompressed .npy arrays:
+#   district.npy (int32), province.npy (int8 codes of storage.PROVINCES), X.npy (rows x features), y.npy
+# rows are sorted by province & District, index.json holds the feature columns & the row range of every province,
+# so the rows of a province are a zero-copy slice of the memory-mapped arrays
+# a pair is only rebuilt when the hash of its input datasheets changes
+
+import json
+import os
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument, stagecache, storage
+
+PROVINCES = storage.PROVINCES
+COLUMNS = ['Turnout', 'Elected', 'support', 'LIB', 'NDP']
+ELECTED_CODES = {'Conservative': 0, 'Liberal': 1, 'NDP': 2, 'BQ': 3, 'Others': 4}
+ARRAYS = ['district', 'province', 'X', 'y']
+
+
+def pairs(years):
+
+    return list(combinations(sorted(str(year) for year in years), 2))
+
+
+def _path(base, target, directory):
+
+    return os.path.join(directory, f'{base}_{target}')
+
+
+# features & target of the EDs of both datasheets
+# returns {array name: array} with rows sorted by province & District, and the row range of every province
+
+def compute(base, target):
+
+    joined = base[['District', 'Province', 'Total Voters', 'Total Votes', 'Liberal', 'Conservative', 'NDP', 'Elected']].merge(
+        target[['District', 'Conservative', 'Total Votes']],
+        on='District', how='inner', suffixes=('', ' Target'), validate='one_to_one',
+    )
+
+    province = pd.Categorical(joined['Province'], categories=PROVINCES).codes.astype(np.int8)
+    district = joined['District'].to_numpy(dtype=np.int32)
+    order = np.lexsort((district, province))
+    joined = joined.iloc[order]
+
+    votes = joined['Total Votes'].to_numpy(dtype=float)
+    x = np.column_stack([
+        votes / joined['Total Voters'].to_numpy(dtype=float) * 100,
+        joined['Elected'].astype(object).map(ELECTED_CODES).to_numpy(dtype=float),
+        joined['Conservative'].to_numpy(dtype=float) / votes * 100,
+        joined['Liberal'].to_numpy(dtype=float) / votes * 100,
+        joined['NDP'].to_numpy(dtype=float) / votes * 100,
+    ])
+    y = joined['Conservative Target'].to_numpy(dtype=float) / joined['Total Votes Target'].to_numpy(dtype=float) * 100
+
+    province = province[order]
+    bounds = np.searchsorted(province, np.arange(len(PROVINCES) + 1))
+    ranges = {pt: [int(bounds[i]), int(bounds[i + 1])] for i, pt in enumerate(PROVINCES) if bounds[i] < bounds[i + 1]}
+
+    return {'district': district[order], 'province': province, 'X': np.ascontiguousarray(x), 'y': y}, ranges
+
+
+def _read_index(path):
+
+    try:
+        with open(os.path.join(path, 'index.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_pair(base, target, base_year, target_year, directory='./features', source=None):
+
+    path = _path(base_year, target_year, directory)
+    os.makedirs(path, exist_ok=True)
+
+    arrays, ranges = compute(base, target)
+
+    for name, values in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), values)
+
+    # index.json is written last, a pair without it is incomplete
+    index = {
+        'base': base_year,
+        'target': target_year,
+        'columns': COLUMNS,
+        'rows': len(arrays['y']),
+        'provinces': ranges,
+        'source': source or stagecache.fingerprint(base, target),
+    }
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+
+    return path
+
+
+# features of every base < target pair of frames ({year: datasheet}), skipping pairs whose datasheets did not change
+# returns the built & skipped pairs
+
+@instrument.staged('features.build')
+def build(frames, directory='./features', force=False):
+
+    frames = {str(year): df for year, df in frames.items()}
+    built, skipped = [], []
+
+    for base_year, target_year in pairs(frames):
+        source = stagecache.fingerprint(stagecache.source_hash(compute), frames[base_year], frames[target_year])
+        index = _read_index(_path(base_year, target_year, directory))
+
+        if not force and index is not None and index['source'] == source:
+            skipped.append((base_year, target_year))
+            continue
+
+        write_pair(frames[base_year], frames[target_year], base_year, target_year, directory, source)
+        built.append((base_year, target_year))
+
+    return {'built': built, 'skipped': skipped}
+
+
+class FeatureSet:
+
+    def __init__(self, path, mmap_mode='r'):
+
+        index = _read_index(path)
+
+        if index is None:
+            raise FileNotFoundError(f'no feature set under {path}')
+
+        self.path = path
+        self.base = index['base']
+        self.target = index['target']
+        self.columns = index['columns']
+        self.ranges = index['provinces']
+
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+
+    def __len__(self):
+
+        return len(self.y)
+
+    @property
+    def provinces(self):
+
+        return list(self.ranges)
+
+    def rows(self, province=None):
+
+        if province is None:
+            return slice(0, len(self))
+
+        start, stop = self.ranges.get(province, (0, 0))
+
+        return slice(start, stop)
+
+    # (district, X, y) of a province (or of all rows), views of the memory-mapped arrays
+
+    def arrays(self, province=None):
+
+        rows = self.rows(province)
+
+        return self.district[rows], self.X[rows], self.y[rows]
+
+    # frame of the features of a province as built by part 3, e.g. District, Turnout, 08_Elected, 08_support, ..., Target
+    # prefix defaults to the last 2 digits of the base year
+
+    def frame(self, province=None, prefix=None):
+
+        prefix = prefix or self.base[-2:]
+        district, x, y = self.arrays(province)
+        columns = [col if col == 'Turnout' else f'{prefix}_{col}' for col in self.columns]
+
+        df = pd.DataFrame(x, columns=columns)
+        df.insert(0, 'District', district)
+        df['Target'] = y
+
+        return df
+
+
+# design matrix of the models of part 3: base year features, one-hot riding types & (pooled model) one-hot provinces
+# shared by the model search & the batch evaluation, so the configuration searched is the one evaluated
+
+def design(x, rd_type, n_types, province=None):
+
+    columns = [np.asarray(x, dtype=float), np.eye(n_types)[np.asarray(rd_type, dtype=np.int64)]]
+
+    if province is not None:
+        columns.append(np.eye(len(PROVINCES))[province])
+
+    return np.hstack(columns)
+
+
+def load(base, target, directory='./features', mmap_mode='r'):
+
+    return FeatureSet(_path(str(base), str(target), directory), mmap_mode)
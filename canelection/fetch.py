@@ -0,0 +1,226 @@
+# concurrent fetch stage for the Elections Canada pages
+# all pages are pulled at the same time by a bounded thread pool, sharing one keep-alive session:
+# - connections are pooled & reused per host, with a limit of concurrent requests per host
+# - gzip transfer is requested & decoded
+# - connection errors, 429 & 5xx responses are retried with exponential backoff
+
+import gzip
+import http.client
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlsplit
+
+from canelection import archive, instrument
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+
+
+# failed: {url: error} of the pages that could not be fetched, pages: {url: page bytes} of those that were
+
+class FetchError(Exception):
+
+    def __init__(self, message, failed=None, pages=None):
+
+        super().__init__(message)
+        self.failed = failed or {}
+        self.pages = pages or {}
+
+
+class Session:
+
+    def __init__(self, per_host=4, timeout=60, retries=3, backoff=0.5, max_redirects=5):
+
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_redirects = max_redirects
+
+        self._idle = {} # (scheme, host, port) -> idle keep-alive connections
+        self._slots = {} # (scheme, host, port) -> semaphore limiting concurrent requests
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+    def _slot(self, key):
+
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[key]
+
+    def _acquire(self, key):
+
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _release(self, key, conn):
+
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def close(self):
+
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+    # one request on a pooled connection, returns (status, headers, body)
+    def _request(self, key, target):
+
+        conn = self._acquire(key)
+
+        try:
+            conn.request('GET', target, headers={
+                'Accept-Encoding': 'gzip, deflate',
+                'Connection': 'keep-alive',
+                'User-Agent': 'Mozilla/5.0',
+            })
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+        return response.status, response.headers, body
+
+    def get(self, url):
+
+        for _ in range(self.max_redirects + 1):
+
+            parts = urlsplit(url)
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+            key = (parts.scheme, parts.hostname, port)
+            target = parts.path or '/'
+            if parts.query:
+                target += '?' + parts.query
+
+            error = None
+
+            with self._slot(key):
+                for attempt in range(self.retries + 1):
+
+                    if attempt:
+                        time.sleep(self.backoff * 2 ** (attempt - 1))
+
+                    try:
+                        status, headers, body = self._request(key, target)
+                    except (OSError, http.client.HTTPException) as e:
+                        error = e
+                        continue
+
+                    if status in RETRY_STATUS:
+                        error = FetchError(f'{url} returned HTTP {status}')
+                        continue
+
+                    break
+                else:
+                    raise FetchError(f'{url} failed after {self.retries + 1} attempts') from error
+
+            if status in REDIRECT_STATUS and headers.get('Location'):
+                url = urljoin(url, headers['Location'])
+                continue
+
+            if status >= 400:
+                raise FetchError(f'{url} returned HTTP {status}')
+
+            encoding = (headers.get('Content-Encoding') or '').lower()
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            elif encoding == 'deflate':
+                body = zlib.decompress(body)
+
+            return body
+
+        raise FetchError(f'{url} redirected more than {self.max_redirects} times')
+
+
+# fetch all urls at once, returns a {url: page bytes} dict
+# wall-clock time is bound by the slowest page rather than the sum of all pages
+# on_page(url, content) is called for every page as soon as it arrives, so a failing url does not lose the others;
+# failed urls are reported together at the end, in one FetchError carrying the pages that were fetched
+
+def fetch_all(urls, max_workers=16, session=None, on_page=None, **session_args):
+
+    urls = list(dict.fromkeys(urls))
+    own_session = session is None
+    session = session or Session(**session_args)
+    pages, failed = {}, {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as pool:
+            futures = {pool.submit(session.get, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    pages[url] = future.result()
+                except (FetchError, OSError, http.client.HTTPException, zlib.error) as e:
+                    failed[url] = e
+                    continue
+                if on_page is not None:
+                    on_page(url, pages[url])
+    finally:
+        if own_session:
+            session.close()
+
+    if failed:
+        lines = '\n'.join(f'  {url}: {error}' for url, error in failed.items())
+        raise FetchError(f'{len(failed)} of {len(urls)} pages could not be fetched:\n{lines}', failed, pages)
+
+    # in the order of urls
+    return {url: pages[url] for url in urls}
+
+
+# fetch stage in front of the page archive
+# only pages the archive mode would download are fetched ('refresh': all of them, 'replay': missing ones)
+# fetched pages are recorded as they arrive, so the loaders afterwards parse them from the archive
+# pages fetched before a failure stay recorded, the FetchError lists the failed urls
+
+@instrument.staged()
+def prefetch(urls, archive_dir=None, mode=None, **fetch_args):
+
+    archive_dir = archive_dir or archive.settings['archive_dir']
+    mode = mode or archive.settings['mode']
+
+    if mode == 'offline':
+        return {}
+
+    if mode == 'refresh':
+        todo = list(urls)
+    else:
+        todo = [url for url in urls if archive.lookup(url, archive_dir) is None]
+
+    if not todo:
+        return {}
+
+    recorded = {}
+
+    def record(url, content):
+        recorded[url] = archive.record(url, content, archive_dir)
+
+    fetch_all(todo, on_page=record, **fetch_args)
+
+    return recorded
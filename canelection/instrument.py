@@ -0,0 +1,275 @@
+# per-stage instrumentation of the 3 parts
+# every stage (page fetches, table parsing, summary stages, stage cache lookups, cube, charts, models, ...) records:
+# - wall time & CPU time (of the process, worker processes record their own stages)
+# - peak memory above the memory in use at the start of the stage, traced by tracemalloc (optional, it slows Python code down)
+# - rows in & rows out: lengths of the DataFrames / Series / arrays passed in & returned (also inside dicts, lists & tuples)
+# stages nest: a stage run inside another is its child, its time is included in the parent & removed from the parent's self time
+# records are written as a Chrome trace (chrome://tracing, ui.perfetto.dev) & summarised in a table by stage
+# instrumentation is off unless ELECTIONS_TRACE is set or configure(enabled=True) is called;
+# when off, a stage costs a dict lookup & a direct call of the stage function
+
+import contextlib
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+settings = {
+    'enabled': os.environ.get('ELECTIONS_TRACE', '0') not in ('', '0'),
+    'memory': os.environ.get('ELECTIONS_TRACE_MEMORY', '1') not in ('', '0'),
+}
+
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+def configure(enabled=None, memory=None):
+
+    if enabled is not None:
+        settings['enabled'] = enabled
+    if memory is not None:
+        settings['memory'] = memory
+
+    if not settings['enabled'] or not settings['memory']:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    return dict(settings)
+
+
+# total length of the DataFrames, Series & arrays in obj, looking depth levels deep into dicts, lists & tuples
+
+def rows(obj, depth=2):
+
+    shape = getattr(obj, 'shape', None)
+
+    if shape is not None:
+        return int(shape[0]) if len(shape) else 0
+    if depth == 0:
+        return 0
+    if isinstance(obj, dict):
+        obj = obj.values()
+    elif not isinstance(obj, (list, tuple)):
+        return 0
+
+    return sum(rows(item, depth - 1) for item in obj)
+
+
+def _stack():
+
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+
+    return _local.stack
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None, **args):
+
+    if not settings['enabled']:
+        yield {'args': {}}
+        return
+
+    stack = _stack()
+    memory = settings['memory']
+    base = 0
+
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        base, peak = tracemalloc.get_traced_memory()
+        # the peak of the parent so far is kept, the tracemalloc peak is restarted for this stage
+        if stack:
+            stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+        tracemalloc.reset_peak()
+
+    record = {
+        'id': f'{os.getpid()}:{next(_ids)}', # unique across the worker processes
+        'parent': stack[-1]['id'] if stack else None,
+        'name': name,
+        'ts': time.time_ns() // 1000,
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'rows_in': rows_in,
+        'rows_out': None,
+        'args': args,
+        '_peak': base,
+    }
+    stack.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+
+    try:
+        yield record
+    finally:
+        record['wall'] = time.perf_counter() - wall
+        record['cpu'] = time.process_time() - cpu
+        stack.pop()
+
+        peak = record.pop('_peak')
+        if memory and tracemalloc.is_tracing():
+            record['peak'] = max(peak, tracemalloc.get_traced_memory()[1]) - base
+        else:
+            record['peak'] = None
+
+        with _lock:
+            _records.append(record)
+
+
+# extra values on the current stage, e.g. annotate(cached=True)
+
+def annotate(**values):
+
+    if settings['enabled'] and _stack():
+        _stack()[-1]['args'].update(values)
+
+
+# run a stage: run('get_vote_count', get_vote_count, df) -> get_vote_count(df)
+
+def run(name, func, *args, **kwargs):
+
+    if not settings['enabled']:
+        return func(*args, **kwargs)
+
+    with stage(name, rows(args, 3) + rows(kwargs, 3)) as record:
+        result = func(*args, **kwargs)
+        record['rows_out'] = rows(result, 3)
+
+    return result
+
+
+# decorator form of run(), named after the function unless a name is given
+
+def staged(name=None):
+
+    def decorate(func):
+
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not settings['enabled']:
+                return func(*args, **kwargs)
+            return run(label, func, *args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def records():
+
+    with _lock:
+        return list(_records)
+
+
+def clear():
+
+    with _lock:
+        _records.clear()
+
+
+def merge(new_records):
+
+    with _lock:
+        _records.extend(new_records)
+
+
+# run func in a worker process with the instrumentation settings of the parent
+# returns (result, records of the stages run by func), the records are merged() back by the parent
+
+def collect(parent_settings, func, *args, **kwargs):
+
+    configure(**parent_settings)
+
+    with _lock:
+        start = len(_records)
+
+    result = func(*args, **kwargs)
+
+    with _lock:
+        new_records = _records[start:]
+        del _records[start:]
+
+    return result, new_records
+
+
+# Chrome trace events ("X" complete events, microseconds)
+
+def chrome_trace(stage_records=None):
+
+    stage_records = records() if stage_records is None else stage_records
+
+    events = [
+        {
+            'name': record['name'],
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': record['ts'],
+            'dur': round(record['wall'] * 1e6),
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': {
+                'cpu_ms': round(record['cpu'] * 1e3, 3),
+                'peak_kib': None if record['peak'] is None else round(record['peak'] / 1024, 1),
+                'rows_in': record['rows_in'],
+                'rows_out': record['rows_out'],
+                **record['args'],
+            },
+        }
+        for record in sorted(stage_records, key=lambda record: record['ts'])
+    ]
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms', 'stages': stage_records}
+
+
+def write(path, stage_records=None):
+
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(stage_records), f, default=str)
+
+    return path
+
+
+# calls, wall, self & CPU time, largest peak memory & rows by stage, slowest first
+
+def summary(stage_records=None):
+
+    import pandas as pd
+
+    stage_records = records() if stage_records is None else stage_records
+
+    if not stage_records:
+        return pd.DataFrame(columns=['Calls', 'Wall (s)', 'Self (s)', 'CPU (s)', 'Peak (MiB)', 'Rows In', 'Rows Out'])
+
+    df = pd.DataFrame(stage_records)
+    children = df.groupby('parent')['wall'].sum()
+    df['self'] = df['wall'] - df['id'].map(children).fillna(0.0)
+
+    table = df.groupby('name').agg(
+        **{
+            'Calls': ('id', 'size'),
+            'Wall (s)': ('wall', 'sum'),
+            'Self (s)': ('self', 'sum'),
+            'CPU (s)': ('cpu', 'sum'),
+            'Peak (MiB)': ('peak', 'max'),
+            'Rows In': ('rows_in', 'sum'),
+            'Rows Out': ('rows_out', 'sum'),
+        }
+    )
+    table['Peak (MiB)'] = table['Peak (MiB)'] / 2 ** 20
+
+    return table.rename_axis('Stage').sort_values('Wall (s)', ascending=False)
+
+
+# trace file & summary table of the stages recorded so far
+
+def report(path='trace.json'):
+
+    write(path)
+
+    return summary()
@@ -0,0 +1,88 @@
+# load test of the query service (canelection/service.py)
+# concurrent clients replay a mix of riding, flip-history, province & search queries over keep-alive connections
+# reports throughput and latency percentiles (p50, p90, p99, max) in milliseconds
+#
+# python -m canelection.loadtest --url http://127.0.0.1:8765 --clients 32 --requests 20000
+
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from canelection import fetch
+
+
+# query paths drawn from the ridings, provinces & years the service knows
+
+def query_mix(session, url, n, seed=0):
+
+    provinces = ['NL', 'PE', 'NS', 'NB', 'QC', 'ON', 'MB', 'SK', 'AB', 'BC', 'Territories']
+    years = json.loads(session.get(f'{url}/health'))['years']
+    codes = [
+        code
+        for province in provinces
+        for code in json.loads(session.get(f'{url}/province/{province}'))['Districts']
+    ]
+
+    rng = random.Random(seed)
+    paths = []
+
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.5:
+            paths.append(f'/riding/{rng.choice(codes)}?year={rng.choice(years)}')
+        elif kind < 0.8:
+            paths.append(f'/flips/{rng.choice(codes)}')
+        elif kind < 0.95:
+            paths.append(f'/province/{rng.choice(provinces)}?year={rng.choice(years)}')
+        else:
+            paths.append(f'/riding/{rng.choice(codes)}')
+
+    return paths
+
+
+def run(url='http://127.0.0.1:8765', clients=32, requests=20000, seed=0):
+
+    url = url.rstrip('/')
+
+    with fetch.Session(per_host=clients, retries=0) as session:
+        paths = query_mix(session, url, requests, seed)
+
+        def timed(path):
+            start = time.perf_counter()
+            session.get(url + path)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = np.fromiter(pool.map(timed, paths), dtype=float, count=len(paths)) * 1000
+        wall = time.perf_counter() - start
+
+    return {
+        'requests': len(paths),
+        'clients': clients,
+        'seconds': wall,
+        'throughput': len(paths) / wall,
+        'p50': float(np.percentile(latencies, 50)),
+        'p90': float(np.percentile(latencies, 90)),
+        'p99': float(np.percentile(latencies, 99)),
+        'max': float(latencies.max()),
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='load test of the query service')
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.url, args.clients, args.requests, args.seed)
+
+    print(f"{report['requests']} requests, {report['clients']} clients, {report['seconds']:.1f} s, {report['throughput']:.0f} req/s")
+    print(f"latency ms: p50 {report['p50']:.2f}  p90 {report['p90']:.2f}  p99 {report['p99']:.2f}  max {report['max']:.2f}")
@@ -0,0 +1,201 @@
+# cross-validated search of the polynomial regression of part 3
+# - stratified k-fold on the riding types (canelection/clustering.py), seeded
+# - grid over the polynomial degree & the model: ordinary least squares, ridge & lasso with a range of alphas
+# - the polynomial expansion & the scaling are fitted on the training rows of a fold only, once per (fold, degree);
+#   all models of the grid are fitted on that one expansion: ridge for all alphas from one SVD,
+#   lasso for all alphas along one warm-started path
+# - (fold, degree) tasks of all provinces run in parallel with joblib, the stages recorded by the workers are merged back
+# returns a tidy table (one row per configuration, mean & std of the fold MSEs, rank) & the best configuration
+# refitted on all rows as a scikit-learn Pipeline
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from canelection import instrument
+
+DEGREES = range(1, 7)
+ALPHAS = np.logspace(-3, 2, 11)
+MODELS = ('linear', 'ridge', 'lasso')
+COLUMNS = ['Model', 'Alpha', 'Degree', 'MSE', 'MSE Std', 'Folds', 'Rank'] # of the results table
+
+
+def folds(strata, n_splits=5, seed=0):
+
+    from sklearn.model_selection import StratifiedKFold
+
+    strata = np.asarray(strata)
+    n_splits = min(n_splits, int(np.unique(strata, return_counts=True)[1].max()))
+
+    if n_splits < 2:
+        return []
+
+    return list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed).split(np.zeros(len(strata)), strata))
+
+
+# polynomial expansion of x of one degree, standardised with the mean & std of the training rows
+
+def expand(x, train, degree):
+
+    from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+    poly = PolynomialFeatures(degree=degree, include_bias=False).fit(x[train])
+    scaler = StandardScaler().fit(poly.transform(x[train]))
+
+    return scaler.transform(poly.transform(x))
+
+
+# coefficients (alphas x features) of ridge regressions on centred x & y, from one SVD of x
+
+def ridge_path(x, y, alphas):
+
+    u, s, vt = np.linalg.svd(x, full_matrices=False)
+    uty = u.T @ y
+    d = s / (s ** 2 + np.asarray(alphas)[:, None])
+
+    return (d * uty) @ vt
+
+
+# test MSE of every model of the grid on one (fold, degree)
+
+@instrument.staged('modelsearch.fold')
+def _fold(x, y, train, test, degree, alphas, models):
+
+    from sklearn.linear_model import lasso_path
+
+    xe = expand(x, train, degree)
+    x_train, x_test = xe[train], xe[test]
+    y_mean = y[train].mean()
+    y_train = y[train] - y_mean
+
+    configs, coefs = [], []
+
+    if 'linear' in models:
+        configs.append(('linear', 0.0))
+        coefs.append(np.linalg.lstsq(x_train, y_train, rcond=None)[0][None])
+    if 'ridge' in models:
+        configs += [('ridge', alpha) for alpha in alphas]
+        coefs.append(ridge_path(x_train, y_train, alphas))
+    if 'lasso' in models:
+        # lasso_path runs from the largest alpha down
+        order = np.argsort(alphas)[::-1]
+        path = lasso_path(x_train, y_train, alphas=np.asarray(alphas)[order])[1]
+        configs += [('lasso', alpha) for alpha in np.asarray(alphas)[order]]
+        coefs.append(path.T)
+
+    pred = np.concatenate(coefs) @ x_test.T + y_mean
+    mse = ((pred - y[test]) ** 2).mean(axis=1)
+
+    return pd.DataFrame(configs, columns=['Model', 'Alpha']).assign(Degree=degree, MSE=mse)
+
+
+def _tasks(x, y, strata, degrees, alphas, models, n_splits, seed):
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    trace_settings = dict(instrument.settings)
+
+    return [
+        (fold, delayed(instrument.collect)(trace_settings, _fold, x, y, train, test, degree, alphas, models))
+        for fold, (train, test) in enumerate(folds(strata, n_splits, seed))
+        for degree in degrees
+    ]
+
+
+# results of the tasks, with the stages recorded by the workers merged into the records of this process
+
+def _collect(results):
+
+    for _, records in results:
+        instrument.merge(records)
+
+    return [result for result, _ in results]
+
+
+# mean & std of the fold MSEs by configuration, ranked
+
+def summarize(scores, by=()):
+
+    keys = list(by) + ['Model', 'Alpha', 'Degree']
+    table = scores.groupby(keys, sort=False)['MSE'].agg(['mean', 'std', 'count']).reset_index()
+    table = table.rename(columns={'mean': 'MSE', 'std': 'MSE Std', 'count': 'Folds'})
+    ranks = table.groupby(list(by))['MSE'] if by else table['MSE']
+    table['Rank'] = ranks.rank(method='first').astype(int)
+
+    return table.sort_values(list(by) + ['Rank'], ignore_index=True)
+
+
+# best configuration refitted on all rows
+
+def refit(x, y, model, alpha, degree):
+
+    from sklearn.linear_model import Lasso, LinearRegression, Ridge
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+    estimator = {
+        'linear': lambda: LinearRegression(),
+        'ridge': lambda: Ridge(alpha=alpha),
+        'lasso': lambda: Lasso(alpha=alpha),
+    }[model]()
+
+    pipeline = Pipeline([
+        ('poly', PolynomialFeatures(degree=int(degree), include_bias=False)),
+        ('scale', StandardScaler()),
+        ('model', estimator),
+    ])
+
+    return pipeline.fit(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+
+# x: features, y: target, strata: riding types of the rows
+# returns (results table, best Pipeline); raises ValueError when no riding type has enough rows for 2 folds
+
+@instrument.staged('modelsearch.search')
+def search(x, y, strata, degrees=DEGREES, alphas=ALPHAS, models=MODELS, n_splits=5, seed=0, n_jobs=None):
+
+    tasks = _tasks(x, y, strata, degrees, alphas, models, n_splits, seed)
+
+    if not tasks:
+        raise ValueError(f'too few rows to search: every riding type has fewer than 2 rows ({len(strata)} rows)')
+
+    scores = _collect(Parallel(n_jobs=n_jobs)(task for _, task in tasks))
+    scores = pd.concat([score.assign(Fold=fold) for (fold, _), score in zip(tasks, scores)], ignore_index=True)
+
+    results = summarize(scores)
+    best = results.iloc[0]
+
+    return results, refit(x, y, best['Model'], best['Alpha'], best['Degree'])
+
+
+# search of every province at once, the (fold, degree) tasks of all provinces share one pool
+# datasets: {province: (x, y, strata)}; provinces with too few ridings for 2 folds are left out
+# returns (results table with a Province column, {province: best Pipeline}), both empty when every province is left out
+
+@instrument.staged('modelsearch.search_all')
+def search_all(datasets, degrees=DEGREES, alphas=ALPHAS, models=MODELS, n_splits=5, seed=0, n_jobs=None):
+
+    tasks = [
+        (province, fold, task)
+        for province, (x, y, strata) in datasets.items()
+        for fold, task in _tasks(x, y, strata, degrees, alphas, models, n_splits, seed)
+    ]
+
+    if not tasks:
+        return pd.DataFrame(columns=['Province'] + COLUMNS), {}
+
+    scores = _collect(Parallel(n_jobs=n_jobs)(task for _, _, task in tasks))
+    scores = pd.concat(
+        [score.assign(Province=province, Fold=fold) for (province, fold, _), score in zip(tasks, scores)],
+        ignore_index=True,
+    )
+
+    results = summarize(scores, by=['Province'])
+    best = results[results['Rank'] == 1].set_index('Province')
+
+    models = {
+        province: refit(*datasets[province][:2], row['Model'], row['Alpha'], row['Degree'])
+        for province, row in best.iterrows()
+    }
+
+    return results, models
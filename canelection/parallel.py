@@ -0,0 +1,14 @@
+# process pools shared by the stages running in parallel
+# the numbered scripts are cell-style scripts doing their work at import time,
+# so workers are forked where the platform allows it, instead of spawned processes re-importing the calling script
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(max_workers=None):
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+
+    return ProcessPoolExecutor(max_workers=max_workers)
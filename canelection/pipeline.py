@@ -0,0 +1,327 @@
+# per-year collection pipeline of part 1
+# the full chain of an election (load_table12 -> get_vote_count -> load_table11 -> merge -> add_others -> add_elected -> add_pt)
+# only depends on its own pages & ED name index, so all elections of the registry run independently in a process pool
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from canelection import archive, instrument, parallel, ridings, stagecache, tables
+
+# main loading data function
+# the page is parsed by the streaming table parser, which only reads the table containing "Avalon"
+# header rows of 2004 & 2016 forms, repeated header rows & province rows are skipped while parsing
+# vote counts are read as int, ED names are converted (English names & short dash "-" only) on the fly
+
+@instrument.staged()
+def load_table12(url):
+
+    try:
+        df = tables.read_table12(archive.get_page(url), match='Avalon')
+    except ValueError as e:
+        raise ValueError(f'{url}: {e}') from e
+
+    return df
+
+# function for creation of electoral disctrict name tables
+# collect info for all election years to check changes of ED names between federal elections
+
+@instrument.staged()
+def get_riding_list(rdurl):
+
+    rd_list = archive.read_html(rdurl)
+    # read_html will return a list composed of 13 dataframes convering 1 province or terrtory each
+    # calling concat() method to concatenate the pro/ter dfs into the nationwide df
+    rddf = pd.concat(rd_list).iloc[:, :2].reset_index().iloc[:, 1:]
+    rddf.columns = ['Code', 'Ridings']
+    rddf['Ridings'] = [re.sub('–', '-', rd) for rd in rddf['Ridings'].tolist()]
+    rddf = rddf.set_index('Code')
+
+    return rddf
+
+# matching candidate affiliations with the 4 major parties
+# BQ is addressed as such for:
+# - "Bloc" may be identified as part of candidate names, while
+# - Québécois contains the French special letter é
+# 2008 & 2011 data uses a different form of abbreviation for NDP, both forms are matched as N.D.P.
+# returns {party: boolean mask}; an affiliation containing several party strings matches all of them
+
+def party_matches(affiliation):
+
+    affiliation = affiliation.astype(str)
+
+    return {
+        'Liberal': affiliation.str.contains('Liberal', regex=False),
+        'Conservative': affiliation.str.contains('Conservative', regex=False),
+        'NDP': affiliation.str.contains('N.D.P.', regex=False) | affiliation.str.contains('NDP', regex=False),
+        'BQ': affiliation.str.contains('Bloc Qu', regex=False),
+    }
+
+# one party per candidate (the first matching major party, or "Others"), for the winners & poll results
+
+def classify(affiliation):
+
+    matches = party_matches(affiliation)
+
+    return np.select(list(matches.values()), list(matches), default='Others')
+
+# function converting table 12 data into major party vote counts df
+# Effect of df being created by this function:
+# 1st column contains ED codes;
+# 2nd-5th columns are vote counts for 4 major parties in the ED.
+# vote counts are set as 0 where a major party does not have a candidate in the ED (for instance, BQ in provinces other than Quebec)
+# as in the original row-by-row version, a candidate row is counted for every party string its affiliation contains
+
+@instrument.staged()
+def get_vote_count(df_detail): # 定义生成函数
+
+    rdno_list = df_detail['Electoral district'].unique().tolist()
+    district = df_detail['Electoral district']
+    votes = df_detail['Vote Count']
+
+    # one grouped pass per party builds the ED x party matrix
+    # the last candidate row of a party is retained for an ED, as the original row-by-row replacement did
+    count_df = pd.DataFrame({
+        party: votes[matched].groupby(district[matched], sort=False).last()
+        for party, matched in party_matches(df_detail['Candidate and affiliation']).items()
+    })
+
+    # vote counts are set as 0 where a major party does not have a candidate in the ED, or in the whole table
+    count_df = count_df.reindex(index=rdno_list, columns=['Liberal', 'Conservative', 'NDP', 'BQ']).fillna(0).astype(float)
+    count_df = count_df.rename_axis(index='District', columns=None).reset_index()
+
+    return count_df
+
+# load supplement information for table 11 provided by Election Canada
+# The table contains info about total votes casted in the EDs and counts of voters registered to vote
+# "Valid ballots" counts are selected in preference to "Total ballots cast", to ensure validity of calculation results
+# ED names are replaced by ED codes with the {ED name: ED code} dict, if given
+
+@instrument.staged()
+def load_table11(url, mapping=None):
+
+    t11 = tables.read_table11(archive.get_page(url), match='Avalon')
+
+    # the last row of the table is a summary row rather than an ED
+    t11 = t11.iloc[:-1].reset_index(drop=True)
+
+    if mapping is not None:
+        t11['Electoral district'] = t11['Electoral district'].map(mapping)
+
+    # set final col names
+    t11.columns = [
+        'District',
+        'Total Voters',
+        'Total Votes',
+    ]
+
+    return t11
+
+# adding "others" column
+# "other" column would contain count of votes casted for candidates not endorsed by any of the 4 major parties in the ED
+
+@instrument.staged()
+def add_others(df):
+
+    df['Others'] = df['Total Votes'] - df[['Liberal', 'Conservative', 'NDP', 'BQ']].sum(axis=1)
+
+    return df
+
+# adding info of winning party
+# the winner of an ED is the candidate with the most votes in Table 12, found for all EDs in one grouped pass
+# candidates not endorsed by the 4 major parties (e.g. independents) are detected as "Others" without a list of exceptions
+
+@instrument.staged()
+def add_elected(df, df_detail):
+
+    winners = df_detail.loc[df_detail.groupby('Electoral district')['Vote Count'].idxmax()]
+    elected = pd.Series(classify(winners['Candidate and affiliation']), index=winners['Electoral district'].to_numpy())
+
+    df['Elected'] = df['District'].map(elected)
+
+    return df
+
+# Adding province / territory info
+# array lookup on the first 2 digits of ED codes
+
+pt_dict = {
+    10: 'NL',
+    11: 'PE',
+    12: 'NS',
+    13: 'NB',
+    24: 'QC',
+    35: 'ON',
+    46: 'MB',
+    47: 'SK',
+    48: 'AB',
+    59: 'BC',
+    60: 'Territories',
+    61: 'Territories',
+    62: 'Territories',
+}
+
+pt_array = np.array([pt_dict.get(key) for key in range(max(pt_dict) + 1)], dtype=object)
+
+@instrument.staged()
+def add_pt(df):
+
+    df['Province'] = pt_array[df['District'].to_numpy(dtype=int) // 1000]
+
+    return df
+
+# reordering the columns
+
+col_list = [
+    'District',
+    'Province',
+    'Total Voters',
+    'Liberal',
+    'Conservative',
+    'NDP', 'BQ',
+    'Others',
+    'Total Votes',
+    'Elected',
+]
+
+# ED-level summary of an election from Table 12 (candidates) & Table 11 (voters & ballots), ED names already replaced by codes
+
+def summarize(df_detail, t11):
+
+    data = get_vote_count(df_detail)
+
+    data = instrument.run('merge', pd.merge, data, t11, on='District')
+    data = add_others(data)
+    data = add_elected(data, df_detail)
+    data = add_pt(data)
+
+    return data[col_list].sort_values(by='District')
+
+# page-level stages are cached by the archive hash of their page & the source of the table parser
+
+def page_stage(func, url):
+
+    digest = archive.page_hash(url)
+
+    if digest is None:
+        return func(url)
+
+    return stagecache.run(func.__name__, func, url, key=[digest, stagecache.source_hash(tables)])
+
+# ED names of both tables; renamed EDs are only matched by position, as their old & new names share little text
+# a positional match scoring below min_score is kept only when Table 11 & Table 12 place the name at the same ED code,
+# otherwise it is left unresolved (District empty) rather than silently taking its position
+
+@instrument.staged()
+def resolve_names(index, names12, names11, min_score=0.5):
+
+    resolved = pd.concat([
+        index.resolve(names12, ordered=True, min_score=min_score, order_min_score=0.0).assign(Table='Table 12'),
+        index.resolve(names11, ordered=True, min_score=min_score, order_min_score=0.0).assign(Table='Table 11'),
+    ], ignore_index=True)
+
+    weak = (resolved['Method'] == 'order') & (resolved['Score'] < min_score)
+    tables_agreeing = resolved[weak].groupby(['Name', 'District'])['Table'].transform('nunique')
+    rejected = tables_agreeing.index[tables_agreeing < 2]
+
+    resolved.loc[rejected, 'District'] = pd.NA
+    resolved.loc[rejected, ['Score', 'Method']] = [np.nan, None]
+
+    return resolved
+
+# full chain for one election
+# ED names of Table 11 & 12 are resolved to ED codes with the ED name index of the election's representation order
+# returns the summarized datasheet, and the resolution of every ED name (District, Score, Method) for checking
+# every stage goes through the stage cache (canelection/stagecache.py), unchanged stages are loaded from disk
+# archive & stage cache settings are passed along, as worker processes do not share the settings of the main process
+
+@instrument.staged()
+def run_year(election, index, settings=None, cache_settings=None):
+
+    if settings is not None:
+        archive.configure(**settings)
+    if cache_settings is not None:
+        stagecache.configure(**cache_settings)
+
+    df = page_stage(load_table12, election['table12'])
+    t11 = page_stage(load_table11, election['table11'])
+
+    # both tables list the EDs in ED code order, which lets renamed EDs be resolved by position
+    resolved = stagecache.run(
+        'resolve', resolve_names, index, df['Electoral district'], t11['District'], key=stagecache.source_hash(ridings),
+    )
+    found = resolved.dropna(subset=['District'])
+    mapping = dict(zip(found['Name'], found['District'].astype(int)))
+
+    df['Electoral district'] = df['Electoral district'].map(mapping)
+    t11['District'] = t11['District'].map(mapping)
+
+    data = stagecache.run(
+        'summarize', summarize, df, t11,
+        key=[get_vote_count, party_matches, classify, add_others, add_elected, add_pt, col_list],
+    )
+
+    return data, resolved
+
+# all elections at once, one process per election
+# stages recorded by the workers are merged into the instrumentation records of this process
+
+@instrument.staged()
+def run_all(elections, indexes, max_workers=None):
+
+    years = sorted(elections)
+    settings = dict(archive.settings)
+    cache_settings = dict(stagecache.settings)
+    trace_settings = dict(instrument.settings)
+
+    with parallel.process_pool(max_workers) as pool:
+        results = list(pool.map(
+            instrument.collect,
+            [trace_settings] * len(years),
+            [run_year] * len(years),
+            [elections[year] for year in years],
+            [indexes[elections[year]['order']] for year in years],
+            [settings] * len(years),
+            [cache_settings] * len(years),
+        ))
+
+    for _, records in results:
+        instrument.merge(records)
+
+    return dict(zip(years, [result for result, _ in results]))
+
+# ED code / ED name lists of all elections, one column named "<year> Ridings" per election
+
+def riding_lists(elections):
+
+    rd_lists = {}
+
+    for year, election in elections.items():
+        rd_lists[year] = page_stage(get_riding_list, election['ridings'])
+        rd_lists[year].columns = [f'{year} Ridings']
+
+    return rd_lists
+
+# one ED name index per representation order, holding the ED names of all its elections
+
+def riding_indexes(elections, rd_lists):
+
+    indexes = {}
+
+    for year, election in elections.items():
+        index = indexes.setdefault(election['order'], ridings.RidingIndex())
+        for code, name in rd_lists[year].iloc[:, 0].items():
+            index.add(code, name)
+
+    return indexes
+
+# ED code / ED name reference sheet: the ED list of an election, with the names used by its tables where they differ
+# e.g. the 2011 tables use "Western Arctic", listed as "Northwest Territories" on the ED list page
+
+def reference_sheet(rd_list, resolved):
+
+    rd = rd_list.copy()
+    renamed = resolved.query("Method != 'exact'").dropna(subset=['District']).drop_duplicates('District')
+    rd.loc[renamed['District'].astype(int).tolist(), rd.columns[0]] = renamed['Name'].tolist()
+
+    return rd
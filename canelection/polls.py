@@ -0,0 +1,154 @@
+# poll-by-poll results ingestion
+# Elections Canada publishes one poll-by-poll csv per ED (pollresults_resultatsbureauXXXXX.csv), one row per poll & candidate
+# every file is streamed in chunks & aggregated into:
+# - the ED-level schema used by 2004.csv-2011.csv (District, Total Voters, party vote counts, Others, Total Votes)
+# - a poll-level store (one csv per ED) kept for drill-down
+# memory is bounded by chunksize x workers, no matter how many polls there are
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument, parallel, pipeline
+
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
+
+# English part of the bilingual headers -> short column names
+# headers vary slightly between elections, so they are matched by prefix; names & affiliations come as an _English &
+# a _French column (e.g. Electoral District Name_English / Electoral District Name_French), only the _English one is kept
+HEADERS = {
+    'electoral district number': 'District Number',
+    'electoral district name': 'District Name',
+    'polling station number': 'Poll',
+    'electors': 'Electors',
+    'political affiliation name': 'Affiliation',
+    'candidate poll votes count': 'Votes',
+}
+
+
+def _short_name(column):
+
+    english = column.split('/')[0].strip().lower()
+
+    if english.endswith('_french'):
+        return None
+
+    for prefix, name in HEADERS.items():
+        if english.startswith(prefix):
+            return name
+
+    return None
+
+
+# stream one riding file, returns the poll-level frame of the riding (one row per poll)
+
+def read_poll_file(path, index=None, chunksize=50000, encoding='latin-1'):
+
+    header = pd.read_csv(path, nrows=0, encoding=encoding).columns
+    # the first column of every short name, so that the renamed chunk never has duplicate columns
+    first = {}
+    for col in header:
+        name = _short_name(col)
+        if name is not None:
+            first.setdefault(name, col)
+    columns = {col: name for name, col in first.items()}
+
+    polls = []
+
+    for chunk in pd.read_csv(path, usecols=list(columns), chunksize=chunksize, encoding=encoding, dtype=str):
+
+        chunk = chunk.rename(columns=columns)
+
+        # ED names are resolved with the ED name index (canelection.ridings) of part 1, the ED number in the file is the fallback
+        district = pd.Series(np.nan, index=chunk.index)
+        if index is not None and 'District Name' in chunk:
+            district = chunk['District Name'].map(index.mapping(chunk['District Name']))
+        if 'District Number' in chunk:
+            district = district.fillna(pd.to_numeric(chunk['District Number'], errors='coerce'))
+
+        votes = pd.to_numeric(chunk['Votes'], errors='coerce').fillna(0).astype('int64')
+        electors = pd.to_numeric(chunk['Electors'], errors='coerce').fillna(0).astype('int64')
+
+        frame = pd.DataFrame({
+            'District': district,
+            'Poll': chunk['Poll'].str.strip(),
+            'Party': pipeline.classify(chunk['Affiliation']),
+            'Votes': votes,
+            'Electors': electors,
+        })
+
+        # party votes per poll; electors are repeated on each candidate row of a poll
+        pivot = frame.pivot_table(index=['District', 'Poll'], columns='Party', values='Votes', aggfunc='sum')
+        pivot['Electors'] = frame.groupby(['District', 'Poll'])['Electors'].max()
+        polls.append(pivot)
+
+    # a poll may be split between 2 chunks, its partial rows are combined here
+    polls = pd.concat(polls).reindex(columns=PARTIES + ['Electors']).fillna(0)
+    polls = polls.groupby(level=['District', 'Poll']).agg({**{p: 'sum' for p in PARTIES}, 'Electors': 'max'})
+    polls = polls.astype('int64').rename_axis(columns=None).reset_index()
+    polls['District'] = polls['District'].astype('int64')
+    polls['Total Votes'] = polls[PARTIES].sum(axis=1)
+
+    return polls
+
+
+# roll the poll-level frame up to the ED-level schema of the yearly datasheets
+
+def summarize(polls):
+
+    df = polls.groupby('District')[['Electors'] + PARTIES + ['Total Votes']].sum()
+    df = df.rename(columns={'Electors': 'Total Voters'}).reset_index()
+
+    return df[['District', 'Total Voters'] + PARTIES + ['Total Votes']]
+
+
+def _ingest_file(path, index, chunksize, store):
+
+    polls = read_poll_file(path, index, chunksize)
+
+    if store is not None:
+        for district, group in polls.groupby('District'):
+            group.to_csv(os.path.join(store, f'{district}.csv'), index=False)
+
+    return summarize(polls)
+
+
+# ingest all riding files of an election in parallel
+# files: directory of the unpacked poll-by-poll csvs, or a list of paths; FileNotFoundError if there are none
+# store: directory for the poll-level store, skipped if None
+
+@instrument.staged('polls.ingest')
+def ingest(files, index=None, store=None, chunksize=50000, max_workers=None):
+
+    source = files
+
+    if isinstance(files, str):
+        files = sorted(glob.glob(os.path.join(files, '*.csv')))
+
+    if not files:
+        raise FileNotFoundError(f'no poll-by-poll csv files found in {source!r}')
+
+    if store is not None:
+        os.makedirs(store, exist_ok=True)
+
+    with parallel.process_pool(max_workers) as pool:
+        parts = list(pool.map(
+            _ingest_file,
+            files,
+            [index] * len(files),
+            [chunksize] * len(files),
+            [store] * len(files),
+        ))
+
+    df = pd.concat(parts).groupby('District', as_index=False).sum()
+
+    return df.sort_values('District').reset_index(drop=True)
+
+
+# drill-down: poll-level rows of one ED from the store
+
+def load_polls(store, district):
+
+    return pd.read_csv(os.path.join(store, f'{district}.csv'))
@@ -0,0 +1,169 @@
+# Monte Carlo seat projection over the riding results of a baseline year
+# every scenario shifts the baseline vote shares of the ridings by swings drawn for the parties:
+# - a national swing per party, shared by all ridings
+# - a provincial swing per province & party (optional)
+# - a riding-level swing per riding & party (optional, the most expensive part)
+# the winner of every riding is the party with the highest shifted share among the parties running there,
+# scenarios are drawn in batches of scenarios x ridings x parties arrays, never one riding or one scenario at a time
+# large runs are split into fixed-size chunks with their own seeds spawned from one SeedSequence,
+# so the results only depend on the seed, not on the number of worker processes
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument, parallel
+
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
+
+
+# scalar, {party: value} or array -> one value per party
+
+def _per_party(value, parties):
+
+    if isinstance(value, dict):
+        return np.array([value.get(party, 0.0) for party in parties], dtype=np.float32)
+
+    return np.broadcast_to(np.asarray(value, dtype=np.float32), (len(parties),)).copy()
+
+
+# one chunk of n scenarios; arrays are laid out parties first (parties x scenarios x ridings),
+# the winner is an argmax over the leading parties axis rather than over a short last axis
+# tied shares go to the first of the tied parties (in PARTIES order), so every riding has exactly one winner
+# without riding-level swings, a riding whose leader stays ahead under the largest swing gap of the batch
+# (max over the scenarios of the batch of the swing of party k minus the swing of the leader, in the riding's province)
+# is decided for the whole batch at once; only the contested ridings are evaluated scenario by scenario
+
+def _simulate(base, running, pt, n_provinces, mean, national_sd, provincial_sd, riding_sd, seed, n, batch):
+
+    rng = np.random.default_rng(seed)
+    n_ridings, n_parties = base.shape
+
+    # parties without a candidate in a riding cannot win it
+    base = np.where(running, base, -np.inf).T.astype(np.float32) # parties x ridings
+    leader = base.argmax(axis=0)
+    lead = base[leader, np.arange(n_ridings)] - base # parties x ridings, lead of the leader over every party
+    prune = not riding_sd.any()
+
+    seats = np.empty((n, n_parties), dtype=np.int32)
+    wins = np.zeros((n_ridings, n_parties), dtype=np.int64)
+
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+
+        swing = mean[:, None, None] + national_sd[:, None, None] * rng.standard_normal((n_parties, size, 1), dtype=np.float32)
+        if provincial_sd.any():
+            swing = swing + provincial_sd[:, None, None] * rng.standard_normal((n_parties, size, n_provinces), dtype=np.float32)
+        swing = np.broadcast_to(swing, (n_parties, size, n_provinces))
+
+        if prune:
+            # gap[l, k, p]: largest swing of party k over party l among the scenarios of the batch, in province p
+            gap = (swing[None, :] - swing[:, None]).max(axis=2)
+            gap[np.arange(n_parties), np.arange(n_parties)] = -np.inf
+            safe = (lead > gap[leader, :, pt].T).all(axis=0)
+        else:
+            safe = np.zeros(n_ridings, dtype=bool)
+
+        seats[start:start + size] = np.bincount(leader[safe], minlength=n_parties)
+        wins[safe, leader[safe]] += size
+
+        contested = np.flatnonzero(~safe)
+        shares = base[:, contested][:, None, :] + swing[:, :, pt[contested]] # parties x scenarios x contested ridings
+        if riding_sd.any():
+            shares += riding_sd[:, None, None] * rng.standard_normal(shares.shape, dtype=np.float32)
+        winner = shares.argmax(axis=0)
+
+        for k in range(n_parties):
+            won = winner == k
+            seats[start:start + size, k] += np.count_nonzero(won, axis=1)
+            wins[contested, k] += np.count_nonzero(won, axis=0)
+
+    return seats, wins
+
+
+class Projection:
+
+    def __init__(self, seats, wins, districts, provinces, parties):
+
+        self.seats = seats # scenarios x parties seat counts
+        self.wins = wins # ridings x parties count of scenarios won
+        self.districts = districts
+        self.provinces = provinces
+        self.parties = parties
+
+    @property
+    def n(self):
+
+        return len(self.seats)
+
+    # win probability of every party in every riding
+
+    def win_probability(self):
+
+        return pd.DataFrame(self.wins / self.n, index=pd.Index(self.districts, name='District'), columns=self.parties)
+
+    # frequency of every seat count of every party
+
+    def seat_distribution(self):
+
+        n_seats = len(self.districts) + 1
+        counts = np.stack([np.bincount(self.seats[:, k], minlength=n_seats) for k in range(len(self.parties))], axis=1)
+
+        return pd.DataFrame(counts / self.n, index=pd.Index(range(n_seats), name='Seats'), columns=self.parties)
+
+    # mean, percentiles & probabilities of the most seats / a majority by party
+
+    def summary(self):
+
+        majority = len(self.districts) // 2 + 1
+        top = self.seats.max(axis=1, keepdims=True)
+
+        return pd.DataFrame({
+            'Mean': self.seats.mean(axis=0),
+            'P5': np.percentile(self.seats, 5, axis=0),
+            'Median': np.percentile(self.seats, 50, axis=0),
+            'P95': np.percentile(self.seats, 95, axis=0),
+            'Most Seats': (self.seats == top).mean(axis=0),
+            'Majority': (self.seats >= majority).mean(axis=0),
+        }, index=self.parties)
+
+    # expected seats by province
+
+    def province_seats(self):
+
+        expected = pd.DataFrame(self.wins / self.n, columns=self.parties)
+
+        return expected.groupby(np.asarray(self.provinces)).sum()
+
+
+# baseline: yearly datasheet (District, Province, party vote counts, Total Votes)
+# mean, national_sd, provincial_sd, riding_sd: swings in vote share points (0.01 = 1 point), scalar or {party: value}
+# n scenarios are drawn in chunks of chunk scenarios (batch scenarios at a time), across a process pool when max_workers != 1
+
+@instrument.staged()
+def project(baseline, n=1_000_000, mean=0.0, national_sd=0.02, provincial_sd=0.01, riding_sd=0.0,
+            parties=PARTIES, seed=0, batch=1024, chunk=131072, max_workers=None):
+
+    counts = baseline[parties].to_numpy(dtype=np.float32)
+    base = counts / baseline['Total Votes'].to_numpy(dtype=np.float32)[:, None]
+    running = counts > 0
+
+    provinces = pd.Categorical(baseline['Province'])
+    pt = provinces.codes.astype(np.int64)
+    n_provinces = len(provinces.categories)
+
+    params = [_per_party(value, parties) for value in (mean, national_sd, provincial_sd, riding_sd)]
+
+    sizes = [min(chunk, n - start) for start in range(0, n, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(base, running, pt, n_provinces, *params, s, size, batch) for s, size in zip(seeds, sizes)]
+
+    if max_workers == 1 or len(sizes) == 1:
+        results = [_simulate(*a) for a in args]
+    else:
+        with parallel.process_pool(max_workers) as pool:
+            results = list(pool.map(_simulate, *zip(*args)))
+
+    seats = np.concatenate([seats for seats, _ in results])
+    wins = sum(wins for _, wins in results)
+
+    return Projection(seats, wins, baseline['District'].to_numpy(), np.asarray(baseline['Province'], dtype=object), list(parties))
@@ -0,0 +1,201 @@
+# ED name -> ED code resolution
+# Table 11 / 12 pages, ED list pages & poll-by-poll files spell ED names differently:
+# dash & apostrophe forms, accents, English / French halves, and ED names changed between elections (mostly 2004 -> 2006)
+# the index resolves names in 3 steps:
+# - exact: a hash index of normalised keys (accents, dashes, apostrophes, dots & spaces folded), O(1) per name
+# - order: Table 11 / 12 list the EDs in ED code order, so unresolved names lying between 2 resolved EDs
+#   are matched in order to the unused codes between them, when the counts agree;
+#   positional matches scoring below order_min_score (min_score by default) are rejected & go on to the fuzzy step
+# - fuzzy: character trigram index, candidates scored by trigram similarity (0-1) & kept above min_score
+# every resolution carries a confidence score, so no hand-written correction list is needed
+# numpy & pandas are only imported by resolve(), so the lookups of the command line start without them
+
+import bisect
+import hashlib
+import re
+import unicodedata
+from collections import defaultdict
+
+_fold = str.maketrans({
+    '\x96': '-', '\x97': '-', '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-',
+    '\x92': "'", '‘': "'", '’': "'", '`': "'", '´': "'",
+})
+_drop = re.compile(r"[.']")
+_dash = re.compile(r'\s*-\s*')
+_space = re.compile(r'\s+')
+
+
+def normalize(name):
+
+    name = unicodedata.normalize('NFKD', str(name).translate(_fold))
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    name = _dash.sub('-', _drop.sub('', name))
+
+    return _space.sub(' ', name).strip()
+
+
+# keys of a name: the whole name, and its English & French halves
+
+def keys(name):
+
+    key = normalize(name)
+    halves = [half.strip() for half in key.split('/') if half.strip()]
+
+    return list(dict.fromkeys([key] + halves))
+
+
+def trigrams(key):
+
+    padded = f'  {key} '
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RidingIndex:
+
+    # names: {ED code: name or list of names}
+
+    def __init__(self, names=None):
+
+        self.exact = {} # normalised key -> ED code
+        self.grams = defaultdict(set) # trigram -> ED codes
+        self.code_grams = defaultdict(set) # ED code -> trigrams of all its names
+        self.codes = []
+
+        for code, value in (names or {}).items():
+            for name in ([value] if isinstance(value, str) else value):
+                self.add(code, name)
+
+    def add(self, code, name):
+
+        if code not in self.code_grams:
+            bisect.insort(self.codes, code)
+
+        for key in keys(name):
+            self.exact.setdefault(key, code)
+            grams = trigrams(key)
+            self.code_grams[code].update(grams)
+            for gram in grams:
+                self.grams[gram].add(code)
+
+    # content hash of the index, for the stage cache: exact keys, codes & the trigrams of all names of every code
+
+    def fingerprint(self):
+
+        items = [
+            sorted((key, int(code)) for key, code in self.exact.items()),
+            [(int(code), sorted(self.code_grams[code])) for code in self.codes],
+        ]
+
+        return hashlib.sha256(repr(items).encode()).hexdigest()
+
+    def lookup(self, name):
+
+        for key in keys(name):
+            if key in self.exact:
+                return self.exact[key]
+
+        return None
+
+    def score(self, name, code):
+
+        grams = set().union(*[trigrams(key) for key in keys(name)])
+        other = self.code_grams[code]
+
+        return len(grams & other) / len(grams | other) if grams else 0.0
+
+    # best fuzzy candidates of a name among the allowed codes (all codes if None), as (code, score) pairs
+
+    def fuzzy(self, name, allowed=None, limit=3):
+
+        grams = set().union(*[trigrams(key) for key in keys(name)])
+        hits = defaultdict(int)
+
+        for gram in grams:
+            for code in self.grams.get(gram, ()):
+                if allowed is None or code in allowed:
+                    hits[code] += 1
+
+        scored = [(code, self.score(name, code)) for code in hits]
+
+        return sorted(scored, key=lambda item: -item[1])[:limit]
+
+    # resolve a batch of names, returns one row per unique name: Name, District, Score, Method
+    # ordered: the names are listed in ED code order (Table 11 / 12), enabling resolution by position
+    # order_min_score: lowest name similarity of a positional match, min_score if None; names renamed outright score
+    # near 0, so a caller lowering it has to check the positional matches some other way (see pipeline.resolve_names)
+
+    def resolve(self, names, ordered=False, min_score=0.5, order_min_score=None):
+
+        import numpy as np
+        import pandas as pd
+
+        unique = pd.unique(pd.Series(list(names), dtype=object).dropna())
+        codes = [self.lookup(name) for name in unique]
+        scores = [1.0 if code is not None else np.nan for code in codes]
+        methods = ['exact' if code is not None else None for code in codes]
+        used = {code for code in codes if code is not None}
+        order_min_score = min_score if order_min_score is None else order_min_score
+
+        if ordered:
+            self._fill_by_order(unique, codes, scores, methods, used, order_min_score)
+
+        for i, name in enumerate(unique):
+            if codes[i] is not None:
+                continue
+            allowed = set(self._between(codes, i)) - used if ordered else set(self.codes) - used
+            for code, score in self.fuzzy(name, allowed, limit=1):
+                if score >= min_score:
+                    codes[i], scores[i], methods[i] = code, score, 'fuzzy'
+                    used.add(code)
+
+        return pd.DataFrame({
+            'Name': unique,
+            'District': pd.array([np.nan if code is None else code for code in codes], dtype='Int64'),
+            'Score': scores,
+            'Method': methods,
+        })
+
+    # unused codes between the resolved neighbours of position i
+
+    def _between(self, codes, i):
+
+        low = next((codes[j] for j in range(i - 1, -1, -1) if codes[j] is not None), None)
+        high = next((codes[j] for j in range(i + 1, len(codes)) if codes[j] is not None), None)
+
+        return [
+            code for code in self.codes
+            if (low is None or code > low) and (high is None or code < high)
+        ]
+
+    def _fill_by_order(self, names, codes, scores, methods, used, min_score):
+
+        i = 0
+
+        while i < len(codes):
+            if codes[i] is not None:
+                i += 1
+                continue
+
+            end = i
+            while end < len(codes) and codes[end] is None:
+                end += 1
+
+            gap = [code for code in self._between(codes, i) if code not in used]
+            # only unambiguous gaps are filled: as many unused codes as unresolved names
+            if len(gap) == end - i:
+                for j, code in zip(range(i, end), gap):
+                    score = self.score(names[j], code)
+                    if score >= min_score:
+                        codes[j], scores[j], methods[j] = code, score, 'order'
+                        used.add(code)
+
+            i = end
+
+    # {name: ED code} dict of the resolved names, for pandas.Series.map()
+
+    def mapping(self, names, ordered=False, min_score=0.5):
+
+        resolved = self.resolve(names, ordered, min_score).dropna(subset=['District'])
+
+        return dict(zip(resolved['Name'], resolved['District'].astype(int)))
@@ -0,0 +1,277 @@
+# local HTTP/JSON query service over the riding & province results
+# the yearly datasheets are loaded once into in-memory indexes:
+# - ridings by ED code, and by normalised ED name (canelection/ridings.py) with fuzzy fallback
+# - province aggregates from the results cube, ridings by province
+# - winners & hold / flip labels of every riding from the winner matrix
+# responses are JSON, built once per distinct request & served from an LRU cache afterwards
+#
+# endpoints:
+#   /riding/<ED code or name>[?year=2008]   results of a riding (winner, votes, shares, margin) by year
+#   /flips/<ED code or name>                winners & hold / flip history of a riding
+#   /province/<NL..BC, Territories>[?year=2008]   vote & seat totals of a province, ridings of the province
+#   /search?q=<name>                        best matching ridings
+#   /health
+#
+# python -m canelection.service --port 8765 starts the service on the outputs of part 1 in the current directory
+
+import argparse
+import functools
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from canelection import cube, ridings, storage, transitions
+
+PARTIES = storage.PARTIES
+ABBREVIATIONS = {'Liberal': 'LIB', 'Conservative': 'CON', 'NDP': 'NDP', 'BQ': 'BLQ', 'Others': 'OTH'}
+
+
+class QueryError(Exception):
+
+    def __init__(self, status, message):
+
+        super().__init__(message)
+        self.status = status
+
+
+class ResultsIndex:
+
+    # frames: {year: datasheet}; names: {ED code: ED name}
+
+    def __init__(self, frames, names=None, results=None, cache_size=4096):
+
+        self.years = list(frames)
+        self.names = names or {}
+        self.name_index = ridings.RidingIndex(self.names)
+        self.results = results or cube.ResultsCube.from_frames(frames)
+
+        # one record per riding & year, with the shares & the margin of the winner over the runner-up
+        self.ridings = {}
+        self.by_province = {}
+
+        for year, df in frames.items():
+            counts = df[PARTIES].to_numpy(dtype=np.int64)
+            top = -np.sort(-counts, axis=1)
+            records = df.assign(
+                Margin=top[:, 0] - top[:, 1],
+                **{f'{party} %': counts[:, i] / df['Total Votes'].to_numpy() for i, party in enumerate(PARTIES)},
+            ).to_dict('records')
+
+            for record in records:
+                self.ridings.setdefault(int(record['District']), {})[year] = record
+                self.by_province.setdefault(record['Province'], set()).add(int(record['District']))
+
+        self.by_province = {province: sorted(codes) for province, codes in self.by_province.items()}
+
+        # hold / flip labels between consecutive elections, made once for all ridings
+        matrix = transitions.WinnerMatrix.from_frames(frames, list(ABBREVIATIONS.values()), mapping=ABBREVIATIONS)
+        self.winners = matrix.decode()
+        self.changes = {
+            f'{a} to {b}': matrix.change_labels(a, b)
+            for a, b in zip(self.years[:-1], self.years[1:])
+        }
+
+        self.respond = functools.lru_cache(maxsize=cache_size)(self._respond)
+
+    # ED code, exact (normalised) ED name, or best fuzzy match
+
+    def find(self, key):
+
+        key = unquote(key).strip()
+
+        if key.isdigit():
+            code = int(key)
+        else:
+            code = self.name_index.lookup(key)
+            if code is None:
+                matches = self.name_index.fuzzy(key, limit=1)
+                code = matches[0][0] if matches and matches[0][1] >= 0.5 else None
+
+        if code is None or code not in self.ridings:
+            raise QueryError(404, f'riding not found: {key}')
+
+        return code
+
+    def _year(self, params):
+
+        year = params.get('year')
+
+        if year is not None and year not in self.years:
+            raise QueryError(404, f'year not found: {year}')
+
+        return year
+
+    def riding(self, key, params):
+
+        code = self.find(key)
+        year = self._year(params)
+        years = [year] if year else self.years
+
+        return {
+            'District': code,
+            'Name': self.names.get(code),
+            'Results': {y: self.ridings[code][y] for y in years if y in self.ridings[code]},
+        }
+
+    def flips(self, key, params):
+
+        code = self.find(key)
+
+        return {
+            'District': code,
+            'Name': self.names.get(code),
+            'Winners': {col.split()[0]: winner for col, winner in self.winners.loc[code].items()},
+            'Changes': {pair: labels.get(code) for pair, labels in self.changes.items()},
+        }
+
+    def province(self, key, params):
+
+        province = unquote(key)
+        year = self._year(params)
+
+        if province not in self.by_province:
+            raise QueryError(404, f'province not found: {province}')
+
+        if year:
+            votes = self.results.by_province(year).loc[province].to_dict()
+            seats = self.results.seat_counts(year).loc[province].to_dict()
+        else:
+            votes = self.results.history(province).to_dict('index')
+            seats = self.results.seat_history(province).to_dict('index')
+
+        return {'Province': province, 'Votes': votes, 'Seats': seats, 'Districts': self.by_province[province]}
+
+    def _limit(self, params):
+
+        limit = params.get('limit', '5')
+
+        try:
+            value = int(limit)
+        except ValueError:
+            value = 0
+
+        if value < 1:
+            raise QueryError(400, f'limit must be a positive integer: {limit}')
+
+        return value
+
+    def search(self, key, params):
+
+        query = params.get('q', '')
+
+        return [
+            {'District': code, 'Name': self.names.get(code), 'Score': score}
+            for code, score in self.name_index.fuzzy(query, limit=self._limit(params))
+        ]
+
+    # (status, JSON body) of a request path & query string, cached by respond()
+
+    def _respond(self, path, query=''):
+
+        params = {key: values[-1] for key, values in parse_qs(query).items()}
+        parts = [part for part in path.split('/') if part]
+        routes = {'riding': self.riding, 'flips': self.flips, 'province': self.province}
+
+        try:
+            if parts == ['health']:
+                body = {'status': 'ok', 'years': self.years, 'ridings': len(self.ridings)}
+            elif parts == ['search']:
+                body = self.search(None, params)
+            elif len(parts) == 2 and parts[0] in routes:
+                body = routes[parts[0]](parts[1], params)
+            else:
+                raise QueryError(404, f'unknown path: {path}')
+            status = 200
+        except QueryError as e:
+            status, body = e.status, {'error': str(e)}
+
+        return status, json.dumps(body, default=_to_json).encode()
+
+
+def _to_json(value):
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# index of the outputs of part 1 in directory
+
+def load_index(years=None, directory='.', cache_size=4096):
+
+    from canelection.elections import ELECTIONS
+
+    years = years or sorted(ELECTIONS)
+
+    return ResultsIndex(
+        storage.read_years(years, directory=directory),
+        storage.read_ridings(directory),
+        cube.read_cube(years, directory),
+        cache_size,
+    )
+
+
+def make_handler(index):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1' # keep-alive
+        disable_nagle_algorithm = True
+        wbufsize = -1 # headers & body leave in one write, avoiding the delayed ACK stall between 2 small writes
+
+        def do_GET(self):
+
+            parts = urlsplit(self.path)
+            status, body = index.respond(parts.path, parts.query)
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+# one thread per keep-alive connection; the listen backlog is raised so bursts of new clients are not dropped & retried
+
+class Server(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def make_server(index, host='127.0.0.1', port=8765):
+
+    return Server((host, port), make_handler(index))
+
+
+def serve(host='127.0.0.1', port=8765, directory='.'):
+
+    server = make_server(load_index(directory=directory), host, port)
+    print(f'serving on http://{host}:{server.server_port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='query service over the collected election results')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--directory', default='.')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.directory)
@@ -0,0 +1,178 @@
+# stdlib-only readers of the csv exports of part 1 (<year>.csv & ridings.csv), for the lightweight commands of the command line
+# importing numpy & pandas alone takes longer than these commands, so rows are read with the csv module into dicts:
+# - riding(): results of one ED by ED code or ED name (exact, part of a name, then fuzzy, canelection/ridings.py), with shares & margins
+# - totals(): nationwide or prov/terr vote & seat totals by year, or by prov/terr of one year
+# - table(): plain text table of rows, for printing
+
+import csv
+import os
+
+from canelection.elections import ELECTIONS
+from canelection.ridings import RidingIndex, normalize
+
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others'] # storage.PARTIES, without importing pandas
+PROVINCES = ['NL', 'PE', 'NS', 'NB', 'QC', 'ON', 'MB', 'SK', 'AB', 'BC', 'Territories'] # storage.PROVINCES
+COUNTS = ['Total Voters'] + PARTIES + ['Total Votes']
+
+
+def _path(name, directory):
+
+    return os.path.join(directory, f'{name}.csv')
+
+
+# years of the registry with a datasheet in directory
+
+def years(directory='.'):
+
+    return [year for year in sorted(ELECTIONS) if os.path.exists(_path(year, directory))]
+
+
+# raises KeyError for a year without a datasheet in directory
+
+def _check_year(year, directory='.'):
+
+    available = years(directory)
+
+    if not available:
+        raise KeyError(f'unknown year: {year} (no datasheet found in {directory})')
+    if str(year) not in available:
+        raise KeyError(f"unknown year: {year} (one of {', '.join(available)})")
+
+
+# rows of a yearly datasheet: District as int, vote & voter counts as int, Province & Elected as str
+
+def read_year(year, directory='.'):
+
+    with open(_path(year, directory), newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+
+    for row in rows:
+        row['District'] = int(row['District'])
+        for col in COUNTS:
+            row[col] = int(float(row[col]))
+
+    return rows
+
+
+def read_ridings(directory='.'):
+
+    with open(_path('ridings', directory), newline='', encoding='utf-8-sig') as f:
+        return {int(row['Code']): row['2011 Ridings'] for row in csv.DictReader(f)}
+
+
+# a part of an ED name matching several EDs; candidates: {ED code: ED name}
+
+class AmbiguousRiding(KeyError):
+
+    def __init__(self, key, candidates):
+
+        lines = [f'  {code} {name}' for code, name in candidates.items()]
+        super().__init__('\n'.join([f'{len(candidates)} ridings match {key}:'] + lines))
+        self.candidates = candidates
+
+
+# ED codes of an ED code or ED name, none when nothing matches
+# names are matched exactly, then as a part of ED names (every ED containing it, by code), then fuzzily (the best match)
+
+def find(key, names):
+
+    key = str(key).strip()
+
+    if key.isdigit():
+        return [int(key)] if int(key) in names else []
+
+    index = RidingIndex(names)
+    code = index.lookup(key)
+
+    if code is not None:
+        return [code]
+
+    part = normalize(key)
+    codes = [code for code in sorted(names) if part and part in normalize(names[code])]
+
+    if codes:
+        return codes
+
+    matches = index.fuzzy(key, limit=1)
+
+    return [matches[0][0]] if matches and matches[0][1] >= 0.5 else []
+
+
+# results of one ED by year: vote counts, shares, turnout & the margin of the winner over the runner-up
+# raises KeyError when no ED matches key or for a year without a datasheet, AmbiguousRiding (a KeyError) when several EDs match
+
+def riding(key, election_years=None, directory='.'):
+
+    for year in election_years or []:
+        _check_year(year, directory)
+
+    names = read_ridings(directory)
+    codes = find(key, names)
+
+    if not codes:
+        raise KeyError(f'riding not found: {key}')
+    if len(codes) > 1:
+        raise AmbiguousRiding(key, {code: names[code] for code in codes})
+
+    code = codes[0]
+
+    results = {}
+
+    for year in election_years or years(directory):
+        row = next((row for row in read_year(year, directory) if row['District'] == code), None)
+        if row is None:
+            continue
+        top = sorted((row[party] for party in PARTIES), reverse=True)
+        results[year] = dict(
+            row,
+            Turnout=row['Total Votes'] / row['Total Voters'],
+            Margin=top[0] - top[1],
+            **{f'{party} %': row[party] / row['Total Votes'] for party in PARTIES},
+        )
+
+    return {'District': code, 'Name': names[code], 'Results': results}
+
+
+def _total(rows):
+
+    total = {col: sum(row[col] for row in rows) for col in COUNTS}
+    total.update({f'{party} Seats': sum(row['Elected'] == party for row in rows) for party in PARTIES})
+
+    return total
+
+
+# vote & seat totals by year, nationwide or of one prov/terr; with year, the totals of every prov/terr of that year
+# raises KeyError for a province other than PROVINCES, or for a year without a datasheet
+
+def totals(year=None, province=None, directory='.'):
+
+    if province is not None and province not in PROVINCES:
+        raise KeyError(f"unknown prov/terr: {province} (one of {', '.join(PROVINCES)})")
+    if year is not None:
+        _check_year(year, directory)
+
+    if year is not None:
+        rows = read_year(year, directory)
+        provinces = list(dict.fromkeys(row['Province'] for row in rows))
+        return {pt: _total([row for row in rows if row['Province'] == pt]) for pt in provinces}
+
+    result = {}
+
+    for year in years(directory):
+        rows = read_year(year, directory)
+        result[year] = _total([row for row in rows if province is None or row['Province'] == province])
+
+    return result
+
+
+# plain text table: the first column left-aligned, the others right-aligned
+
+def table(header, rows):
+
+    cells = [[str(value) for value in header]] + [[str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+
+    return '\n'.join(
+        '  '.join(value.ljust(width) if i == 0 else value.rjust(width) for i, (value, width) in enumerate(zip(row, widths)))
+        for row in cells
+    )
@@ -0,0 +1,215 @@
+# incremental stage cache for the 3 parts
+# every stage (per year table loading, name resolution, summaries, part 3 feature frames) is keyed by a hash of:
+# - the stage name, the source code of its function & of the module defining it
+# - its inputs & parameters (DataFrames are hashed by content, pages by their archive hash)
+# results are pickled under the cache directory; the least recently used entries are evicted beyond max_bytes
+# a re-run with unchanged inputs loads every stage from disk, a changed input only recomputes the stages depending on it
+
+import contextlib
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument
+
+settings = {
+    'directory': os.environ.get('ELECTIONS_STAGE_CACHE', './.stage_cache'),
+    'max_bytes': 512 * 2 ** 20,
+    'enabled': os.environ.get('ELECTIONS_STAGE_CACHE_OFF') is None,
+}
+
+
+def configure(directory=None, max_bytes=None, enabled=None):
+
+    if directory is not None:
+        settings['directory'] = directory
+    if max_bytes is not None:
+        settings['max_bytes'] = max_bytes
+    if enabled is not None:
+        settings['enabled'] = enabled
+
+    return dict(settings)
+
+
+# content hash of stage inputs
+# objects may define their own fingerprint() (e.g. RidingIndex), pickles of sets & dicts of str are not stable between runs
+
+def _update(h, obj):
+
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'D' + repr((list(obj.columns), [str(t) for t in obj.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b'S' + repr((obj.name, str(obj.dtype))).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(b'A' + repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (bytes, bytearray)):
+        h.update(b'B' + bytes(obj))
+    elif isinstance(obj, dict):
+        h.update(b'M')
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'L')
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b'T')
+        for item in sorted(obj, key=repr):
+            _update(h, item)
+    elif hasattr(obj, 'fingerprint'):
+        h.update(b'F' + obj.fingerprint().encode())
+    elif callable(obj):
+        h.update(b'C' + source_hash(obj).encode())
+    else:
+        h.update(b'O' + repr(obj).encode())
+
+
+def fingerprint(*objs):
+
+    h = hashlib.sha256()
+
+    for obj in objs:
+        _update(h, obj)
+
+    return h.hexdigest()
+
+
+# functions are identified by their source, or by their bytecode where the source is unavailable (e.g. interactive cells),
+# together with the source of the module defining them: an edit to a helper or a constant of the same module invalidates
+# the stage as well; modules are identified by their own source, callees in other modules go into the key of the stage
+
+def _code(obj):
+
+    try:
+        return inspect.getsource(obj).encode()
+    except (OSError, TypeError):
+        return getattr(getattr(obj, '__code__', None), 'co_code', repr(obj).encode())
+
+
+@functools.lru_cache(maxsize=None)
+def _module_hash(name):
+
+    return hashlib.sha256(_code(sys.modules[name])).hexdigest()
+
+
+def source_hash(obj):
+
+    obj = inspect.unwrap(obj) if callable(obj) else obj
+    h = hashlib.sha256(_code(obj))
+
+    module = inspect.getmodule(obj)
+    if module is not None and module is not obj and module.__name__ in sys.modules:
+        h.update(_module_hash(module.__name__).encode())
+
+    return h.hexdigest()
+
+
+def _path(key):
+
+    return os.path.join(settings['directory'], key[:2], f'{key}.pkl')
+
+
+# run a stage through the cache: run('table12', load_table12, url, key=page_hash) -> func(url)
+# key: extra key material standing for inputs the arguments only refer to (e.g. the hash of the page behind a url)
+# with instrumentation on, the lookup is a stage of its own ('cache:<name>'), annotated with whether it was a hit
+
+def run(name, func, *args, key=None, **kwargs):
+
+    if not instrument.settings['enabled']:
+        return _run(name, func, args, kwargs, key)
+
+    with instrument.stage(f'cache:{name}', instrument.rows(args, 3) + instrument.rows(kwargs, 3)) as record:
+        result = _run(name, func, args, kwargs, key)
+        record['rows_out'] = instrument.rows(result, 3)
+
+    return result
+
+
+def _run(name, func, args, kwargs, key):
+
+    if not settings['enabled']:
+        return func(*args, **kwargs)
+
+    digest = fingerprint(name, source_hash(func), args, kwargs, key)
+    path = _path(digest)
+
+    # the cache is shared by the worker processes: an entry may be evicted or replaced meanwhile,
+    # a missing, truncated or otherwise unreadable entry is a miss
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+    except Exception:
+        pass
+    else:
+        with contextlib.suppress(OSError):
+            os.utime(path) # recently used
+        instrument.annotate(cached=True)
+        return result
+
+    instrument.annotate(cached=False)
+    result = func(*args, **kwargs)
+
+    # entries are written through a temporary file of this process & thread, never read half written
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+
+    evict()
+
+    return result
+
+
+# remove least recently used entries until the cache fits in max_bytes
+# entries removed or replaced by another process meanwhile are skipped
+
+def evict(max_bytes=None):
+
+    max_bytes = settings['max_bytes'] if max_bytes is None else max_bytes
+    entries = []
+
+    for root, _, files in os.walk(settings['directory']):
+        for name in files:
+            if name.endswith('.pkl'):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        total -= size
+
+    return total
+
+
+def clear():
+
+    return evict(0)
@@ -0,0 +1,109 @@
+# columnar storage of the yearly datasheets
+# part 1 writes every year as an Arrow IPC (Feather v2) file with a fixed, typed schema next to the csv exports:
+# - District as int32, vote counts & voter counts as int64
+# - Province & Elected as categoricals with fixed categories, identical for every year
+# files are written uncompressed, so parts 2 & 3 read them memory-mapped, loading only the columns they need
+# the csv files stay as the export format, & are read (with the same schema) when no columnar file is found
+
+import os
+
+import pandas as pd
+
+from canelection import instrument
+
+PROVINCES = ['NL', 'PE', 'NS', 'NB', 'QC', 'ON', 'MB', 'SK', 'AB', 'BC', 'Territories']
+PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']
+
+SCHEMA = {
+    'District': 'int32',
+    'Province': pd.CategoricalDtype(PROVINCES),
+    'Total Voters': 'int64',
+    'Liberal': 'int64',
+    'Conservative': 'int64',
+    'NDP': 'int64',
+    'BQ': 'int64',
+    'Others': 'int64',
+    'Total Votes': 'int64',
+    'Elected': pd.CategoricalDtype(PARTIES),
+}
+
+RIDINGS_SCHEMA = {
+    'Code': 'int32',
+    '2011 Ridings': 'string',
+}
+
+
+def typed(df, schema=SCHEMA):
+
+    return df[list(schema)].astype(schema).reset_index(drop=True)
+
+
+def _path(name, directory, ext):
+
+    return os.path.join(directory, f'{name}.{ext}')
+
+
+def write_feather(df, name, directory='.', schema=SCHEMA):
+
+    df = typed(df, schema)
+    df.to_feather(_path(name, directory, 'feather'), compression='uncompressed')
+
+    return df
+
+
+# file a sheet is read from: its columnar copy, or the csv export when there is none
+
+def source_path(name, directory='.'):
+
+    path = _path(name, directory, 'feather')
+
+    return path if os.path.exists(path) else _path(name, directory, 'csv')
+
+
+def read_feather(name, columns=None, directory='.', schema=SCHEMA):
+
+    path = source_path(name, directory)
+
+    if path.endswith('.feather'):
+        from pyarrow import feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    # csv export fallback, cast to the same schema
+    columns = columns or list(schema)
+    df = pd.read_csv(path, usecols=columns, encoding='utf-8-sig')
+
+    return df.astype({col: schema[col] for col in columns})[columns]
+
+
+# one yearly datasheet, e.g. read_year('2008', columns=['District', 'Elected'])
+
+@instrument.staged()
+def write_year(df, year, directory='.'):
+
+    return write_feather(df, str(year), directory)
+
+
+@instrument.staged()
+def read_year(year, columns=None, directory='.'):
+
+    return read_feather(str(year), columns, directory)
+
+
+def read_years(years, columns=None, directory='.'):
+
+    return {str(year): read_year(year, columns, directory) for year in years}
+
+
+# ED code / ED name reference sheet
+
+def write_ridings(rd, directory='.'):
+
+    return write_feather(rd.reset_index(), 'ridings', directory, RIDINGS_SCHEMA)
+
+
+def read_ridings(directory='.'):
+
+    df = read_feather('ridings', directory=directory, schema=RIDINGS_SCHEMA)
+
+    return dict(zip(df['Code'].tolist(), df['2011 Ridings'].tolist()))
@@ -0,0 +1,185 @@
+# electoral system counterfactuals over the provincial vote totals & seat counts of the results cube
+# seats of every province are re-allocated under:
+# - list PR by province with D'Hondt or Sainte-Laguë divisors, with a vote threshold (national or provincial)
+# - mixed-member proportional (MMP): a top-up share of the seats of a province becomes list seats, the rest constituencies;
+#   constituency seats are the actual first-past-the-post seats scaled down (largest remainder),
+#   list seats are allocated by the divisor method on top of them (compensatory, as in AMS)
+# topup=1 is pure list PR, topup=0 the actual first-past-the-post result
+# all configurations of a parameter grid are evaluated at once: arrays are configs x years x provinces x parties,
+# highest averages come from one sort of the quotients of every (config, year, province)
+# disproportionality: Gallagher least squares index & Loosemore-Hanby index, in percentage points
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument
+
+# "Others" lumps minor parties & independents together, it is not a list of its own & wins no list seats
+LIST_PARTIES = ['Liberal', 'Conservative', 'NDP', 'BQ']
+
+DIVISORS = {
+    'dhondt': lambda s: s + 1.0,
+    'sainte-lague': lambda s: 2.0 * s + 1.0,
+}
+
+
+# highest averages: n_seats[...] seats among the parties of the last axis of votes, on top of initial[...] seats
+# quotients votes / divisor(initial + j) for j < max seats are sorted once, the n largest quotients win a seat each
+# exactly n seats are allocated: equal quotients go to the party with more votes, then to the first party (stable sort)
+# quotients of 0 votes never win a seat, seats are left unallocated (with a warning) when no party has any vote
+
+def allocate(votes, n_seats, method='dhondt', initial=None):
+
+    votes = np.asarray(votes, dtype=float)
+    n_seats = np.asarray(n_seats, dtype=np.int64)
+    initial = np.zeros(votes.shape, dtype=np.int64) if initial is None else np.asarray(initial, dtype=np.int64)
+    n_parties = votes.shape[-1]
+    depth = max(int(n_seats.max()), 1)
+
+    # parties by decreasing votes, so that the stable sort breaks ties between equal quotients by votes
+    by_votes = np.argsort(-votes, axis=-1, kind='stable')
+    votes = np.take_along_axis(votes, by_votes, axis=-1)
+    initial = np.take_along_axis(np.broadcast_to(initial, votes.shape), by_votes, axis=-1)
+
+    quotients = votes[..., None] / DIVISORS[method](initial[..., None] + np.arange(depth))
+    flat = quotients.reshape(*votes.shape[:-1], n_parties * depth)
+    order = np.argsort(-flat, axis=-1, kind='stable')
+
+    won = np.zeros(flat.shape, dtype=bool)
+    np.put_along_axis(won, order, np.arange(flat.shape[-1]) < n_seats[..., None], axis=-1)
+    won &= flat > 0
+
+    seats = np.empty(votes.shape, dtype=np.int64)
+    np.put_along_axis(seats, by_votes, won.reshape(quotients.shape).sum(axis=-1), axis=-1)
+
+    unallocated = int((n_seats - seats.sum(axis=-1)).sum())
+    if unallocated:
+        warnings.warn(f'{unallocated} seats left unallocated: no party with votes (e.g. none above the threshold)')
+
+    return seats
+
+
+# largest remainder scaling of seat counts to new totals along the last axis
+
+def scale(seats, totals):
+
+    seats = np.asarray(seats, dtype=float)
+    current = seats.sum(axis=-1, keepdims=True)
+    exact = np.divide(seats * totals[..., None], current, out=np.zeros_like(seats), where=current > 0)
+
+    floor = np.floor(exact).astype(np.int64)
+    short = totals - floor.sum(axis=-1)
+    order = np.argsort(-(exact - floor), axis=-1, kind='stable')
+    rank = np.argsort(order, axis=-1)
+
+    return floor + (rank < short[..., None])
+
+
+# configurations of a grid, one row per combination
+
+def grid(method=('dhondt',), threshold=(0.0,), topup=(1.0,), threshold_level=('province',)):
+
+    index = pd.MultiIndex.from_product(
+        [list(np.atleast_1d(method)), list(np.atleast_1d(threshold)), list(np.atleast_1d(topup)), list(np.atleast_1d(threshold_level))],
+        names=['Method', 'Threshold', 'Topup', 'Threshold Level'],
+    )
+
+    return index.to_frame(index=False)
+
+
+class Counterfactuals:
+
+    def __init__(self, configs, seats, votes, years, provinces, parties):
+
+        self.configs = configs # one row per configuration
+        self.seats = seats # configs x years x provinces x parties
+        self.votes = votes # years x provinces x parties
+        self.years = years
+        self.provinces = provinces
+        self.parties = parties
+
+    def _index(self):
+
+        return pd.MultiIndex.from_frame(
+            self.configs.loc[self.configs.index.repeat(len(self.years))].assign(Year=self.years * len(self.configs))
+        )
+
+    # nationwide seats by configuration & year
+
+    def national(self):
+
+        seats = self.seats.sum(axis=2).reshape(-1, len(self.parties))
+
+        return pd.DataFrame(seats, index=self._index(), columns=self.parties)
+
+    # seats of one province by configuration & year
+
+    def province(self, province):
+
+        seats = self.seats[:, :, self.provinces.index(province)].reshape(-1, len(self.parties))
+
+        return pd.DataFrame(seats, index=self._index(), columns=self.parties)
+
+    # Gallagher & Loosemore-Hanby indices by configuration & year, nationwide (or by province with by_province=True)
+
+    def indices(self, by_province=False):
+
+        votes = self.votes if by_province else self.votes.sum(axis=1)
+        seats = self.seats if by_province else self.seats.sum(axis=2)
+
+        v = 100 * votes / votes.sum(axis=-1, keepdims=True)
+        s = 100 * seats / np.maximum(seats.sum(axis=-1, keepdims=True), 1)
+        diff = s - v[None]
+
+        result = {
+            'Gallagher': np.sqrt(0.5 * (diff ** 2).sum(axis=-1)),
+            'Loosemore-Hanby': 0.5 * np.abs(diff).sum(axis=-1),
+        }
+
+        if by_province:
+            index = self._index()
+            columns = pd.MultiIndex.from_product([list(result), self.provinces])
+            values = np.concatenate([value.reshape(len(index), -1) for value in result.values()], axis=1)
+            return pd.DataFrame(values, index=index, columns=columns)
+
+        return pd.DataFrame({name: value.ravel() for name, value in result.items()}, index=self._index())
+
+
+# seat allocations of all configurations over a results cube
+# configs: frame of Method, Threshold (vote share, 0.05 = 5 %), Topup (share of list seats), Threshold Level ('national' / 'province')
+
+@instrument.staged()
+def counterfactuals(results, configs=None, list_parties=LIST_PARTIES):
+
+    configs = grid() if configs is None else configs.reset_index(drop=True)
+
+    votes = results.votes.astype(float) # years x provinces x parties
+    fptp = results.seats
+    totals = fptp.sum(axis=-1) # seats by year x province
+    listed = np.isin(results.parties, list_parties)
+
+    # threshold shares, nationwide or in the province
+    national_share = votes.sum(axis=1, keepdims=True) / votes.sum(axis=(1, 2), keepdims=True)
+    province_share = votes / votes.sum(axis=-1, keepdims=True)
+
+    threshold = configs['Threshold'].to_numpy(dtype=float)[:, None, None, None]
+    level = (configs['Threshold Level'] == 'national').to_numpy()[:, None, None, None]
+    share = np.where(level, national_share[None], province_share[None])
+    eligible = (share >= threshold) & listed
+
+    # constituency seats: actual winners scaled to the constituency part of the province
+    topup = configs['Topup'].to_numpy(dtype=float)[:, None, None]
+    constituencies = np.rint(totals[None] * (1 - topup)).astype(np.int64)
+    constituency_seats = scale(np.broadcast_to(fptp, (len(configs),) + fptp.shape), constituencies)
+    list_seats = totals[None] - constituencies
+
+    seats = constituency_seats.copy()
+    list_votes = np.where(eligible, votes[None], 0.0)
+
+    for method in configs['Method'].unique():
+        rows = (configs['Method'] == method).to_numpy()
+        seats[rows] += allocate(list_votes[rows], list_seats[rows], method, initial=constituency_seats[rows])
+
+    return Counterfactuals(configs, seats, votes, results.years, results.provinces, results.parties)
@@ -0,0 +1,236 @@
+# streaming parser for the Table 11 / Table 12 pages of Elections Canada
+# instead of building DataFrames of every table on the page with pd.read_html, the page is parsed incrementally:
+# - only the rows of the first table containing the match text are kept, parsing stops at the end of that table
+# - parsed elements are cleared as soon as their row is read, so memory stays flat as pages grow
+# - header, sub-header & total rows are skipped while parsing, numbers & ED names are emitted already converted
+
+import io
+import re
+
+import pandas as pd
+from lxml import etree
+
+_space = re.compile(r'\s+')
+_digits = re.compile(r'\d+')
+
+
+def _text(elem):
+
+    return _space.sub(' ', ''.join(elem.itertext())).strip()
+
+
+# converting number strings to int, e.g. '18 335' -> 18335; None for anything else (headers, '', 'No./Nbre')
+
+def to_int(text):
+
+    digits = _space.sub('', text or '')
+
+    return int(digits) if _digits.fullmatch(digits) else None
+
+
+def to_float(text):
+
+    try:
+        return float(_space.sub('', text or '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+# converting riding names, keeping English names & use short dash "-" only
+
+def rdname(text):
+
+    return text.replace('\x97', '-').split('/')[0]
+
+
+def _header_name(text):
+
+    return text.split('-')[0].strip()
+
+
+def _release(elem):
+
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+# cells spanning down from previous rows, at the current end of the row
+
+def _fill(row, carry):
+
+    while len(row) in carry and carry[len(row)][0] > 0:
+        carry[len(row)][0] -= 1
+        row.append(carry[len(row)][1])
+
+
+# yields the rows of the first table containing match as lists of cell texts
+# colspan & rowspan are expanded the same way pd.read_html does, so cell positions match its columns
+
+def iter_table_rows(source, match='Avalon'):
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    depth = 0 # table nesting depth
+    pending = [] # rows of the current table, held back until match is seen
+    matched = False
+    row = None
+    carry = {} # column -> [remaining rows, text] of cells spanning multiple rows
+
+    events = etree.iterparse(source, events=('start', 'end'), tag=('table', 'tr', 'td', 'th'), html=True, recover=True)
+
+    for event, elem in events:
+
+        tag = elem.tag
+
+        if event == 'start':
+            if tag == 'table':
+                depth += 1
+                if depth == 1:
+                    pending, matched, carry = [], False, {}
+            elif tag == 'tr' and depth:
+                row = []
+            continue
+
+        if tag in ('td', 'th') and row is not None:
+            text = _text(elem)
+            rowspan = int(elem.get('rowspan') or 1)
+            for _ in range(max(int(elem.get('colspan') or 1), 1)):
+                _fill(row, carry)
+                if rowspan > 1:
+                    carry[len(row)] = [rowspan - 1, text]
+                row.append(text)
+            elem.clear()
+
+        elif tag == 'tr' and row is not None:
+            # spanning cells continued past the last cell of this row
+            _fill(row, carry)
+            carry = {col: item for col, item in carry.items() if item[0] > 0}
+
+            if matched:
+                yield row
+            else:
+                pending.append(row)
+                if any(match in cell for cell in row):
+                    matched = True
+                    yield from pending
+                    pending = []
+
+            row = None
+            _release(elem)
+
+        elif tag == 'table':
+            depth -= 1
+            if depth == 0:
+                if matched:
+                    return
+                pending = []
+            _release(elem)
+
+
+# locate the columns of the named headers in the rows preceding the data
+
+def _locate(rows, names):
+
+    found = {}
+
+    for row in rows:
+        for i, cell in enumerate(row):
+            name = _header_name(cell)
+            for key in names:
+                if key not in found and name.startswith(key):
+                    found[key] = i
+        if len(found) == len(names):
+            return found
+
+    return None
+
+
+def _parse(source, match, names, count_col, pct_col, numeric):
+
+    rows = iter_table_rows(source, match)
+    header = []
+    cols = None
+
+    for row in rows:
+        header.append(row)
+        cols = _locate(header, names)
+        if cols is not None:
+            break
+
+    if cols is None:
+        raise ValueError(f'headers {names} not found in the table matching {match!r}')
+
+    cols['count'], cols['pct'] = count_col, pct_col
+    width = max(cols.values()) + 1
+
+    for row in rows:
+
+        if len(row) < width:
+            continue
+
+        count_text, pct_text = row[count_col], row[pct_col]
+        # rows spanning the vote columns (province names) & repeated header rows
+        if count_text == pct_text or count_text == 'No./Nbre':
+            continue
+
+        values = {key: row[col] for key, col in cols.items()}
+        values['count'] = to_int(count_text)
+        if values['count'] is None:
+            continue
+        for key in numeric:
+            values[key] = to_int(values[key])
+
+        yield values
+
+
+# table 12: one row per candidate
+# columns: Electoral district (English name), Candidate and affiliation, Vote Count (int), Vote % (float)
+
+def read_table12(source, match='Avalon'):
+
+    district, candidates, counts, pcts = [], [], [], []
+    last = None
+
+    for values in _parse(source, match, ['Electoral district', 'Candidate'], 4, 5, []):
+        # the ED name is only given on the first candidate row of an ED
+        last = values['Electoral district'] or last
+        if last is None:
+            raise ValueError(
+                f"candidate row {values['Candidate']!r} comes before any electoral district in the table matching {match!r}"
+            )
+        district.append(rdname(last))
+        candidates.append(values['Candidate'])
+        counts.append(values['count'])
+        pcts.append(to_float(values['pct']))
+
+    return pd.DataFrame({
+        'Electoral district': district,
+        'Candidate and affiliation': candidates,
+        'Vote Count': pd.array(counts, dtype='int64'),
+        'Vote %': pd.array(pcts, dtype='float64'),
+    })
+
+
+# table 11: one row per ED
+# columns: Electoral district (English name), Electors on the lists (int), Valid Ballots Count (int)
+
+def read_table11(source, match='Avalon'):
+
+    district, electors, valid = [], [], []
+
+    for values in _parse(source, match, ['Electoral district', 'Electors on the lists'], 4, 5, ['Electors on the lists']):
+        if values['Electoral district'] == 'Totals/Totaux' or values['Electors on the lists'] is None:
+            continue
+        district.append(rdname(values['Electoral district']))
+        electors.append(values['Electors on the lists'])
+        valid.append(values['count'])
+
+    return pd.DataFrame({
+        'Electoral district': district,
+        'Electors on the lists': pd.array(electors, dtype='int64'),
+        'Valid Ballots Count': pd.array(valid, dtype='int64'),
+    })
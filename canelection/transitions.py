@@ -0,0 +1,211 @@
+# seat transitions between elections
+# winners are encoded as small integer codes (one int8 per riding & election, -1 where a riding has no result),
+# the transition matrices of all ordered pairs of elections (earlier -> later) come out of a single bincount:
+# every (pair, group, party A, party B) cell is one flat bin, so no boolean filtering per party pair is needed
+# groupings (e.g. provinces) are an extra axis of the same bincount
+
+import numpy as np
+import pandas as pd
+
+from canelection import instrument
+
+
+# winner labels -> int8 codes, position in labels; unknown labels & missing winners are -1
+
+def encode(values, labels):
+
+    values = pd.DataFrame(values)
+    codes = pd.Categorical(values.to_numpy(dtype=object).ravel(), categories=labels).codes
+
+    return codes.reshape(values.shape).astype(np.int8)
+
+
+# positions of the elections of every ordered pair (earlier, later), or of consecutive elections only
+
+def pairs(n_elections, consecutive=False):
+
+    if consecutive:
+        first = np.arange(n_elections - 1)
+        return first, first + 1
+
+    return np.triu_indices(n_elections, k=1)
+
+
+# counts[pair, group, party A, party B]: ridings won by party A in the earlier & by party B in the later election of the pair
+# winners: ridings x elections codes; groups: group code of every riding (-1 left out), or None for one group
+
+def transition_counts(winners, n_labels, groups=None, n_groups=1, consecutive=False):
+
+    winners = np.asarray(winners)
+    first, second = pairs(winners.shape[1], consecutive)
+    n_pairs = len(first)
+
+    a = winners[:, first].astype(np.int64)
+    b = winners[:, second].astype(np.int64)
+    g = np.zeros((len(winners), 1), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)[:, None]
+    pair = np.arange(n_pairs)[None, :]
+
+    bins = ((pair * n_groups + g) * n_labels + a) * n_labels + b
+    valid = (a >= 0) & (b >= 0) & (g >= 0)
+    counts = np.bincount(bins[valid], minlength=n_pairs * n_groups * n_labels * n_labels)
+
+    return counts.reshape(n_pairs, n_groups, n_labels, n_labels)
+
+
+# transition tables of all ordered pairs of elections, as {(year A, year B): DataFrame}
+# each table has the '<year A> Elected' parties as index & the '<year B> Elected' parties as columns, the layout heatmaps take
+# with groups (e.g. the Province column), the index gets the group as an outer level
+
+def transition_tables(winners, years, labels, groups=None, consecutive=False):
+
+    years = list(years)
+    labels = list(labels)
+    n = len(labels)
+
+    if groups is None:
+        group_codes, group_labels, group_name = None, [None], None
+    else:
+        categories = pd.Categorical(groups)
+        group_codes, group_labels = categories.codes, list(categories.categories)
+        group_name = getattr(groups, 'name', None)
+
+    counts = transition_counts(winners, n, group_codes, len(group_labels), consecutive)
+    first, second = pairs(len(years), consecutive)
+    tables = {}
+
+    # index & columns are built once per election, shared by all the tables of its pairs
+    if groups is None:
+        indexes = [pd.Index(labels, name=f'{year} Elected') for year in years]
+    else:
+        indexes = [pd.MultiIndex.from_product([group_labels, labels], names=[group_name, f'{year} Elected']) for year in years]
+    columns = [pd.Index(labels, name=f'{year} Elected') for year in years]
+
+    for p, (i, j) in enumerate(zip(first, second)):
+        tables[years[i], years[j]] = pd.DataFrame(counts[p].reshape(-1, n), index=indexes[i], columns=columns[j], copy=False)
+
+    return tables
+
+
+# ridings x elections winner matrix, the core structure of the hold / flip analysis
+# codes[riding, election] is the int8 position of the winner in labels (-1 where the riding has no result that year)
+# holds, flips, party counts & streaks are array operations over the matrix, for any number of elections
+# text labels ("LIB flip to CON") are only made on demand, for display
+
+class WinnerMatrix:
+
+    def __init__(self, codes, districts, years, labels):
+
+        self.codes = np.asarray(codes, dtype=np.int8)
+        self.districts = pd.Index(districts, name='District')
+        self.years = list(years)
+        self.labels = list(labels)
+
+    # frames: {year: datasheet} in election order; ridings are lined up by ED code
+    # mapping: optional {winner: label} applied to the winner column first, e.g. party names -> 3 letter abbreviations
+
+    @classmethod
+    @instrument.staged('WinnerMatrix.from_frames')
+    def from_frames(cls, frames, labels, column='Elected', mapping=None):
+
+        districts = np.unique(np.concatenate([df['District'].to_numpy() for df in frames.values()]))
+        codes = np.full((len(districts), len(frames)), -1, dtype=np.int8)
+
+        for j, df in enumerate(frames.values()):
+            winners = df[column].map(mapping) if mapping is not None else df[column]
+            codes[np.searchsorted(districts, df['District'].to_numpy()), j] = encode(winners, labels)[:, 0]
+
+        return cls(codes, districts, frames.keys(), labels)
+
+    def _pair(self, year_a, year_b):
+
+        return self.years.index(year_a), self.years.index(year_b)
+
+    def pair_names(self):
+
+        return [f'{a} to {b}' for a, b in zip(self.years[:-1], self.years[1:])]
+
+    # winners as labels, one '<year> Elected' column per election
+
+    def decode(self):
+
+        table = np.array(self.labels + [None], dtype=object)
+
+        return pd.DataFrame(table[self.codes], index=self.districts, columns=[f'{year} Elected' for year in self.years])
+
+    # hold / flip flags between consecutive elections, ridings x (elections - 1)
+    # a riding missing from either election neither holds nor flips
+
+    def valid(self):
+
+        return (self.codes[:, :-1] >= 0) & (self.codes[:, 1:] >= 0)
+
+    def holds(self):
+
+        return (np.diff(self.codes, axis=1) == 0) & self.valid()
+
+    def flips(self):
+
+        return (np.diff(self.codes, axis=1) != 0) & self.valid()
+
+    # number of distinct parties elected in every riding
+
+    def party_count(self):
+
+        seen = np.zeros((len(self.codes), len(self.labels) + 1), dtype=bool)
+        seen[np.arange(len(self.codes))[:, None], self.codes] = True # -1 lands in the last column
+
+        return seen[:, :-1].sum(axis=1)
+
+    def flip_count(self):
+
+        return self.flips().sum(axis=1)
+
+    # longest run of elections won by the same party in every riding (1: a different winner every time)
+    # runs are numbered across the flattened matrix, each riding & every flip starting a new run
+
+    def longest_hold(self):
+
+        n_ridings, n_years = self.codes.shape
+        starts = np.ones((n_ridings, n_years), dtype=bool)
+        starts[:, 1:] = ~self.holds()
+
+        runs = np.cumsum(starts.ravel()) - 1
+        lengths = np.bincount(runs, weights=(self.codes >= 0).ravel())
+        first = runs.reshape(n_ridings, n_years)[:, 0]
+
+        return np.maximum.reduceat(lengths, first).astype(int)
+
+    # metrics of every riding as a frame indexed by ED code
+
+    @instrument.staged('WinnerMatrix.metrics')
+    def metrics(self):
+
+        return pd.DataFrame({
+            'Party Count': self.party_count(),
+            'Flip Count': self.flip_count(),
+            'Longest Hold': self.longest_hold(),
+        }, index=self.districts)
+
+    # '<A> holds' / '<A> flip to <B>' labels between 2 elections, made from a label table rather than per riding
+
+    def change_labels(self, year_a, year_b):
+
+        i, j = self._pair(year_a, year_b)
+        a, b = self.codes[:, i], self.codes[:, j]
+
+        table = np.array([
+            [f'{pa} holds' if pa == pb else f'{pa} flip to {pb}' for pb in self.labels]
+            for pa in self.labels
+        ], dtype=object)
+        result = np.full(len(a), None, dtype=object)
+        valid = (a >= 0) & (b >= 0)
+        result[valid] = table[a[valid], b[valid]]
+
+        return pd.Series(result, index=self.districts, name=f'{year_a} to {year_b}')
+
+    # transition tables of all ordered pairs of elections, see transition_tables()
+
+    @instrument.staged('WinnerMatrix.transitions')
+    def transitions(self, groups=None, consecutive=False):
+
+        return transition_tables(self.codes, self.years, self.labels, groups, consecutive)
@@ -0,0 +1,166 @@
+# the 3 parts as functions over the outputs in a directory, run by the command line (canelection/cli.py)
+# - collect: part 1, pages -> yearly datasheets, ED code / ED name reference sheet, columnar copies & results cube
+# - analyze: part 2 tables, vote shares, seats, transitions, most flipped EDs, electoral system counterfactuals & seat projection
+# - render: every part 2 chart, rendered headless into a directory
+# - train: part 3, feature store, riding types, model search & the cross-year evaluation of the regression
+# matplotlib & seaborn are only imported when charts are drawn, sklearn only when models are fitted
+
+import os
+
+import numpy as np
+
+from canelection import (
+    archive, batch, charts, clustering, cube, elections, features, fetch, modelsearch, pipeline, projection,
+    storage, systems, transitions,
+)
+from canelection.elections import ELECTIONS
+
+ABBREVIATIONS = {'Liberal': 'LIB', 'Conservative': 'CON', 'NDP': 'NDP', 'BQ': 'BLQ', 'Others': 'OTH'}
+
+
+# part 1: fetch the pages missing from the page archive, run the per-year pipeline & write all outputs into directory
+# pages are parsed from the archive only (offline) once fetched; the archive mode is restored afterwards
+# returns {year: datasheet}, {year: ED name resolution}
+
+def collect(directory='.', election_registry=ELECTIONS, max_workers=None, fetch_workers=12):
+
+    mode = archive.settings['mode']
+    os.makedirs(directory, exist_ok=True)
+
+    try:
+        fetch.prefetch(elections.page_urls(election_registry), max_workers=fetch_workers, per_host=6)
+        archive.configure(mode='offline')
+
+        rd_lists = pipeline.riding_lists(election_registry)
+        indexes = pipeline.riding_indexes(election_registry, rd_lists)
+        results = pipeline.run_all(election_registry, indexes, max_workers)
+    finally:
+        archive.configure(mode=mode)
+
+    data = {year: result[0] for year, result in results.items()}
+    resolved = {year: result[1] for year, result in results.items()}
+    latest = max(election_registry)
+    rd = pipeline.reference_sheet(rd_lists[latest], resolved[latest])
+
+    for year, df in data.items():
+        df.to_csv(os.path.join(directory, f'{year}.csv'), index=False)
+        storage.write_year(df, year, directory)
+
+    rd.to_csv(os.path.join(directory, 'ridings.csv'), encoding='utf-8-sig')
+    storage.write_ridings(rd, directory)
+    cube.write_cube(cube.ResultsCube.from_frames(data), directory)
+
+    return data, resolved
+
+
+# yearly datasheets aligned on the latest representation order, the results cube & the winner matrix, as in part 2
+# the stored cube is used when no year was transposed; winner matrix columns are named by the last 2 digits of the year
+
+def load(directory='.'):
+
+    frames = batch.load_frames(directory=directory)
+    order = ELECTIONS[max(frames)]['order']
+
+    if all(ELECTIONS[year]['order'] == order for year in frames):
+        results = cube.read_cube(sorted(frames), directory)
+    else:
+        results = cube.ResultsCube.from_frames(frames)
+
+    winner_matrix = transitions.WinnerMatrix.from_frames(
+        {year[-2:]: df for year, df in frames.items()},
+        sorted(ABBREVIATIONS.values()),
+        mapping=ABBREVIATIONS,
+    )
+
+    return frames, results, winner_matrix
+
+
+def _provinces(frames, winner_matrix):
+
+    return next(iter(frames.values())).set_index('District')['Province'].reindex(winner_matrix.districts)
+
+
+# part 2 tables of one election (the latest by default), as {title: frame}
+# the seat projection draws n scenarios of national & provincial swings on the results of the election
+
+def analyze(directory='.', year=None, n=100_000, seed=2011, max_workers=None):
+
+    frames, results, winner_matrix = load(directory)
+    year = str(year or max(frames))
+    names = storage.read_ridings(directory)
+
+    tables = {
+        'Vote shares': results.shares(),
+        'Seats': results.seat_counts(),
+        f'Vote shares by prov/terr, {year}': results.shares(year),
+        f'Seats by prov/terr, {year}': results.seat_counts(year),
+    }
+
+    previous = [y for y in results.years if y < year]
+    if previous:
+        tables[f'Gains & losses, {previous[-1]} to {year}'] = winner_matrix.transitions()[previous[-1][-2:], year[-2:]]
+
+    metrics = winner_matrix.metrics()
+    flipped = metrics[metrics['Flip Count'] == metrics['Flip Count'].max()]
+    tables['Most flipped EDs'] = flipped.assign(Name=flipped.index.map(names))
+
+    system_grid = systems.grid(method=['dhondt', 'sainte-lague'], topup=np.arange(0, 1.01, 0.25))
+    indices = systems.counterfactuals(results, system_grid).indices()
+    tables[f'Disproportionality by top-up share, {year}'] = (
+        indices.xs((year, 0.0, 'province'), level=['Year', 'Threshold', 'Threshold Level']).unstack('Method')
+    )
+
+    if n:
+        seat_projection = projection.project(frames[year], n=n, seed=seed, max_workers=max_workers)
+        tables[f'Seat projection, {year} baseline'] = seat_projection.summary()
+
+    return tables
+
+
+# part 2 charts of every year & prov/terr into chart_directory, skipping charts whose data did not change
+
+def render(directory='.', chart_directory='./charts', formats=('png',), max_workers=None, force=False):
+
+    frames, results, winner_matrix = load(directory)
+    jobs = charts.build_jobs(results, winner_matrix, provinces=_provinces(frames, winner_matrix))
+
+    return charts.render_all(jobs, chart_directory, formats, max_workers=max_workers, force=force)
+
+
+# part 3: feature store & riding types of every year, then the cross-year evaluation of model (canelection/batch.py)
+# search=True first runs the cross-validated model search of every prov/terr on the latest base / target pair,
+# & evaluates the configuration with the lowest mean MSE over the prov/terr instead of model
+# returns the MSE matrix, the per-ED predictions & the best configuration of every prov/terr (None without search)
+
+def train(directory='.', feature_directory='./features', k=3, seed=308, model=batch.MODEL, search=False, n_jobs=None):
+
+    frames = batch.load_frames(directory=directory)
+    features.build(frames, feature_directory)
+    riding_types, _ = clustering.cluster_all(frames, k=k, seed=seed, n_jobs=n_jobs)
+
+    best = None
+
+    if search:
+        base, target = features.pairs(frames)[-1]
+        fs = features.load(base, target, feature_directory)
+        n_types = int(riding_types['Riding_type'].max()) + 1
+        datasets = {}
+
+        # same design matrix as the per-province models of the batch evaluation
+        for pt in fs.provinces:
+            district, x, y = fs.arrays(pt)
+            strata = batch.riding_types_of(riding_types, base, district)
+            datasets[pt] = (features.design(x, strata, n_types), y, strata)
+
+        search_results, _ = modelsearch.search_all(datasets, seed=seed, n_jobs=n_jobs)
+        best = search_results[search_results['Rank'] == 1].reset_index(drop=True)
+
+        if len(search_results):
+            overall = search_results.groupby(['Model', 'Alpha', 'Degree'], sort=False)['MSE'].mean()
+            name, alpha, degree = overall.idxmin()
+            model = (name, float(alpha), int(degree))
+
+    mse, predictions = batch.run(riding_types, list(frames), feature_directory, model, n_jobs=n_jobs)
+
+    return mse, predictions, best
+
@@ -0,0 +1,25 @@
+# page archive of canelection/archive.py: concurrent recording by several processes
+#
+#   python -m pytest tests
+
+from canelection import archive, parallel
+
+
+def _record(archive_dir, worker):
+
+    for i in range(20):
+        archive.record(f'https://example.org/{worker}/{i}.html', f'page {worker} {i}'.encode(), archive_dir)
+
+
+def test_record_concurrent_processes(tmp_path):
+
+    archive_dir = str(tmp_path / 'archive')
+    workers = range(4)
+
+    with parallel.process_pool(4) as pool:
+        list(pool.map(_record, [archive_dir] * len(workers), workers))
+
+    manifest = archive.load_manifest(archive_dir)
+
+    assert len(manifest) == 4 * 20
+    assert archive.lookup('https://example.org/3/19.html', archive_dir) == b'page 3 19'
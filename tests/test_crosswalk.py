@@ -0,0 +1,35 @@
+# redistribution crosswalks of canelection/crosswalk.py: totals are kept, EDs missing from a crosswalk are refused
+#
+#   python -m pytest tests
+
+import pandas as pd
+import pytest
+
+from canelection import crosswalk
+
+OVERLAPS = pd.DataFrame({'From': [10001, 10001, 10002], 'To': [10101, 10102, 10102], 'Weight': [1.0, 1.0, 2.0]})
+
+
+def test_transpose_keeps_totals():
+
+    df = pd.DataFrame({'District': [10001, 10002], 'Liberal': [10.0, 20.0], 'Total Votes': [30.0, 40.0]})
+
+    result = crosswalk.Crosswalk.from_overlaps(OVERLAPS).transpose(df)
+
+    assert result['District'].tolist() == [10101, 10102]
+    assert result['Liberal'].tolist() == [5.0, 25.0]
+    assert result['Total Votes'].sum() == 70.0
+
+
+def test_transpose_missing_ed():
+
+    df = pd.DataFrame({'District': [10001, 10002, 10003], 'Liberal': [10.0, 20.0, 30.0]})
+
+    with pytest.raises(ValueError, match=r'1 EDs missing from the crosswalk: \[10003\]'):
+        crosswalk.Crosswalk.from_overlaps(OVERLAPS).transpose(df)
+
+
+def test_then_missing_ed():
+
+    with pytest.raises(ValueError, match=r'missing from the chained crosswalk: \[10102\]'):
+        crosswalk.Crosswalk.from_overlaps(OVERLAPS).then(crosswalk.Crosswalk.identity([10101]))
@@ -0,0 +1,136 @@
+# pooled fetcher of canelection/fetch.py against a local stand-in server:
+# gzip decoding, retries on 503, redirects & the FetchError of the failed urls, carrying the fetched pages
+#
+#   python -m pytest tests
+
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from canelection import archive, fetch
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1' # keep-alive, as the Elections Canada server
+
+    def _send(self, status, body=b'', headers=None):
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        server = self.server
+
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+
+        if self.path.startswith('/page/'):
+            self._send(200, f'page {self.path[6:]}'.encode())
+        elif self.path == '/gzip':
+            assert 'gzip' in self.headers.get('Accept-Encoding', '')
+            self._send(200, gzip.compress(b'compressed page'), {'Content-Encoding': 'gzip'})
+        elif self.path == '/flaky':
+            # 503 twice, then the page
+            self._send(503) if hits <= 2 else self._send(200, b'flaky page')
+        elif self.path == '/redirect':
+            self._send(302, headers={'Location': '/page/target'})
+        elif self.path == '/loop':
+            self._send(301, headers={'Location': '/loop'})
+        elif self.path == '/down':
+            self._send(503)
+        else:
+            self._send(404)
+
+    def log_message(self, *args):
+
+        pass
+
+
+@pytest.fixture
+def server():
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.hits = {}
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    yield httpd, f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_pages_in_url_order(server):
+
+    _, base = server
+    urls = [f'{base}/page/{i}' for i in range(20)]
+
+    pages = fetch.fetch_all(urls, max_workers=8, backoff=0)
+
+    assert list(pages) == urls
+    assert pages[urls[7]] == b'page 7'
+
+
+def test_gzip(server):
+
+    _, base = server
+
+    assert fetch.fetch_all([f'{base}/gzip'], backoff=0) == {f'{base}/gzip': b'compressed page'}
+
+
+def test_retry_on_503(server):
+
+    httpd, base = server
+
+    assert fetch.fetch_all([f'{base}/flaky'], backoff=0, retries=3)[f'{base}/flaky'] == b'flaky page'
+    assert httpd.hits['/flaky'] == 3
+
+
+def test_redirects(server):
+
+    _, base = server
+
+    assert fetch.fetch_all([f'{base}/redirect'], backoff=0)[f'{base}/redirect'] == b'page target'
+
+    with pytest.raises(fetch.FetchError, match='redirected more than 2 times'):
+        fetch.Session(max_redirects=2, backoff=0).get(f'{base}/loop')
+
+
+def test_failed_urls_together(server):
+
+    httpd, base = server
+    urls = [f'{base}/page/1', f'{base}/down', f'{base}/missing', f'{base}/page/2']
+    arrived = {}
+
+    with pytest.raises(fetch.FetchError) as error:
+        fetch.fetch_all(urls, backoff=0, retries=1, on_page=arrived.__setitem__)
+
+    assert set(error.value.failed) == {f'{base}/down', f'{base}/missing'}
+    assert error.value.pages == {f'{base}/page/1': b'page 1', f'{base}/page/2': b'page 2'}
+    assert arrived == error.value.pages
+    assert '2 of 4 pages could not be fetched' in str(error.value)
+    assert httpd.hits['/down'] == 2 # retried
+    assert httpd.hits['/missing'] == 1 # not retried
+
+
+def test_prefetch_records_pages_before_failure(server, tmp_path):
+
+    _, base = server
+    archive_dir = str(tmp_path / 'archive')
+
+    with pytest.raises(fetch.FetchError):
+        fetch.prefetch([f'{base}/page/1', f'{base}/down'], archive_dir, 'replay', backoff=0, retries=0)
+
+    assert archive.lookup(f'{base}/page/1', archive_dir) == b'page 1'
+    assert archive.lookup(f'{base}/down', archive_dir) is None
@@ -0,0 +1,68 @@
+# poll-by-poll ingestion of canelection/polls.py on the bilingual header of the Elections Canada files
+#
+#   python -m pytest tests
+
+import csv
+
+from canelection import polls
+
+HEADER = [
+    'Electoral District Number/Numéro de circonscription',
+    'Electoral District Name_English/Nom de circonscription_Anglais',
+    'Electoral District Name_French/Nom de circonscription_Français',
+    'Polling Station Number/Numéro du bureau de scrutin',
+    'Polling Station Name/Nom du bureau de scrutin',
+    'Void Poll Indicator/Indicateur de bureau supprimé',
+    'No Poll Held Indicator/Indicateur de bureau sans scrutin',
+    'Merge With/Fusionné avec',
+    'Rejected Ballots for Polling Station/Bulletins rejetés du bureau',
+    'Electors for Polling Station/Électeurs du bureau',
+    "Candidate's Family Name/Nom de famille du candidat",
+    "Candidate's Middle Name/Second prénom du candidat",
+    "Candidate's First Name/Prénom du candidat",
+    'Political Affiliation Name_English/Appartenance politique_Anglais',
+    'Political Affiliation Name_French/Appartenance politique_Français',
+    'Incumbent Indicator/Indicateur_Candidat sortant',
+    'Elected Candidate Indicator/Indicateur du candidat élu',
+    'Candidate Poll Votes Count/Votes du candidat pour le bureau',
+]
+
+CANDIDATES = [
+    ('Liberal', 'Libéral'),
+    ('Conservative', 'Conservateur'),
+    ('NDP-New Democratic Party', 'NPD-Nouveau Parti démocratique'),
+    ('Green Party', 'Parti Vert'),
+]
+
+
+def _row(poll, electors, affiliation, votes):
+
+    return [
+        '10001', 'Avalon', 'Avalon', poll, f'Poll {poll}', 'N', 'N', '', '0', electors,
+        'Doe', '', 'Jane', affiliation[0], affiliation[1], 'N', 'N', votes,
+    ]
+
+
+def test_bilingual_header(tmp_path):
+
+    path = tmp_path / 'pollresults_resultatsbureau10001.csv'
+
+    with open(path, 'w', newline='', encoding='latin-1') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for poll, electors in [('1', '400'), ('2', '300')]:
+            for affiliation, votes in zip(CANDIDATES, ['50', '40', '30', '20']):
+                writer.writerow(_row(poll, electors, affiliation, votes))
+
+    result = polls.read_poll_file(str(path), chunksize=3) # polls split between chunks
+
+    assert result['District'].tolist() == [10001, 10001]
+    assert result['Poll'].tolist() == ['1', '2']
+    assert result[polls.PARTIES].iloc[0].tolist() == [50, 40, 30, 0, 20]
+    assert result['Electors'].tolist() == [400, 300]
+    assert result['Total Votes'].tolist() == [140, 140]
+
+    summary = polls.summarize(result)
+
+    assert summary.loc[0, 'Total Voters'] == 700
+    assert summary.loc[0, 'Total Votes'] == 280
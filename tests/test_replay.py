@@ -0,0 +1,60 @@
+# part 1 offline: an archive seeded from fixture pages (tests/fixtures/pages) replayed through pipeline.run_year
+#
+#   python -m pytest tests
+
+import os
+
+import pytest
+
+from canelection import archive, pipeline, ridings, stagecache
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+
+ELECTION = {
+    'table12': 'https://fixtures.invalid/2011/table12.html',
+    'table11': 'https://fixtures.invalid/2011/table11.html',
+}
+
+NAMES = {
+    10001: 'Avalon',
+    10002: 'Bonavista--Gander--Grand Falls--Windsor',
+    24001: 'Abitibi--Témiscamingue',
+}
+
+
+@pytest.fixture
+def seeded(tmp_path):
+
+    archive_settings, cache_settings = archive.configure(), stagecache.configure()
+    archive_dir = str(tmp_path / 'archive')
+    archive.import_fixtures(FIXTURES, archive_dir=archive_dir)
+
+    yield archive_dir
+
+    archive.configure(**archive_settings)
+    stagecache.configure(**cache_settings)
+
+
+def test_run_year_offline(seeded, tmp_path):
+
+    data, resolved = pipeline.run_year(
+        ELECTION,
+        ridings.RidingIndex(NAMES),
+        settings={'archive_dir': seeded, 'mode': 'offline'},
+        cache_settings={'directory': str(tmp_path / 'cache'), 'enabled': True},
+    )
+
+    assert data['District'].tolist() == [10001, 10002, 24001]
+    assert data['Province'].tolist() == ['NL', 'NL', 'QC']
+    assert data['Elected'].tolist() == ['Liberal', 'Liberal', 'NDP']
+    assert data.loc[0, ['Liberal', 'Conservative', 'NDP', 'BQ', 'Others']].tolist() == [16008, 14749, 5157, 0, 494]
+    assert data.loc[2, 'BQ'] == 15696
+    assert data['Total Voters'].tolist() == [64412, 72032, 84720]
+    assert data['Total Votes'].tolist() == [36408, 31122, 43973]
+    assert resolved['District'].notna().all()
+
+
+def test_offline_missing_page(seeded):
+
+    with pytest.raises(LookupError, match='offline mode'):
+        archive.get_page('https://fixtures.invalid/2011/missing.html', seeded, 'offline')
@@ -0,0 +1,64 @@
+# stage cache of canelection/stagecache.py: damaged entries & eviction of entries removed meanwhile
+#
+#   python -m pytest tests
+
+import os
+
+import pytest
+
+from canelection import stagecache
+
+
+def _square(x):
+
+    return x * x
+
+
+@pytest.fixture
+def cache(tmp_path):
+
+    previous = stagecache.configure()
+    stagecache.configure(directory=str(tmp_path / 'cache'), max_bytes=2 ** 20, enabled=True)
+    yield str(tmp_path / 'cache')
+    stagecache.configure(**previous)
+
+
+def _entries(directory):
+
+    return [os.path.join(root, name) for root, _, files in os.walk(directory) for name in files if name.endswith('.pkl')]
+
+
+def test_truncated_entry_is_a_miss(cache):
+
+    assert stagecache.run('square', _square, 3) == 9
+    (path,) = _entries(cache)
+
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    assert stagecache.run('square', _square, 3) == 9
+
+    with open(path, 'wb') as f:
+        f.write(b'not a pickle')
+
+    assert stagecache.run('square', _square, 3) == 9
+
+
+def test_evict_skips_removed_entries(cache, monkeypatch):
+
+    for x in range(3):
+        stagecache.run('square', _square, x)
+
+    removed = [_entries(cache)[0]]
+    stat = os.stat
+
+    # an entry removed by another process between the walk & the stat
+    def racy_stat(path, *args, **kwargs):
+        if path in removed:
+            os.remove(removed.pop())
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', racy_stat)
+
+    assert stagecache.evict(0) == 0
+    assert _entries(cache) == []
@@ -0,0 +1,46 @@
+# seat allocation of canelection/systems.py: exactly n seats are allocated, ties included
+#
+#   python -m pytest tests
+
+import numpy as np
+import pytest
+
+from canelection import systems
+
+
+@pytest.mark.parametrize('method', list(systems.DIVISORS))
+def test_allocate_ties(method):
+
+    seats = systems.allocate([[10, 10, 0]], [3], method)
+
+    assert seats.sum(axis=-1).tolist() == [3]
+    assert sorted(seats[0].tolist()) == [0, 1, 2]
+
+
+def test_allocate_tie_to_more_votes():
+
+    # D'Hondt quotients 10, 5, 3.3 & 5, 2.5: the tied third seat goes to the party with more votes
+    assert systems.allocate([[10, 5, 0]], [3]).tolist() == [[2, 1, 0]]
+    assert systems.allocate([[5, 10, 0]], [3]).tolist() == [[1, 2, 0]]
+
+
+@pytest.mark.parametrize('method', list(systems.DIVISORS))
+def test_allocate_exact_seats(method):
+
+    rng = np.random.default_rng(2011)
+    votes = rng.integers(1, 20, (200, 5)) * 1000 # coarse counts, many equal quotients
+    n_seats = rng.integers(0, 40, 200)
+    initial = rng.integers(0, 3, (200, 5))
+
+    seats = systems.allocate(votes, n_seats, method, initial=initial)
+
+    assert (seats.sum(axis=-1) == n_seats).all()
+    assert (seats >= 0).all()
+
+
+def test_allocate_no_votes():
+
+    with pytest.warns(UserWarning, match='3 seats left unallocated'):
+        seats = systems.allocate([[0, 0, 0]], [3])
+
+    assert seats.tolist() == [[0, 0, 0]]